@@ -56,9 +56,23 @@ class Error(Exception):
     pass
 
 
+def __getattr__(name):
+    """Import submodules such as pisi.api when they are first used.
+
+    pisi.api pulls in the databases and package operations, importing it
+    only when needed keeps the startup of simple commands fast."""
+    if name.startswith("__"):
+        raise AttributeError(name)
+    try:
+        return importlib.import_module("pisi." + name)
+    except ModuleNotFoundError as e:
+        if e.name != "pisi." + name:
+            raise
+        raise AttributeError("module 'pisi' has no attribute '%s'" % name)
+
+
 # Keep these imports here, not on top of the file!
 # It's a circular dependency otherwise.
-import pisi.api
 import pisi.config
 from pisi import context as ctx
 
@@ -82,9 +96,16 @@ def _cleanup():
         ctx.loghandler.flush()
         ctx.log.removeHandler(ctx.loghandler)
 
-    filesdb = pisi.db.filesdb.FilesDB()
-    if filesdb.is_initialized():
-        filesdb.close()
+    # The databases are not opened if their modules were never imported
+    if "pisi.db.filesdb" in sys.modules:
+        filesdb = pisi.db.filesdb.FilesDB()
+        if filesdb.is_initialized():
+            filesdb.close()
+
+    if "pisi.db.historydb" in sys.modules:
+        historydb = pisi.db.historydb.HistoryDB()
+        if historydb.is_initialized():
+            historydb.close()
 
     if ctx.build_leftover and os.path.exists(ctx.build_leftover):
         os.unlink(ctx.build_leftover)
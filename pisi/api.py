@@ -3,6 +3,7 @@
 
 import os
 import fcntl
+import glob
 import re
 from . import fetcher
 
@@ -32,7 +33,6 @@ import pisi.operations.install
 import pisi.operations.history
 import pisi.operations.helper
 import pisi.operations.check
-import pisi.operations.build
 import pisi.errors
 
 
@@ -68,6 +68,10 @@ def locked(func):
             pisi.db.update_caches()
             return ret
         finally:
+            # Write the history of the operation, even a failed one
+            historydb = pisi.db.historydb.HistoryDB()
+            if historydb.is_initialized():
+                historydb.close()
             ctx.locked = False
             lock.close()
 
@@ -413,8 +417,8 @@ def fetch(packages=[], path=os.path.curdir):
         ctx.ui.info(_("%s package found in %s repository") % (package.name, repo))
         uri = pisi.uri.URI(package.packageURI)
         output = os.path.join(path, uri.path())
-        if os.path.exists(output) and package.packageHash == pisi.util.sha1_file(
-            output
+        if os.path.exists(output) and (
+            package.packageHash == pisi.util.cached_sha1_file(output)
         ):
             ctx.ui.warning(_("%s package already fetched") % uri.path())
             continue
@@ -796,19 +800,42 @@ def info_name(package_name, useinstalldb=False):
     return metadata, files, repo
 
 
-def index(dirs=None, output="eopkg-index.xml", skip_signing=False, compression=0):
-    """Accumulate eopkg XML files in a directory, and write an index."""
+def index(
+    dirs=None, output="eopkg-index.xml", skip_signing=False, compression=0, delta=False
+):
+    """Accumulate eopkg XML files in a directory, and write an index.
+
+    With delta, a delta from the previous index at output to the new one
+    is written next to it."""
     index = pisi.index.Index()
     index.distribution = None
     if not dirs:
         dirs = ["."]
-    for repo_dir in dirs:
-        repo_dir = str(repo_dir)
-        ctx.ui.info(_("Building index of eopkg files under %s") % repo_dir)
-        index.index(repo_dir)
+
+    previous = None
+    if delta and os.path.exists(output):
+        previous = output + ".previous"
+        os.rename(output, previous)
 
     sign = None if skip_signing else pisi.file.File.detached
-    index.write(output, sha1sum=True, compress=compression, sign=sign)
+    try:
+        index.write_index(
+            [str(x) for x in dirs], output, sha1sum=True, compress=compression, sign=sign
+        )
+    except:
+        if previous:
+            os.rename(previous, output)
+        raise
+
+    if previous:
+        # Deltas to the replaced index are of no use anymore
+        for stale in glob.glob(pisi.index.delta_uri(glob.escape(output), "*")):
+            os.unlink(stale)
+
+        delta_file = pisi.index.delta_uri(output, pisi.util.sha1_file(previous))
+        pisi.index.make_delta(previous, output, delta_file)
+        os.unlink(previous)
+        ctx.ui.info(_("Index delta written: %s") % delta_file)
     ctx.ui.info(_("Index file written"))
 
 
@@ -853,13 +880,14 @@ def remove_repo(name):
 @locked
 def update_repos(repos, force=False):
     pisi.db.historydb.HistoryDB().create_history("repoupdate")
-    updated = False
+    updated = []
     try:
         for repo in repos:
-            updated |= __update_repo(repo, force)
+            if __update_repo(repo, force):
+                updated.append(repo)
     finally:
         if updated:
-            pisi.db.regenerate_caches()
+            pisi.db.update_repo_caches(updated)
 
 
 @locked
@@ -867,7 +895,7 @@ def update_repo(repo, force=False):
     pisi.db.historydb.HistoryDB().create_history("repoupdate")
     updated = __update_repo(repo, force)
     if updated:
-        pisi.db.regenerate_caches()
+        pisi.db.update_repo_caches([repo])
 
 
 def __update_repo(repo, force=False):
@@ -900,30 +928,20 @@ def __update_repo(repo, force=False):
 @locked
 def rebuild_db(files=False):
     filesdb = pisi.db.filesdb.FilesDB()
-    installdb = pisi.db.installdb.InstallDB()
-
-    def rebuild_filesdb():
-        for pkg in list_installed():
-            ctx.ui.info(_("Adding '%s' to db... ") % pkg, noln=True)
-            files = installdb.get_files(pkg)
-            filesdb.add_files(pkg, files)
-            ctx.ui.info(_("OK."))
 
     # save parameters and shutdown pisi
     options = ctx.config.options
     ui = ctx.ui
     pisi._cleanup()
 
-    filesdb.close()
     filesdb.destroy()
-    filesdb.init()
 
     # reinitialize everything
     set_userinterface(ui)
     set_options(options)
 
     # construct new database
-    rebuild_filesdb()
+    filesdb.generate()
 
 
 ############# FIXME: this was a quick fix. ##############################
@@ -947,6 +965,9 @@ def reorder_base_packages(*args, **kw):
 
 
 def build_until(*args, **kw):
+    # wrapper for build op
+    import pisi.operations.build
+
     return pisi.operations.build.build_until(*args, **kw)
 
 
@@ -11,6 +11,7 @@ import shutil
 import tarfile
 import zipfile
 import lzma
+import struct
 
 from pisi import translate as _
 
@@ -18,6 +19,7 @@ from pisi import translate as _
 import pisi
 import pisi.util as util
 import pisi.context as ctx
+import pisi.xz
 
 
 class UnknownArchiveType(Exception):
@@ -58,10 +60,17 @@ class _LZMAProxy(object):
             raw = self.fileobj.read(self.blocksize)
             if not raw:
                 break
-            try:
-                data = self.lzmaobj.decompress(raw)
-            except EOFError:
-                break
+            data = b""
+            while raw:
+                if self.lzmaobj.eof:
+                    # Concatenated xz streams, with optional stream padding
+                    # between them
+                    raw = raw.lstrip(b"\0")
+                    if not raw:
+                        break
+                    self.lzmaobj = lzma.LZMADecompressor()
+                data += self.lzmaobj.decompress(raw)
+                raw = self.lzmaobj.unused_data if self.lzmaobj.eof else b""
             b.append(data)
             x += len(data)
         self.buf = b"".join(
@@ -254,18 +263,45 @@ class ArchiveTar(ArchiveBase):
         no_same_permissions=True,
         no_same_owner=True,
         fileobj=None,
+        stored_in=None,
     ):
         super(ArchiveTar, self).__init__(file_path, arch_type)
         self.tar = None
         self.no_same_permissions = no_same_permissions
         self.no_same_owner = no_same_owner
         self.fileobj = fileobj
+        # (path, offset, size) of the data of fileobj in another file
+        self.stored_in = stored_in
 
     def unpack(self, target_dir, clean_dir=False):
         """Unpack tar archive to a given target directory(target_dir)."""
         super(ArchiveTar, self).unpack(target_dir, clean_dir)
         self.unpack_dir(target_dir)
 
+    def open_parallel_xz(self):
+        """Open a tar.xz made of several xz streams to read them in parallel"""
+        count = pisi.xz.threads(ctx.config.values.general.decompression_threads)
+        if count == 1:
+            return None
+
+        if self.fileobj is None:
+            path, offset, size = self.file_path, 0, os.path.getsize(self.file_path)
+        elif self.stored_in:
+            path, offset, size = self.stored_in
+        else:
+            return None
+
+        f = open(path, "rb")
+        streams = pisi.xz.streams(f, offset, size)
+        if not streams or len(streams) == 1:
+            f.close()
+            return None
+
+        reader = pisi.xz.Reader(f, streams, min(count, len(streams)))
+        tar = TarFile.taropen(self.file_path, "r", reader)
+        tar._extfileobj = False
+        return tar
+
     def maybe_nuke_pip(self, info):
         if not info.name.endswith(".egg-info"):
             return
@@ -289,7 +325,11 @@ class ArchiveTar(ArchiveBase):
             rmode = "r:gz"
         elif self.type == "tarbz2":
             rmode = "r:bz2"
-        elif self.type in ("tarlzma", "tarxz"):
+        elif self.type == "tarxz":
+            self.tar = self.open_parallel_xz() or TarFile.lzmaopen(
+                self.file_path, fileobj=self.fileobj
+            )
+        elif self.type == "tarlzma":
             self.tar = TarFile.lzmaopen(self.file_path, fileobj=self.fileobj)
         else:
             raise UnknownArchiveType
@@ -462,13 +502,23 @@ class ArchiveTar(ArchiveBase):
             elif self.type in ("tarlzma", "tarxz"):
                 format = "xz" if self.type == "tarxz" else "alone"
                 level = int(ctx.config.values.build.compressionlevel)
-                self.tar = TarFile.lzmaopen(
-                    self.file_path,
-                    "w",
-                    fileobj=self.fileobj,
-                    compressformat=format,
-                    compresslevel=level,
-                )
+                count = ctx.get_option("compression_threads")
+                if count is None:
+                    count = ctx.config.values.build.compressionthreads
+                count = pisi.xz.threads(count)
+
+                if self.type == "tarxz" and self.fileobj is None and count > 1:
+                    writer = pisi.xz.Writer(self.file_path, level, count)
+                    self.tar = TarFile.taropen(self.file_path, "w", writer)
+                    self.tar._extfileobj = False
+                else:
+                    self.tar = TarFile.lzmaopen(
+                        self.file_path,
+                        "w",
+                        fileobj=self.fileobj,
+                        compressformat=format,
+                        compresslevel=level,
+                    )
             else:
                 raise UnknownArchiveType
 
@@ -640,6 +690,21 @@ class ArchiveZip(ArchiveBase):
         self.add_to_archive(file_name)
         os.chdir(cwd)
 
+    def stored_range(self, file_path):
+        """Return the (offset, size) of the data of an uncompressed member
+        in the zip file, None if the member is compressed"""
+        info = self.zip_obj.getinfo(file_path)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+
+        with open(self.file_path, "rb") as f:
+            header = os.pread(f.fileno(), 30, info.header_offset)
+        if header[:4] != b"PK\x03\x04":
+            return None
+
+        name_size, extra_size = struct.unpack("<HH", header[26:30])
+        return info.header_offset + 30 + name_size + extra_size, info.compress_size
+
     def has_file(self, file_path):
         """Returns true if file_path is member of the zip archive"""
         return file_path in self.zip_obj.namelist()
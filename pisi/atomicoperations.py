@@ -17,7 +17,7 @@ import pisi.files
 import pisi.uri
 import pisi.ui
 import pisi.version
-import pisi.operations.delta
+import pisi.operations.download
 import pisi.db
 import base64
 
@@ -72,58 +72,26 @@ class Install(AtomicOperation):
         # find package in repository
         repo = packagedb.which_repo(name)
         if repo:
-            repodb = pisi.db.repodb.RepoDB()
             ctx.ui.info(_("Package %s found in repository %s") % (name, repo))
 
-            repo = repodb.get_repo(repo)
-            pkg = packagedb.get_package(name)
-            delta = None
-
-            installdb = pisi.db.installdb.InstallDB()
-            # Package is installed. This is an upgrade. Check delta.
-            if installdb.has_package(pkg.name):
-                (
-                    version,
-                    release,
-                    build,
-                    distro,
-                    distro_release,
-                ) = installdb.get_version_and_distro_release(pkg.name)
-                if distro_release == pkg.distributionRelease:
-                    delta = pkg.get_delta(release)
-
-            ignore_delta = ctx.config.values.general.ignore_delta
-
-            # If delta exists than use the delta uri.
-            if delta and not ignore_delta:
-                pkg_uri = delta.packageURI
-                pkg_hash = delta.packageHash
-            else:
-                pkg_uri = pkg.packageURI
-                pkg_hash = pkg.packageHash
-
-            uri = pisi.uri.URI(pkg_uri)
-            if uri.is_absolute_path():
-                pkg_path = str(pkg_uri)
-            else:
-                pkg_path = os.path.join(
-                    os.path.dirname(repo.indexuri.get_uri()), str(uri.path())
-                )
+            pkg_path, pkg_hash, pkg_size = pisi.operations.download.package_source(
+                name
+            )
 
             ctx.ui.info(_("Package URI: %s") % pkg_path, verbose=True)
 
             # Bug 4113
-            cached_file = pisi.package.Package.is_cached(pkg_path)
-            if cached_file and util.sha1_file(cached_file) != pkg_hash:
-                os.unlink(cached_file)
-                cached_file = None
+            cached_file = pisi.package.Package.is_cached(pkg_path, pkg_hash)
+            stale_file = not cached_file and pisi.package.Package.is_cached(pkg_path)
+            if stale_file:
+                os.unlink(stale_file)
 
             install_op = Install(pkg_path, ignore_dep)
 
             # Bug 4113
             if not cached_file:
                 downloaded_file = install_op.package.filepath
-                if pisi.util.sha1_file(downloaded_file) != pkg_hash:
+                if pisi.util.cached_sha1_file(downloaded_file) != pkg_hash:
                     raise pisi.Error(
                         _(
                             "Download Error: Package does not match the repository package."
@@ -315,6 +283,7 @@ class Install(AtomicOperation):
 
     def extract_install(self):
         "unzip package in place"
+        import pisi.operations.delta
 
         ctx.ui.notify(pisi.ui.extracting, package=self.pkginfo, files=self.files)
 
@@ -0,0 +1,201 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Cache of built packages, keyed by a hash of the build inputs.
+
+The key covers the pspec.xml, actions.py, the files and comar directories
+of the package, the hashes of the source archives, the build settings and
+the installed releases of the build dependencies. Building a package again
+with the same inputs restores the packages of the previous build from the
+cache directory instead of running the build. The least recently used
+builds are removed when the cache grows past its size limit."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from pisi import translate as _
+
+import pisi
+import pisi.context as ctx
+import pisi.util as util
+
+# Build settings not changing the built packages
+ignored_settings = ("buildcache", "buildcachelimit", "jobs")
+
+# Command line options changing the built packages
+build_options = ("create_static", "package_format", "compression_threads")
+
+
+def enabled():
+    return ctx.config.values.build.buildcache is True and not ctx.get_option(
+        "no_build_cache"
+    )
+
+
+def __hash_tree(m, top):
+    for root, dirs, files in os.walk(top):
+        dirs.sort()
+        for name in sorted(files):
+            path = util.join_path(root, name)
+            m.update(("%s\0" % util.removepathprefix(top, path)).encode())
+            if os.path.islink(path):
+                m.update(os.readlink(path).encode())
+            else:
+                m.update(util.sha1_file(path).encode())
+            m.update(b"\0")
+
+
+def build_key(builder):
+    """Return the cache key of the build of a Builder, None if not cached.
+
+    Build dependencies have to be installed already, as the key covers
+    their installed releases."""
+    if not enabled() or builder.specuri.is_remote_file():
+        return None
+
+    m = hashlib.sha1()
+
+    def add(*values):
+        m.update(repr(values).encode())
+        m.update(b"\n")
+
+    add("pisi", pisi.__version__)
+
+    for name in (ctx.const.pspec_file, ctx.const.actions_file):
+        path = util.join_path(builder.specdir, name)
+        add(name, util.sha1_file(path) if os.path.exists(path) else None)
+
+    for name in (ctx.const.files_dir, ctx.const.comar_dir):
+        add(name)
+        __hash_tree(m, util.join_path(builder.specdir, name))
+
+    for archive in builder.spec.source.archive:
+        add("archive", archive.uri, archive.sha1sum)
+
+    general = ctx.config.values.general
+    add(
+        "distribution",
+        general.architecture,
+        general.distribution,
+        general.distribution_release,
+        general.distribution_id,
+    )
+
+    for name, value in sorted(ctx.config.values.build.items):
+        if name not in ignored_settings:
+            add("setting", name, value)
+
+    for name in build_options:
+        add("option", name, ctx.get_option(name))
+
+    deps = set(x.package for x in builder.spec.source.buildDependencies)
+    for package in builder.spec.packages:
+        deps.update(x.package for x in package.buildDependencies)
+    for name in sorted(deps):
+        if builder.installdb.has_package(name):
+            record = builder.installdb.get_package_record(name)
+            add("dependency", name, record.version, record.release)
+        else:
+            add("dependency", name, None, None)
+
+    return m.hexdigest()
+
+
+def __entries(cache_dir):
+    """Return the (atime, size, path) of the builds in the cache"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = util.join_path(cache_dir, name)
+        if len(name) != 40 or not os.path.isdir(path):
+            continue
+        size = 0
+        for root, dirs, files in os.walk(path):
+            size += sum(os.path.getsize(util.join_path(root, x)) for x in files)
+        entries.append((os.stat(path).st_mtime, size, path))
+    return entries
+
+
+def evict(limit=None):
+    """Remove the least recently used builds past the cache size limit"""
+    if limit is None:
+        limit = int(ctx.config.values.build.buildcachelimit or 0) * 1024 * 1024
+    cache_dir = ctx.config.build_cache_dir()
+    if not limit or not os.path.isdir(cache_dir):
+        return
+
+    entries = sorted(__entries(cache_dir), reverse=True)
+    total = 0
+    for mtime, size, path in entries:
+        total += size
+        if total > limit:
+            ctx.ui.debug("Removing cached build %s" % os.path.basename(path))
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def restore(builder, key):
+    """Copy the packages of a cached build to the output directory.
+
+    Return True if the build was found in the cache."""
+    entry = util.join_path(ctx.config.build_cache_dir(), key)
+    if not os.path.isdir(entry):
+        return False
+
+    outdir = ctx.get_option("output_dir")
+    restored = {}
+    for kind in ("packages", "debug"):
+        restored[kind] = []
+        kind_dir = util.join_path(entry, kind)
+        if not os.path.isdir(kind_dir):
+            continue
+        for name in sorted(os.listdir(kind_dir)):
+            dest = os.path.normpath(util.join_path(outdir, name) if outdir else name)
+            shutil.copyfile(util.join_path(kind_dir, name), dest)
+            restored[kind].append(dest)
+
+    # The entry time orders the builds for eviction
+    os.utime(entry)
+
+    ctx.ui.info(_("Restored %s from the build cache") % builder.spec.source.name)
+    for name in restored["packages"] + restored["debug"]:
+        ctx.ui.info(_("Creating %s...") % name)
+        builder.delta_map[name] = []
+    builder.new_packages = restored["packages"]
+    builder.new_debug_packages = restored["debug"]
+    return True
+
+
+def store(builder, key):
+    """Save the packages of a finished build in the cache"""
+    cache_dir = ctx.config.build_cache_dir()
+    entry = util.join_path(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+
+    try:
+        util.ensure_dirs(cache_dir)
+        tmp = tempfile.mkdtemp(prefix=".%s" % key, dir=cache_dir)
+    except OSError as e:
+        ctx.ui.warning(_("Unable to use the build cache: %s") % e)
+        return
+
+    try:
+        for kind, packages in (
+            ("packages", builder.new_packages),
+            ("debug", builder.new_debug_packages),
+        ):
+            kind_dir = util.join_path(tmp, kind)
+            os.mkdir(kind_dir)
+            for path in packages:
+                shutil.copyfile(path, util.join_path(kind_dir, os.path.basename(path)))
+        os.rename(tmp, entry)
+    except OSError as e:
+        # Another build of the same inputs may have finished first
+        if not os.path.isdir(entry):
+            ctx.ui.warning(_("Unable to save the build in the cache: %s") % e)
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    ctx.ui.info(_("Saved %s in the build cache") % builder.spec.source.name)
+    evict()
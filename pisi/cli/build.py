@@ -104,6 +104,24 @@ class Build(command.Command, metaclass=command.autocommand):
             ),
         )
 
+        group.add_option(
+            "--compression-threads",
+            action="store",
+            type="int",
+            default=None,
+            help=_(
+                "Compress the install archive in blocks with this many "
+                "threads, 0 for one per CPU"
+            ),
+        )
+
+        group.add_option(
+            "--no-build-cache",
+            action="store_true",
+            default=False,
+            help=_("Build the package even if the build cache has it"),
+        )
+
         group.add_option(
             "--use-quilt",
             action="store_true",
@@ -1,15 +1,54 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import importlib
 import optparse
 import os
 import sys
 
-import pisi.api
+import pisi
 from pisi import context as ctx
 from pisi import translate as _
 
 
+# Names of the commands and the modules defining them, which are only
+# imported when their commands are used
+commands = (
+    (("add-repo", "ar"), "addrepo"),
+    (("autoremove", "rmf"), "autoremove"),
+    (("blame", "bl"), "blame"),
+    (("build", "bi"), "build"),
+    (("check", None), "check"),
+    (("clean", None), "clean"),
+    (("configure-pending", "cp"), "configurepending"),
+    (("delete-cache", "dc"), "deletecache"),
+    (("delta", "dt"), "delta"),
+    (("disable-repo", "dr"), "disablerepo"),
+    (("enable-repo", "er"), "enablerepo"),
+    (("fetch", "fc"), "fetch"),
+    (("help", "?"), "help"),
+    (("history", "hs"), "history"),
+    (("index", "ix"), "index"),
+    (("info", None), "info"),
+    (("install", "it"), "install"),
+    (("list-available", "la"), "listavailable"),
+    (("list-components", "lc"), "listcomponents"),
+    (("list-installed", "li"), "listinstalled"),
+    (("list-newest", "ln"), "listnewest"),
+    (("list-pending", "lp"), "listpending"),
+    (("list-repo", "lr"), "listrepo"),
+    (("list-upgrades", "lu"), "listupgrades"),
+    (("rebuild-db", "rdb"), "rebuilddb"),
+    (("remove", "rm"), "remove"),
+    (("remove-orphans", "rmo"), "removeorphans"),
+    (("remove-repo", "rr"), "removerepo"),
+    (("search", "sr"), "search"),
+    (("search-file", "sf"), "searchfile"),
+    (("update-repo", "ur"), "updaterepo"),
+    (("upgrade", "up"), "upgrade"),
+)
+
+
 class autocommand(type):
     def __init__(cls, name, bases, dict):
         super(autocommand, cls).__init__(name, bases, dict)
@@ -38,8 +77,24 @@ class Command(object):
     cmd = []
     cmd_dict = {}
 
+    @staticmethod
+    def load_command(cmd):
+        """Import the module defining a command if it is not loaded yet"""
+        if cmd in Command.cmd_dict:
+            return
+        for names, module in commands:
+            if cmd in names:
+                importlib.import_module("pisi.cli." + module)
+                return
+
+    @staticmethod
+    def load_commands():
+        for names, module in commands:
+            importlib.import_module("pisi.cli." + module)
+
     @staticmethod
     def commands_string():
+        Command.load_commands()
         s = ""
         l = [x.name[0] for x in Command.cmd]
         l.sort()
@@ -54,6 +109,7 @@ class Command(object):
 
     @staticmethod
     def get_command(cmd, fail=False, args=None):
+        Command.load_command(cmd)
         if cmd in Command.cmd_dict:
             return Command.cmd_dict[cmd](args)
 
@@ -191,6 +247,7 @@ class Command(object):
 
     def init(self, database=True, write=True):
         """initialize eopkg components"""
+        import pisi.api
 
         if self.options:
             ui = pisi.cli.CLI(self.options.debug, self.options.verbose)
@@ -59,6 +59,13 @@ class Index(command.Command, metaclass=command.autocommand):
             help=_("Comma-separated compression types " "for index file"),
         )
 
+        group.add_option(
+            "--delta",
+            action="store_true",
+            default=False,
+            help=_("Write a delta from the previous index to the new one."),
+        )
+
         group.add_option(
             "--skip-signing",
             action="store_true",
@@ -84,4 +91,5 @@ class Index(command.Command, metaclass=command.autocommand):
             ctx.get_option("output"),
             skip_signing=ctx.get_option("skip_signing"),
             compression=compression,
+            delta=ctx.get_option("delta"),
         )
@@ -6,39 +6,7 @@ import sys
 
 import pisi
 import pisi.cli
-import pisi.cli.addrepo
-import pisi.cli.autoremove
-import pisi.cli.blame
-import pisi.cli.build
-import pisi.cli.check
-import pisi.cli.clean
 import pisi.cli.command as command
-import pisi.cli.configurepending
-import pisi.cli.deletecache
-import pisi.cli.delta
-import pisi.cli.disablerepo
-import pisi.cli.enablerepo
-import pisi.cli.fetch
-import pisi.cli.help
-import pisi.cli.history
-import pisi.cli.index
-import pisi.cli.info
-import pisi.cli.install
-import pisi.cli.listavailable
-import pisi.cli.listcomponents
-import pisi.cli.listinstalled
-import pisi.cli.listnewest
-import pisi.cli.listpending
-import pisi.cli.listrepo
-import pisi.cli.listupgrades
-import pisi.cli.rebuilddb
-import pisi.cli.remove
-import pisi.cli.removeorphans
-import pisi.cli.removerepo
-import pisi.cli.search
-import pisi.cli.searchfile
-import pisi.cli.updaterepo
-import pisi.cli.upgrade
 from pisi import translate as _
 
 
@@ -50,9 +18,7 @@ class PreParser(optparse.OptionParser):
     """consumes any options, and finds arguments from command line"""
 
     def __init__(self, version):
-        optparse.OptionParser.__init__(
-            self, usage=pisi.cli.help.usage_text, version=version
-        )
+        optparse.OptionParser.__init__(self, version=version)
 
     def error(self, msg):
         raise ParserError(msg)
@@ -124,6 +90,10 @@ class PisiCLI(object):
             raise pisi.cli.Error(_("Unrecognized command: %s") % cmd_name)
 
     def die(self):
+        # Listing the commands imports all of them
+        import pisi.cli.help
+
+        self.parser.set_usage(pisi.cli.help.usage_text)
         pisi.cli.printu("\n" + self.parser.format_help())
         sys.exit(1)
 
@@ -134,6 +134,9 @@ class Config(object, metaclass=pisi.util.Singleton):
     def debug_packages_dir(self):
         return self.subdir(self.values.dirs.debug_packages_dir)
 
+    def build_cache_dir(self):
+        return self.subdir(self.values.dirs.build_cache_dir)
+
     def index_dir(self):
         return self.subdir(self.values.dirs.index_dir)
 
@@ -12,6 +12,9 @@
 # destinationdirectory = /
 # autoclean = False
 # bandwidth_limit = 0
+# parallel_downloads = 4
+# mirror_connections = 2
+# decompression_threads = 0
 #
 # [build]
 # host = i686-pc-linux-gnu
@@ -24,6 +27,9 @@
 # RUSTFLAGS= -Cforce-frame-pointers
 # buildhelper = None / ccache / icecream
 # compressionlevel = 1
+# compressionthreads = 1
+# buildcache = False
+# buildcachelimit = 0
 # fallback = "ftp://ftp.pardus.org.tr/pub/source/2009"
 #
 # [directories]
@@ -33,6 +39,7 @@
 # archives_dir = /var/cache/eopkg/archives
 # cached_packages_dir = /var/cache/eopkg/packages
 # compiled_packages_dir = "/var/cache/eopkg/packages"
+# build_cache_dir = /var/cache/eopkg/build
 # index_dir = /var/cache/eopkg/index
 # packages_dir = /var/cache/eopkg/package
 # tmp_dir = /var/eopkg
@@ -69,6 +76,9 @@ class GeneralDefaults:
     package_cache_limit = 0
     bandwidth_limit = 0
     retry_attempts = 5
+    parallel_downloads = 4
+    mirror_connections = 2
+    decompression_threads = 0
     ignore_safety = False
     ignore_delta = False
 
@@ -87,6 +97,9 @@ class BuildDefaults:
     rustflags = "-Cforce-frame-pointers"
     buildhelper = "ccache"
     compressionlevel = 1
+    compressionthreads = 1
+    buildcache = False
+    buildcachelimit = 0
     fallback = "https://sources.getsol.us/"
     ignored_build_types = ""
 
@@ -102,6 +115,7 @@ class DirectoriesDefaults:
     cached_packages_dir = "/var/cache/eopkg/packages"
     compiled_packages_dir = "/var/cache/eopkg/packages"
     debug_packages_dir = "/var/cache/eopkg/packages-debug"
+    build_cache_dir = "/var/cache/eopkg/build"
     packages_dir = "/var/lib/eopkg/package"
     lock_dir = "/var/lock/subsys"
     index_dir = "/var/lib/eopkg/index"
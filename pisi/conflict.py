@@ -43,12 +43,14 @@ def package_conflicts(pkg, confs):
 
 
 def calculate_conflicts(order, packagedb):
+    installed = pisi.relation.installed_versions()
+
     # check conflicting packages in the installed system
     def check_installed(pkg, order):
         conflicts = []
 
         for conflict in pkg.conflicts:
-            if conflict.package not in order and installed_package_conflicts(conflict):
+            if conflict.package not in order and installed.satisfies(conflict):
                 conflicts.append(conflict)
 
         return conflicts
@@ -89,7 +89,12 @@ class Constants(metaclass=Singleton):
         self.__c.needs_restart = "needsrestart"
         self.__c.needs_reboot = "needsreboot"
         self.__c.auto_installed = "autoinstalled"
-        self.__c.files_db = "files4.db"
+        self.__c.files_db = "files5.idx"
+        self.__c.files_journal = "files5.journal"
+        self.__c.history_index = "history.idx"
+        self.__c.index_cache = "index-cache"
+        self.__c.index_delta_suffix = ".delta.xz"
+        self.__c.index_delta_state = "delta.sha1sum"
         self.__c.repos = "repos"
         self.__c.devel_package_end = "-devel"
         self.__c.doc_package_end = "-docs?$"
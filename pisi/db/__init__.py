@@ -36,6 +36,20 @@ def update_caches():
             db.cache_save()
 
 
+def update_repo_caches(repos):
+    # Patch the package cache with the changes of the updated repositories,
+    # components and groups are cheap enough to be regenerated
+    for db in [componentdb.ComponentDB(), groupdb.GroupDB()]:
+        db.invalidate()
+        db.cache_flush()
+
+    packagedb.PackageDB().invalidate()
+    packagedb.PackageDB().update_repos(repos)
+
+    for db in [componentdb.ComponentDB(), groupdb.GroupDB()]:
+        db.cache_regenerate()
+
+
 def regenerate_caches():
     flush_caches()
     # Force cache regeneration
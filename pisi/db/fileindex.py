@@ -0,0 +1,219 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Memory mapped file ownership index.
+
+The installed paths are kept sorted in a single NUL separated blob, with
+tables of path offsets, owning package numbers and the path numbers sorted
+by basename. Exact and prefix lookups bisect the offset table, basename
+lookups bisect the basename table and substring searches run a regular
+expression over the blob itself, only decoding the paths which matched.
+
+Layout, integers in native byte order as the index never leaves the host:
+
+    header    magic, format, path count and the offsets of the sections
+    blob      sorted paths, each one followed by a NUL byte
+    offsets   path count + 1 offsets into the blob
+    owners    package number of every path
+    basenames path numbers sorted by basename, then path
+    packages  NUL separated package names
+"""
+
+import array
+import mmap
+import os
+import re
+import struct
+
+import pisi
+import pisi.context as ctx
+from pisi import translate as _
+
+MAGIC = b"EOPKGFIL"
+FORMAT = 1
+
+_header = struct.Struct("=8sI4xQQQQQQ")
+
+
+class Error(pisi.Error):
+    pass
+
+
+def _basename(path):
+    return path[path.rfind(b"/") + 1 :]
+
+
+def _align(f):
+    pad = -f.tell() % 8
+    if pad:
+        f.write(b"\0" * pad)
+    return f.tell()
+
+
+def write(path, items):
+    """Write the given (path, package) pairs into a new index file"""
+
+    items = sorted((p.encode(), pkg) for p, pkg in items)
+
+    packages = {}
+    offsets = array.array("Q")
+    owners = array.array("I")
+
+    tmp = path + ctx.const.temporary_suffix
+    with open(tmp, "wb") as f:
+        f.write(_header.pack(MAGIC, FORMAT, 0, 0, 0, 0, 0, 0))
+
+        pos = 0
+        for p, pkg in items:
+            offsets.append(pos)
+            owners.append(packages.setdefault(pkg, len(packages)))
+            f.write(p + b"\0")
+            pos += len(p) + 1
+        offsets.append(pos)
+
+        names = sorted(range(len(items)), key=lambda i: _basename(items[i][0]))
+
+        offsets_pos = _align(f)
+        offsets.tofile(f)
+        owners_pos = _align(f)
+        owners.tofile(f)
+        basenames_pos = _align(f)
+        array.array("I", names).tofile(f)
+        packages_pos = f.tell()
+        f.write(b"\0".join(x.encode() for x in packages))
+        packages_len = f.tell() - packages_pos
+
+        f.seek(0)
+        f.write(
+            _header.pack(
+                MAGIC,
+                FORMAT,
+                len(items),
+                offsets_pos,
+                owners_pos,
+                basenames_pos,
+                packages_pos,
+                packages_len,
+            )
+        )
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(tmp, path)
+
+
+class FileIndex(object):
+    """Read-only mapping of installed paths to their packages"""
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+
+    def __open(self):
+        if self._map is not None:
+            return
+
+        try:
+            with open(self.path, "rb") as f:
+                _map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, ValueError) as e:
+            raise Error(_("Cannot open files index %s: %s") % (self.path, e))
+
+        try:
+            header = _header.unpack_from(_map, 0)
+        except struct.error:
+            header = (None, None)
+        if header[0] != MAGIC or header[1] != FORMAT:
+            _map.close()
+            raise Error(_("Files index %s is corrupt or outdated.") % self.path)
+
+        count, offsets, owners, basenames, packages, length = header[2:]
+        self._view = view = memoryview(_map)
+        self._count = count
+        self._offsets = view[offsets : offsets + 8 * (count + 1)].cast("Q")
+        self._owners = view[owners : owners + 4 * count].cast("I")
+        self._basenames = view[basenames : basenames + 4 * count].cast("I")
+        self._packages = [
+            x.decode() for x in _map[packages : packages + length].split(b"\0")
+        ]
+        self._map = _map
+
+    def close(self):
+        if self._map is not None:
+            for view in (self._offsets, self._owners, self._basenames, self._view):
+                view.release()
+            self._map.close()
+            self._map = None
+
+    def __path(self, i):
+        start = _header.size + self._offsets[i]
+        return self._map[start : _header.size + self._offsets[i + 1] - 1]
+
+    def __item(self, i):
+        return self.__path(i).decode(), self._packages[self._owners[i]]
+
+    def __bisect(self, key, func=None):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (func(mid) if func else self.__path(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __len__(self):
+        self.__open()
+        return self._count
+
+    def __iter__(self):
+        self.__open()
+        for i in range(self._count):
+            yield self.__item(i)
+
+    def get(self, path):
+        """Return the package owning the given path or None"""
+        self.__open()
+        key = path.encode()
+        i = self.__bisect(key)
+        if i < self._count and self.__path(i) == key:
+            return self._packages[self._owners[i]]
+        return None
+
+    def prefix(self, prefix):
+        """Yield the (path, package) pairs of the paths starting with prefix"""
+        self.__open()
+        key = prefix.encode()
+        for i in range(self.__bisect(key), self._count):
+            if not self.__path(i).startswith(key):
+                break
+            yield self.__item(i)
+
+    def basename(self, name):
+        """Yield the (path, package) pairs of the paths named name"""
+        self.__open()
+        key = name.encode()
+
+        def basename_at(i):
+            return _basename(self.__path(self._basenames[i]))
+
+        for i in range(self.__bisect(key, basename_at), self._count):
+            if basename_at(i) != key:
+                break
+            yield self.__item(self._basenames[i])
+
+    def search(self, term):
+        """Yield the (path, package) pairs of the paths containing term.
+
+        The term is matched case insensitively."""
+        self.__open()
+        pattern = re.compile(re.escape(term.encode()), re.I)
+        start = _header.size
+        end = start + self._offsets[self._count]
+
+        match = pattern.search(self._map, start, end)
+        while match:
+            pos = match.start() - start
+            i = self.__bisect(pos + 1, lambda i: self._offsets[i + 1])
+            yield self.__item(i)
+            match = pattern.search(self._map, start + self._offsets[i + 1], end)
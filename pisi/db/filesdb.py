@@ -1,13 +1,15 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import hashlib
+import marshal
 import os
-import re
-import shelve
+
+import iksemel
 
 import pisi
+import pisi.db.fileindex
 from pisi import context as ctx
+from pisi import translate as _
 from pisi import util
 from pisi.db import lazydb
 
@@ -17,35 +19,86 @@ from pisi.db import lazydb
 # file conflict mechanism of pisi prevents this and needs a fast has_file function.
 # So currently filesdb is the only db and we cant still get rid of rebuild-db :/
 
+# Changed paths are kept in the journal until there are this many of them,
+# then they are merged into a new index when the database is closed
+COMPACT_THRESHOLD = 50000
+
 
 class FilesDB(lazydb.LazyDB):
+    """Installed file ownership database.
+
+    Paths live in a sorted, memory mapped index. Files added or removed by
+    package operations are appended to a journal and kept in memory on top
+    of the index, the journal is merged into the index once it grows large
+    enough."""
+
     def init(self):
-        self.filesdb = {}
+        self.index = None
+        self.added = {}  # Paths added or changing owner since the index
+        self.removed = set()  # Paths removed since the index
+        self.journal = None
         self.__check_filesdb()
 
+    def __index_file(self):
+        return util.join_path(ctx.config.info_dir(), ctx.const.files_db)
+
+    def __journal_file(self):
+        return util.join_path(ctx.config.info_dir(), ctx.const.files_journal)
+
+    def __writable(self):
+        return os.access(ctx.config.info_dir(), os.W_OK)
+
+    def __owner(self, path):
+        if path in self.added:
+            return self.added[path]
+        if path in self.removed or self.index is None:
+            return None
+        return self.index.get(path)
+
+    def __query(self, indexed, matches):
+        # Merge the results of an index query with the pending changes
+        found = dict(
+            x for x in indexed if x[0] not in self.removed and x[0] not in self.added
+        )
+        found.update((path, pkg) for path, pkg in self.added.items() if matches(path))
+        return sorted(found.items())
+
     def has_file(self, path):
-        return hashlib.md5(path.encode()).hexdigest() in self.filesdb
+        return self.__owner(path) is not None
 
     def get_file(self, path):
-        return self.filesdb[hashlib.md5(path.encode()).hexdigest()], path
+        pkg = self.__owner(path)
+        if pkg is None:
+            raise KeyError(path)
+        return pkg, path
+
+    def prefix_search(self, prefix):
+        """Return the sorted (path, package) pairs of paths under prefix"""
+        indexed = self.index.prefix(prefix) if self.index else ()
+        return self.__query(indexed, lambda path: path.startswith(prefix))
+
+    def basename_search(self, name):
+        """Return the sorted (path, package) pairs of paths named name"""
+        indexed = self.index.basename(name) if self.index else ()
+        return self.__query(indexed, lambda path: os.path.basename(path) == name)
+
+    def substring_search(self, term):
+        """Return the sorted (path, package) pairs of paths containing term.
+
+        As in the files.xml search it replaces, case is ignored."""
+        indexed = self.index.search(term) if self.index else ()
+        term = term.lower()
+        return self.__query(indexed, lambda path: term in path.lower())
 
     def search_file(self, term):
         if self.has_file(term):
             pkg, path = self.get_file(term)
             return [(pkg, [path])]
 
-        installdb = pisi.db.installdb.InstallDB()
-        found = []
-        for pkg in installdb.list_installed():
-            files_xml = open(
-                os.path.join(installdb.package_path(pkg), ctx.const.files_xml)
-            ).read()
-            paths = re.compile(
-                "<Path>(.*?%s.*?)</Path>" % re.escape(term), re.I
-            ).findall(files_xml)
-            if paths:
-                found.append((pkg, paths))
-        return found
+        found = {}
+        for path, pkg in self.substring_search(term):
+            found.setdefault(pkg, []).append(path)
+        return list(found.items())
 
     def get_pkgconfig_provider(self, pkgconfigName):
         """get_pkgconfig_provider will try known paths to find the provider
@@ -68,41 +121,129 @@ class FilesDB(lazydb.LazyDB):
             return self.get_file(fp)
         return None
 
+    def __apply(self, op, pkg, paths):
+        if op == "+":
+            for path in paths:
+                self.added[path] = pkg
+                self.removed.discard(path)
+        else:
+            for path in paths:
+                self.added.pop(path, None)
+                self.removed.add(path)
+
+    def __log(self, op, pkg, paths):
+        self.__apply(op, pkg, paths)
+        if self.journal is not None:
+            marshal.dump((op, pkg, paths), self.journal)
+            self.journal.flush()
+
     def add_files(self, pkg, files):
         self.__check_filesdb()
-
-        for f in files.list:
-            self.filesdb[hashlib.md5(f.path.encode()).hexdigest()] = pkg
+        self.__log("+", pkg, [f.path for f in files.list])
 
     def remove_files(self, files):
-        for f in files:
-            if hashlib.md5(f.path.encode()).hexdigest() in self.filesdb:
-                del self.filesdb[hashlib.md5(f.path.encode()).hexdigest()]
+        self.__check_filesdb()
+        self.__log("-", None, [f.path for f in files])
+
+    def generate(self):
+        """Build the index from the files.xml of every installed package"""
+        installdb = pisi.db.installdb.InstallDB()
+
+        items = []
+        for pkg in installdb.list_installed():
+            ctx.ui.info(_("Adding '%s' to db... ") % pkg, verbose=True)
+            files_xml = os.path.join(installdb.package_path(pkg), ctx.const.files_xml)
+            doc = iksemel.parse(files_xml)
+            items.extend((x.getTagData("Path"), pkg) for x in doc.tags("File"))
+
+        if self.is_initialized():
+            self.__release()
+        pisi.db.fileindex.write(self.__index_file(), items)
+        self.__remove_journal()
+        self.init()
+
+    def compact(self):
+        """Merge the journal into a new index"""
+        items = dict(self.index or ())
+        for path in self.removed:
+            items.pop(path, None)
+        items.update(self.added)
+
+        self.__release()
+        pisi.db.fileindex.write(self.__index_file(), items.items())
+        self.__remove_journal()
+
+    def __remove_journal(self):
+        if os.path.exists(self.__journal_file()):
+            os.unlink(self.__journal_file())
 
     def destroy(self):
-        files_db = os.path.join(ctx.config.info_dir(), ctx.const.files_db)
+        files_db = self.__index_file()
         if os.path.exists(files_db):
             os.unlink(files_db)
+        self.__remove_journal()
+
+    def __release(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        self.added = {}
+        self.removed = set()
 
     def close(self):
-        if isinstance(self.filesdb, shelve.DbfilenameShelf):
-            self.filesdb.close()
+        pending = len(self.added) + len(self.removed)
+        if self.__writable() and (
+            pending >= COMPACT_THRESHOLD or (pending and self.index is None)
+        ):
+            self.compact()
+        else:
+            self.__release()
+
+    def __replay_journal(self):
+        journal = self.__journal_file()
+        if not os.path.exists(journal):
+            return
+
+        with open(journal, "rb") as f:
+            while True:
+                pos = f.tell()
+                try:
+                    entry = marshal.load(f)
+                except (EOFError, ValueError, TypeError):
+                    break
+                self.__apply(*entry)
+
+        # Drop an incomplete entry left by an interrupted operation, new
+        # entries are appended after it
+        if pos != os.path.getsize(journal) and self.__writable():
+            os.truncate(journal, pos)
 
     def __check_filesdb(self):
-        if isinstance(self.filesdb, shelve.DbfilenameShelf):
+        if self.index is not None or self.journal is not None:
             return
 
-        files_db = os.path.join(ctx.config.info_dir(), ctx.const.files_db)
+        files_db = self.__index_file()
 
         if not os.path.exists(files_db):
-            if not os.access(files_db, os.W_OK):
+            if not self.__writable():
                 return
-            flag = "n"
-        elif os.access(files_db, os.W_OK):
-            flag = "w"
-        else:
-            flag = "r"
+            ctx.ui.info(_("Generating files database..."))
+            self.generate()
+            return
 
-        self.filesdb = shelve.open(
-            util.join_path(ctx.config.info_dir(), ctx.const.files_db), flag
-        )
+        try:
+            self.index = pisi.db.fileindex.FileIndex(files_db)
+            len(self.index)
+        except pisi.db.fileindex.Error as e:
+            ctx.ui.warning(str(e))
+            self.index = None
+            if self.__writable():
+                self.generate()
+            return
+
+        self.__replay_journal()
+        if self.__writable():
+            self.journal = open(self.__journal_file(), "ab")
@@ -1,6 +1,7 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import marshal
 import os
 
 from pisi import context as ctx
@@ -9,23 +10,87 @@ from pisi.db import lazydb
 
 
 class HistoryDB(lazydb.LazyDB):
+    """Operation history.
+
+    The operation in progress is journaled as packages are added to it, its
+    history file is written once when the database is closed at the end of
+    the operation. Readers use an index holding the records of every history
+    file, only the files missing from it are parsed."""
+
     def init(self):
+        self.__recover_journals()
+        self.__index = self.__load_index()
         self.__logs = self.__generate_history()
         self.history = history.History()
 
+    def __recover_journals(self):
+        # Journals left behind by interrupted operations
+        history_dir = ctx.config.history_dir()
+        if not os.access(history_dir, os.W_OK):
+            return
+        for journal in os.listdir(history_dir):
+            if journal.endswith(history.JOURNAL_SUFFIX):
+                history.recover_journal(os.path.join(history_dir, journal))
+
+    def __index_file(self):
+        return util.join_path(ctx.config.history_dir(), ctx.const.history_index)
+
+    def __load_index(self):
+        try:
+            with open(self.__index_file(), "rb") as f:
+                index = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            index = {}
+
+        # Bring the index in line with the history files on disk, files
+        # written after they were indexed are parsed again
+        history_dir = ctx.config.history_dir()
+        logs = {}
+        for entry in os.scandir(history_dir):
+            if entry.name.endswith(".xml"):
+                logs[entry.name] = entry.stat().st_mtime_ns
+
+        changed = False
+        for log in set(index) - set(logs):
+            del index[log]
+            changed = True
+        for log, mtime in logs.items():
+            if log not in index or index[log][0] != mtime:
+                hist = history.History(os.path.join(history_dir, log))
+                index[log] = (mtime, hist.records())
+                changed = True
+
+        if changed:
+            self.__save_index(index)
+        return index
+
+    def __save_index(self, index):
+        index_file = self.__index_file()
+        if not os.access(os.path.dirname(index_file), os.W_OK):
+            return
+        tmp = index_file + ctx.const.temporary_suffix
+        with open(tmp, "wb") as f:
+            marshal.dump(index, f)
+        os.rename(tmp, index_file)
+
     def __generate_history(self):
-        logs = [x for x in os.listdir(ctx.config.history_dir()) if x.endswith(".xml")]
+        logs = list(self.__index)
         # logs.sort(key=lambda x,y:int(x.split("_")[0]) - int(y.split("_")[0]))
         logs.sort(key=lambda x: int(x.split("_")[0].replace("0o", "0")))
         logs.reverse()
         return logs
 
+    def __operation(self, log):
+        return history.load_operation(int(log.split("_")[0]), self.__index[log][1])
+
     def create_history(self, operation):
+        self.close()
+        self.history = history.History()
         self.history.create(operation)
 
     def add_and_update(self, pkgBefore=None, pkgAfter=None, operation=None, otype=None):
+        # The journal keeps the package, the history file is written on close
         self.add_package(pkgBefore, pkgAfter, operation, otype)
-        self.update_history()
 
     def add_package(self, pkgBefore=None, pkgAfter=None, operation=None, otype=None):
         self.history.add(pkgBefore, pkgAfter, operation, otype)
@@ -50,17 +115,28 @@ class HistoryDB(lazydb.LazyDB):
 
     def update_repo(self, repo, uri, operation=None):
         self.history.update_repo(repo, uri, operation)
-        self.update_history()
 
     def update_history(self):
         self.history.update()
+        mtime = os.stat(self.history.history_path()).st_mtime_ns
+        self.__index[self.history.histfile] = (mtime, self.history.records())
+        self.__save_index(self.__index)
+        self.__logs = self.__generate_history()
+
+    def close(self):
+        """Compact the journal of the operation into its history file"""
+        if self.history.journal is not None:
+            self.update_history()
+
+    def invalidate(self):
+        if self.is_initialized():
+            self.close()
+        lazydb.LazyDB.invalidate(self)
 
     def get_operation(self, operation):
         for log in self.__logs:
             if log.startswith("%03d_" % operation):
-                hist = history.History(os.path.join(ctx.config.history_dir(), log))
-                hist.operation.no = int(log.split("_")[0])
-                return hist.operation
+                return self.__operation(log)
         return None
 
     def get_package_config_files(self, operation, package):
@@ -97,16 +173,12 @@ class HistoryDB(lazydb.LazyDB):
             if log.startswith("%03d_" % operation):
                 return
 
-            hist = history.History(os.path.join(ctx.config.history_dir(), log))
-            hist.operation.no = int(log.split("_")[0])
-            yield hist.operation
+            yield self.__operation(log)
 
     def get_last(self, count=0):
         count = count or len(self.__logs)
         for log in self.__logs[:count]:
-            hist = history.History(os.path.join(ctx.config.history_dir(), log))
-            hist.operation.no = int(log.split("_")[0])
-            yield hist.operation
+            yield self.__operation(log)
 
     def get_last_repo_update(self, last=1):
         repoupdates = [l for l in self.__logs if l.endswith("repoupdate.xml")]
@@ -117,7 +189,5 @@ class HistoryDB(lazydb.LazyDB):
         if last != 1 and len(repoupdates) <= last:
             return None
 
-        hist = history.History(
-            os.path.join(ctx.config.history_dir(), repoupdates[-last])
-        )
-        return hist.operation.date
+        # The date is in the operation record heading the entry
+        return self.__index[repoupdates[-last]][1][0][2]
@@ -6,6 +6,7 @@
 
 import os
 import re
+import collections
 from pisi import translate as _
 
 import iksemel
@@ -23,6 +24,55 @@ class InstallDBError(pisi.Error):
     pass
 
 
+# dependencies holds the names of all the packages the installed package
+# depends on, including the alternatives of its AnyDependency entries
+InstalledRecord = collections.namedtuple(
+    "InstalledRecord",
+    [
+        "name",
+        "version",
+        "release",
+        "distribution",
+        "distributionRelease",
+        "dependencies",
+        "providesPkgConfig",
+        "providesPkgConfig32",
+    ],
+)
+
+
+def make_record(pkg):
+    """Build an InstalledRecord from the <Package> node of a metadata.xml"""
+
+    def provides(tag):
+        node = pkg.getTag("Provides")
+        if not node:
+            return ()
+        return tuple(x.firstChild().data() for x in node.tags(tag))
+
+    update = pkg.getTag("History").getTag("Update")
+
+    dependencies = []
+    deps = pkg.getTag("RuntimeDependencies")
+    if deps:
+        for dep in deps.tags("Dependency"):
+            dependencies.append(dep.firstChild().data())
+        for anydep in deps.tags("AnyDependency"):
+            for dep in anydep.tags("Dependency"):
+                dependencies.append(dep.firstChild().data())
+
+    return InstalledRecord(
+        name=pkg.getTagData("Name"),
+        version=update.getTagData("Version"),
+        release=update.getAttribute("release"),
+        distribution=pkg.getTagData("Distribution"),
+        distributionRelease=pkg.getTagData("DistributionRelease"),
+        dependencies=tuple(dependencies),
+        providesPkgConfig=provides("PkgConfig"),
+        providesPkgConfig32=provides("PkgConfig32"),
+    )
+
+
 class InstallInfo:
     state_map = {"i": _("installed"), "ip": _("installed-pending")}
 
@@ -60,12 +110,40 @@ class InstallInfo:
 
 
 class InstallDB(lazydb.LazyDB):
+    # Bump the suffix whenever the cached structures change
+    cache_version = "%s-1" % lazydb.LazyDB.cache_version
+
     def __init__(self):
         lazydb.LazyDB.__init__(self, cacheable=True, cachedir=ctx.config.packages_dir())
 
     def init(self):
         self.installed_db = self.__generate_installed_pkgs()
+        self.__records = {}
         self.rev_deps_db = self.__generate_revdeps()
+        self.snapshot_mtime = self.__packages_dir_mtime()
+
+    def __packages_dir_mtime(self):
+        try:
+            return os.stat(ctx.config.packages_dir()).st_mtime_ns
+        except OSError:
+            return None
+
+    def cache_load(self):
+        # The snapshot is only kept up to date by add_package and
+        # remove_package, packages installed or removed by any other means
+        # change the packages directory and force a full regeneration
+        if not lazydb.LazyDB.cache_load(self):
+            return False
+
+        if self.__dict__.get("snapshot_mtime") != self.__packages_dir_mtime():
+            ctx.ui.debug("Installed packages changed, regenerating InstallDB")
+            return False
+
+        return True
+
+    def cache_save(self):
+        self.snapshot_mtime = self.__packages_dir_mtime()
+        lazydb.LazyDB.cache_save(self)
 
     def __generate_installed_pkgs(self):
         def split_name(dirname):
@@ -80,7 +158,7 @@ class InstallDB(lazydb.LazyDB):
             return open(info_path, "r").read().split()
         return []
 
-    def __add_to_revdeps(self, package, revdeps):
+    def __add_package_info(self, package, revdeps):
         metadata_xml = os.path.join(self.package_path(package), ctx.const.metadata_xml)
         try:
             meta_doc = iksemel.parse(metadata_xml)
@@ -100,6 +178,8 @@ class InstallDB(lazydb.LazyDB):
             del self.installed_db[package]
             return
 
+        self.__records[package] = make_record(pkg)
+
         deps = pkg.getTag("RuntimeDependencies")
         if deps:
             for dep in deps.tags("Dependency"):
@@ -110,10 +190,22 @@ class InstallDB(lazydb.LazyDB):
                     revdep = revdeps.setdefault(dep.firstChild().data(), {})
                     revdep[package] = anydep.toString()
 
+    def __remove_package_info(self, package, revdeps):
+        record = self.__records.pop(package, None)
+        if record is None:
+            return
+
+        for dep in record.dependencies:
+            revdep = revdeps.get(dep)
+            if revdep is not None:
+                revdep.pop(package, None)
+                if not revdep:
+                    del revdeps[dep]
+
     def __generate_revdeps(self):
         revdeps = {}
         for package in self.list_installed():
-            self.__add_to_revdeps(package, revdeps)
+            self.__add_package_info(package, revdeps)
         return revdeps
 
     def list_installed(self):
@@ -140,29 +232,31 @@ class InstallDB(lazydb.LazyDB):
 
         return found
 
-    def __get_version(self, meta_doc):
-        history = meta_doc.getTag("Package").getTag("History")
-        version = history.getTag("Update").getTagData("Version")
-        release = history.getTag("Update").getAttribute("release")
-
-        # TODO Remove None
-        return version, release, None
-
-    def __get_distro_release(self, meta_doc):
-        distro = meta_doc.getTag("Package").getTagData("Distribution")
-        release = meta_doc.getTag("Package").getTagData("DistributionRelease")
+    def get_package_record(self, package):
+        """Return the InstalledRecord of the given package.
 
-        return distro, release
+        Records come from the installed state snapshot, prefer them over
+        get_package when the full package metadata is not needed."""
+        try:
+            return self.__records[package]
+        except KeyError:
+            raise Exception(_("Package %s is not installed") % package)
 
     def get_version_and_distro_release(self, package):
-        metadata_xml = os.path.join(self.package_path(package), ctx.const.metadata_xml)
-        meta_doc = iksemel.parse(metadata_xml)
-        return self.__get_version(meta_doc) + self.__get_distro_release(meta_doc)
+        record = self.get_package_record(package)
+        # TODO Remove None
+        return (
+            record.version,
+            record.release,
+            None,
+            record.distribution,
+            record.distributionRelease,
+        )
 
     def get_version(self, package):
-        metadata_xml = os.path.join(self.package_path(package), ctx.const.metadata_xml)
-        meta_doc = iksemel.parse(metadata_xml)
-        return self.__get_version(meta_doc)
+        record = self.get_package_record(package)
+        # TODO Remove None
+        return record.version, record.release, None
 
     def get_files(self, package):
         files = pisi.files.Files()
@@ -274,20 +368,14 @@ class InstallDB(lazydb.LazyDB):
         return metadata.package
 
     def get_package_by_pkgconfig(self, pkgconfig):
-        for item in self.list_installed():
-            pkg = self.get_package(item)
-            if pkg.providesPkgConfig is not None and len(pkg.providesPkgConfig) > 0:
-                for pc in pkg.providesPkgConfig:
-                    if pc.om == pkgconfig:
-                        return pkg
+        for record in self.__records.values():
+            if pkgconfig in record.providesPkgConfig:
+                return self.get_package(record.name)
 
     def get_package_by_pkgconfig32(self, pkgconfig):
-        for item in self.list_installed():
-            pkg = self.get_package(item)
-            if pkg.providesPkgConfig32 is not None and len(pkg.providesPkgConfig32) > 0:
-                for pc in pkg.providesPkgConfig32:
-                    if pc.om == pkgconfig:
-                        return pkg
+        for record in self.__records.values():
+            if pkgconfig in record.providesPkgConfig32:
+                return self.get_package(record.name)
 
     def __mark_package(self, _type, package):
         packages = self.__get_marked_packages(_type)
@@ -309,21 +397,17 @@ class InstallDB(lazydb.LazyDB):
 
     def add_package(self, pkginfo):
         # Cleanup old revdep info
-        for revdep_info in list(self.rev_deps_db.values()):
-            if pkginfo.name in revdep_info:
-                del revdep_info[pkginfo.name]
+        self.__remove_package_info(pkginfo.name, self.rev_deps_db)
 
         self.installed_db[pkginfo.name] = "%s-%s" % (pkginfo.version, pkginfo.release)
-        self.__add_to_revdeps(pkginfo.name, self.rev_deps_db)
+        self.__add_package_info(pkginfo.name, self.rev_deps_db)
 
     def remove_package(self, package_name):
         if package_name in self.installed_db:
             del self.installed_db[package_name]
 
         # Cleanup revdep info
-        for revdep_info in list(self.rev_deps_db.values()):
-            if package_name in revdep_info:
-                del revdep_info[package_name]
+        self.__remove_package_info(package_name, self.rev_deps_db)
 
         self.clear_pending(package_name)
 
@@ -60,7 +60,7 @@ class LazyDB(Singleton):
     def cache_save(self):
         if os.access(ctx.config.cache_root_dir(), os.W_OK) and self.cacheable:
             with open(self.__cache_version_file(), "w") as f:
-                f.write(LazyDB.cache_version)
+                f.write(self.cache_version)
                 f.flush()
                 os.fsync(f.fileno())
             pickle.dump(self._instance, open(self.__cache_file(), "wb"), protocol=2)
@@ -71,7 +71,7 @@ class LazyDB(Singleton):
             ver = open(f).read().strip()
         except IOError:
             return False
-        return ver == LazyDB.cache_version
+        return ver == self.cache_version
 
     def cache_load(self):
         if os.path.exists(self.__cache_file()) and self.cache_valid():
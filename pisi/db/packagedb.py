@@ -4,11 +4,16 @@
 # installation database
 #
 
+import os
 import re
+import copy
 import time
 import gzip
+import shutil
+import marshal
 import gettext
 import datetime
+import collections
 
 import iksemel
 
@@ -16,33 +21,250 @@ import pisi.db
 import pisi.metadata
 import pisi.dependency
 import pisi.db.itembyrepo
+import pisi.db.packageindex
+import pisi.db.searchindex
 import pisi.db.lazydb as lazydb
+import pisi.context as ctx
+import pisi.util as util
 from pisi import translate as _
 
+RELATION_ATTRIBUTES = (
+    "version",
+    "versionFrom",
+    "versionTo",
+    "release",
+    "releaseFrom",
+    "releaseTo",
+)
+
+# Relations are stored as (package, version, versionFrom, versionTo, release,
+# releaseFrom, releaseTo) tuples, dependencies additionally carry their type.
+PackageRecord = collections.namedtuple(
+    "PackageRecord",
+    [
+        "name",
+        "version",
+        "release",
+        "distribution",
+        "distributionRelease",
+        "partOf",
+        "dependencies",
+        "anyDependencies",
+        "componentDependencies",
+        "conflicts",
+        "replaces",
+        "providesPkgConfig",
+        "providesPkgConfig32",
+        "installedSize",
+        "packageSize",
+        "packageHash",
+        "packageURI",
+        "deltaReleases",
+    ],
+)
+
+
+def make_relation(node, attributes=RELATION_ATTRIBUTES):
+    return (node.firstChild().data(),) + tuple(
+        node.getAttribute(attr) for attr in attributes
+    )
+
+
+def make_dependency(node):
+    return make_relation(node, RELATION_ATTRIBUTES + ("type",))
+
+
+def make_record(node):
+    """Build a PackageRecord from a <Package> node of a repository index"""
+
+    def tag_list(parent, tag, make=make_relation):
+        parent = node.getTag(parent)
+        if not parent:
+            return ()
+        return tuple(make(x) for x in parent.tags(tag))
+
+    def size(tag):
+        value = node.getTagData(tag)
+        return int(value) if value else None
+
+    update = node.getTag("History").getTag("Update")
+
+    anydeps = ()
+    deps = node.getTag("RuntimeDependencies")
+    if deps:
+        anydeps = tuple(
+            tuple(make_dependency(x) for x in anydep.tags("Dependency"))
+            for anydep in deps.tags("AnyDependency")
+        )
+
+    return PackageRecord(
+        name=node.getTagData("Name"),
+        version=update.getTagData("Version"),
+        release=update.getAttribute("release"),
+        distribution=node.getTagData("Distribution"),
+        distributionRelease=node.getTagData("DistributionRelease"),
+        partOf=node.getTagData("PartOf"),
+        dependencies=tag_list("RuntimeDependencies", "Dependency", make_dependency),
+        anyDependencies=anydeps,
+        componentDependencies=tag_list(
+            "RuntimeDependencies", "Component", lambda x: x.firstChild().data()
+        ),
+        conflicts=tag_list("Conflicts", "Package"),
+        replaces=tag_list("Replaces", "Package"),
+        providesPkgConfig=tag_list(
+            "Provides", "PkgConfig", lambda x: x.firstChild().data()
+        ),
+        providesPkgConfig32=tag_list(
+            "Provides", "PkgConfig32", lambda x: x.firstChild().data()
+        ),
+        installedSize=size("InstalledSize"),
+        packageSize=size("PackageSize"),
+        packageHash=node.getTagData("PackageHash"),
+        packageURI=node.getTagData("PackageURI"),
+        deltaReleases=tag_list(
+            "DeltaPackages", "Delta", lambda x: x.getAttribute("releaseFrom")
+        ),
+    )
+
+
+def node_signature(node):
+    """Return what identifies a package build of a repository index.
+
+    This is the release, the package hash and the releases deltas are
+    available from, the same fields make_record stores."""
+    release = node.getTag("History").getTag("Update").getAttribute("release")
+    deltas = node.getTag("DeltaPackages")
+    if deltas:
+        deltas = tuple(x.getAttribute("releaseFrom") for x in deltas.tags("Delta"))
+    return (release, node.getTagData("PackageHash"), deltas or ())
+
+
+def record_signature(record):
+    return (record.release, record.packageHash, record.deltaReleases)
+
+
+class PackageCache(collections.OrderedDict):
+    """Least recently used cache of decoded packages.
+
+    It is never saved along with the database cache, decoded packages only
+    live as long as the process does."""
+
+    def __init__(self, size=512):
+        collections.OrderedDict.__init__(self)
+        self.size = size
+
+    def __reduce__(self):
+        return (self.__class__, (self.size,))
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def add(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
 
 class PackageDB(lazydb.LazyDB):
+    # Bump the suffix whenever the cached structures change
+    cache_version = "%s-6" % lazydb.LazyDB.cache_version
+
     def __init__(self):
         lazydb.LazyDB.__init__(self, cacheable=True)
 
     def init(self):
         self.__package_nodes = {}  # Packages
+        self.__records = {}  # Pre-decoded package records
         self.__revdeps = {}  # Reverse dependencies
         self.__obsoletes = {}  # Obsoletes
         self.__replaces = {}  # Replaces
+        self.__pkgconfigs = {}  # PkgConfig providers
+        self.__pkgconfigs32 = {}  # PkgConfig32 providers
+        self.__search = {}  # Summary and description word indexes
+        self.index_generations = {}  # Stamps of the package index files
 
         repodb = pisi.db.repodb.RepoDB()
 
         for repo in repodb.list_repos():
             doc = repodb.get_repo_doc(repo)
-            self.__package_nodes[repo] = self.__generate_packages(doc)
+            (
+                self.__package_nodes[repo],
+                self.__records[repo],
+            ) = self.__generate_packages(repo, doc)
+            self.__search[repo] = self.__generate_search(repo, doc)
             self.__revdeps[repo] = self.__generate_revdeps(doc)
             self.__obsoletes[repo] = self.__generate_obsoletes(doc)
             self.__replaces[repo] = self.__generate_replaces(doc)
+            self.__pkgconfigs[repo] = self.__generate_pkgconfigs(doc, "PkgConfig")
+            self.__pkgconfigs32[repo] = self.__generate_pkgconfigs(doc, "PkgConfig32")
 
         self.pdb = pisi.db.itembyrepo.ItemByRepo(self.__package_nodes, compressed=True)
         self.rvdb = pisi.db.itembyrepo.ItemByRepo(self.__revdeps)
         self.odb = pisi.db.itembyrepo.ItemByRepo(self.__obsoletes)
         self.rpdb = pisi.db.itembyrepo.ItemByRepo(self.__replaces)
+        self.recdb = pisi.db.itembyrepo.ItemByRepo(self.__records)
+        self.package_cache = PackageCache()
+
+    def __index_dir(self):
+        return util.join_path(ctx.config.cache_root_dir(), "packagedb")
+
+    def __index_file(self, repo, kind="index"):
+        return util.join_path(self.__index_dir(), "%s.%s" % (repo, kind))
+
+    def cache_valid(self):
+        if not lazydb.LazyDB.cache_valid(self):
+            return False
+
+        # The pickled cache refers to the package index files, which must
+        # still be around
+        for repo in pisi.db.repodb.RepoDB().list_repos():
+            for kind in ("index", "records", "search"):
+                if not os.path.exists(self.__index_file(repo, kind)):
+                    return False
+
+        # Index files are rewritten before the cache is saved, once the
+        # pickled state is loaded they must be the ones it was saved with
+        generations = self.__dict__.get("index_generations", {})
+        for repo, generation in generations.items():
+            for kind in ("index", "records"):
+                try:
+                    path = self.__index_file(repo, kind)
+                    if pisi.db.packageindex.generation(path) != generation:
+                        return False
+                except pisi.db.packageindex.Error:
+                    return False
+
+        return True
+
+    def cache_load(self):
+        if not lazydb.LazyDB.cache_load(self):
+            return False
+
+        if not self.cache_valid():
+            ctx.ui.debug("Package indexes changed, regenerating PackageDB")
+            self.initialized = False
+            return False
+
+        return True
+
+    def cache_flush(self):
+        lazydb.LazyDB.cache_flush(self)
+        shutil.rmtree(self.__index_dir(), ignore_errors=True)
+
+    def state(self):
+        """Return what identifies the package indexes of the repositories"""
+        state = []
+        for repo in pisi.db.repodb.RepoDB().list_repos():
+            try:
+                st = os.stat(self.__index_file(repo, "records"))
+                state.append((repo, st.st_mtime_ns, st.st_size))
+            except OSError:
+                state.append((repo, None, None))
+        return tuple(state)
 
     def __generate_replaces(self, doc):
         return [
@@ -61,26 +283,192 @@ class PackageDB(lazydb.LazyDB):
 
         return [x.firstChild().data() for x in obsoletes.tags("Package")]
 
-    def __generate_packages(self, doc):
-        return dict(
-            [
-                (x.getTagData("Name"), gzip.zlib.compress(x.toString().encode()))
-                for x in doc.tags("Package")
-            ]
+    def __generate_pkgconfigs(self, doc, tag):
+        pkgconfigs = {}
+        for node in doc.tags("Package"):
+            provides = node.getTag("Provides")
+            if provides:
+                name = node.getTagData("Name")
+                for pc in provides.tags(tag):
+                    pkgconfigs[pc.firstChild().data()] = name
+        return pkgconfigs
+
+    def __generate_packages(self, repo, doc):
+        generation = time.time_ns()
+        packages = []
+        records = []
+        for x in doc.tags("Package"):
+            name = x.getTagData("Name")
+            packages.append((name, gzip.zlib.compress(x.toString().encode())))
+            records.append((name, marshal.dumps(tuple(make_record(x)))))
+
+        return (
+            self.__make_index(repo, "index", packages, generation),
+            self.__make_index(repo, "records", records, generation),
         )
 
+    def __index_writable(self):
+        return self.cacheable and os.access(ctx.config.cache_root_dir(), os.W_OK)
+
+    def __make_index(self, repo, kind, items, generation):
+        # Without a writable cache there is nothing to map, keep them in memory
+        if not self.__index_writable():
+            self.index_generations.pop(repo, None)
+            return dict(items)
+
+        util.ensure_dirs(self.__index_dir())
+        path = self.__index_file(repo, kind)
+        pisi.db.packageindex.write(path, items, generation)
+        self.index_generations[repo] = generation
+        return pisi.db.packageindex.PackageIndex(path)
+
+    def __generate_search(self, repo, doc):
+        index = pisi.db.searchindex.SearchIndex()
+        for node in doc.tags("Package"):
+            index.add(node.getTagData("Name"), node)
+        return self.__save_search(repo, index)
+
+    def __save_search(self, repo, index):
+        # Kept in memory and pickled along with the cache if not writable
+        if self.__index_writable():
+            util.ensure_dirs(self.__index_dir())
+            index.save(self.__index_file(repo, "search"))
+        return index
+
+    def __add_to_revdeps(self, node, revdeps):
+        name = node.getTagData("Name")
+        deps = node.getTag("RuntimeDependencies")
+        if deps:
+            for dep in deps.tags("Dependency"):
+                revdeps.setdefault(dep.firstChild().data(), set()).add(
+                    (name, dep.toString())
+                )
+
+    def __remove_from_revdeps(self, record, revdeps):
+        for dep in record.dependencies:
+            revdep = revdeps.get(dep[0])
+            if revdep is None:
+                continue
+
+            for item in [x for x in revdep if x[0] == record.name]:
+                revdep.discard(item)
+            if not revdep:
+                del revdeps[dep[0]]
+
     def __generate_revdeps(self, doc):
         revdeps = {}
         for node in doc.tags("Package"):
-            name = node.getTagData("Name")
-            deps = node.getTag("RuntimeDependencies")
-            if deps:
-                for dep in deps.tags("Dependency"):
-                    revdeps.setdefault(dep.firstChild().data(), set()).add(
-                        (name, dep.toString())
-                    )
+            self.__add_to_revdeps(node, revdeps)
         return revdeps
 
+    def update_repos(self, repos):
+        """Patch the cached tables after the given repositories are updated.
+
+        The new index of each repository is compared against the cached
+        records by package name and build, only changed packages are
+        encoded again and reverse dependencies are patched for those alone.
+        Without a usable cache everything is regenerated."""
+
+        if not self.cache_load():
+            self.cache_regenerate()
+            return
+
+        self.initialized = True
+        repodb = pisi.db.repodb.RepoDB()
+
+        for repo in repos:
+            doc = repodb.get_repo_doc(repo)
+            if repo in self.__records:
+                self.__patch_repo(repo, doc)
+            else:
+                (
+                    self.__package_nodes[repo],
+                    self.__records[repo],
+                ) = self.__generate_packages(repo, doc)
+                self.__search[repo] = self.__generate_search(repo, doc)
+                self.__revdeps[repo] = self.__generate_revdeps(doc)
+                self.__replaces[repo] = self.__generate_replaces(doc)
+                self.__pkgconfigs[repo] = self.__generate_pkgconfigs(doc, "PkgConfig")
+                self.__pkgconfigs32[repo] = self.__generate_pkgconfigs(
+                    doc, "PkgConfig32"
+                )
+
+            self.__obsoletes[repo] = self.__generate_obsoletes(doc)
+
+        self.package_cache = PackageCache()
+
+    def __patch_repo(self, repo, doc):
+        old_packages = self.__package_nodes[repo]
+        old_records = self.__records[repo]
+        revdeps = self.__revdeps[repo]
+        replaces = set(self.__replaces[repo])
+        pkgconfigs = self.__pkgconfigs[repo]
+        pkgconfigs32 = self.__pkgconfigs32[repo]
+        search = self.__search[repo]
+
+        def remove_record(record):
+            old_node = iksemel.parseString(
+                gzip.zlib.decompress(old_packages[record.name]).decode()
+            )
+            search.remove(record.name, old_node)
+            self.__remove_from_revdeps(record, revdeps)
+            replaces.discard(record.name)
+            for pc in record.providesPkgConfig:
+                if pkgconfigs.get(pc) == record.name:
+                    del pkgconfigs[pc]
+            for pc in record.providesPkgConfig32:
+                if pkgconfigs32.get(pc) == record.name:
+                    del pkgconfigs32[pc]
+
+        packages = []
+        records = []
+        changed = 0
+        names = set()
+
+        for node in doc.tags("Package"):
+            name = node.getTagData("Name")
+            names.add(name)
+
+            old = old_records.get(name)
+            if old is not None:
+                old_record = PackageRecord._make(marshal.loads(old))
+                if record_signature(old_record) == node_signature(node):
+                    packages.append((name, old_packages[name]))
+                    records.append((name, old))
+                    continue
+
+                remove_record(old_record)
+
+            changed += 1
+            record = make_record(node)
+            packages.append((name, gzip.zlib.compress(node.toString().encode())))
+            records.append((name, marshal.dumps(tuple(record))))
+            self.__add_to_revdeps(node, revdeps)
+            search.add(name, node)
+
+            if node.getTagData("Replaces"):
+                replaces.add(name)
+            for pc in record.providesPkgConfig:
+                pkgconfigs[pc] = name
+            for pc in record.providesPkgConfig32:
+                pkgconfigs32[pc] = name
+
+        removed = [x for x in old_records.keys() if x not in names]
+        for name in removed:
+            remove_record(PackageRecord._make(marshal.loads(old_records[name])))
+
+        generation = time.time_ns()
+        self.__package_nodes[repo] = self.__make_index(
+            repo, "index", packages, generation
+        )
+        self.__records[repo] = self.__make_index(repo, "records", records, generation)
+        self.__replaces[repo] = list(replaces)
+        self.__search[repo] = self.__save_search(repo, search)
+
+        ctx.ui.debug(
+            "%s: %d packages changed, %d removed" % (repo, changed, len(removed))
+        )
+
     def has_package(self, name, repo=None):
         return self.pdb.has_item(name, repo)
 
@@ -88,6 +476,14 @@ class PackageDB(lazydb.LazyDB):
         pkg, repo = self.get_package_repo(name, repo)
         return pkg
 
+    def get_package_record(self, name, repo=None):
+        """Return the pre-decoded PackageRecord of the given package.
+
+        Records are cheap to load and immutable, prefer them over
+        get_package when the full package metadata is not needed."""
+        record = self.recdb.get_item(name, repo)
+        return PackageRecord._make(marshal.loads(record))
+
     def get_pkgconfig_providers(self, repo=None):
         """get_pkgconfig_providers will return a tuple of two dicts
 
@@ -96,53 +492,105 @@ class PackageDB(lazydb.LazyDB):
         The second dict ([1]) contains the pkgconfig32 mapping to
         package name.
         """
-        repodb = pisi.db.repodb.RepoDB()
-
         pkgConfigs = dict()
         pkgConfigs32 = dict()
 
-        for repo in repodb.list_repos(repo):
-            doc = repodb.get_repo_doc(repo)
-            for pkg in doc.tags("Package"):
-                prov = pkg.getTag("Provides")
-                name = pkg.getTagData("Name")
-                if not prov:
-                    continue
-                for node in prov.tags("PkgConfig32"):
-                    pkgConfigs32[node.firstChild().data()] = name
-                for node in prov.tags("PkgConfig"):
-                    pkgConfigs[node.firstChild().data()] = name
+        for r in self.pdb.item_repos(repo):
+            pkgConfigs.update(self.__pkgconfigs.get(r, {}))
+            pkgConfigs32.update(self.__pkgconfigs32.get(r, {}))
         return (pkgConfigs, pkgConfigs32)
 
+    def __get_provider(self, providers, pkgconfig, repo):
+        # Later repositories take precedence, as in get_pkgconfig_providers
+        for r in reversed(self.pdb.item_repos(repo)):
+            name = providers.get(r, {}).get(pkgconfig)
+            if name is not None:
+                return name
+        return None
+
+    def get_pkgconfig_provider(self, pkgconfig, repo=None):
+        """Return the name of the package providing the given pkgconfig"""
+        return self.__get_provider(self.__pkgconfigs, pkgconfig, repo)
+
+    def get_pkgconfig32_provider(self, pkgconfig, repo=None):
+        """Return the name of the package providing the given pkgconfig32"""
+        return self.__get_provider(self.__pkgconfigs32, pkgconfig, repo)
+
     def get_package_by_pkgconfig(self, pkgconfig):
-        """This method is deprecated. Use get_pkgconfig_providers instead"""
-        provs = self.get_pkgconfig_providers()[0]
-        if pkgconfig in provs:
-            return self.get_package(provs[pkgconfig])
+        """This method is deprecated. Use get_pkgconfig_provider instead"""
+        name = self.get_pkgconfig_provider(pkgconfig)
+        if name is not None:
+            return self.get_package(name)
         return None
 
     def get_package_by_pkgconfig32(self, pkgconfig):
-        """This method is deprecated. Use get_pkgconfig_providers instead"""
-        provs = self.get_pkgconfig_providers()[1]
-        if pkgconfig in provs:
-            return self.get_package(provs[pkgconfig])
+        """This method is deprecated. Use get_pkgconfig32_provider instead"""
+        name = self.get_pkgconfig32_provider(pkgconfig)
+        if name is not None:
+            return self.get_package(name)
         return None
 
-    def search_in_packages(self, packages, terms, lang=None):
+    def __match_patterns(self, name, xml, patterns, lang, fields):
         resum = "<Summary xml:lang=.(%s|en).>.*?%s.*?</Summary>"
         redesc = "<Description xml:lang=.(%s|en).>.*?%s.*?</Description>"
+        for term in patterns:
+            if not (
+                (fields["name"] and re.compile(term, re.I).search(name))
+                or (
+                    fields["summary"]
+                    and re.compile(resum % (lang, term), re.I).search(xml.decode())
+                )
+                or (
+                    fields["desc"]
+                    and re.compile(redesc % (lang, term), re.I).search(xml.decode())
+                )
+            ):
+                return False
+        return True
+
+    def __search_repo(self, repo, terms, lang, fields):
+        # Plain word terms are answered by the word index and their results
+        # intersected, only the terms which are real patterns are matched
+        # against the texts of the packages left
+        index = self.__search[repo]
+        langs = (lang, "en")
+        found = None
+        patterns = []
+        for term in terms:
+            if not pisi.db.searchindex.is_plain(term):
+                patterns.append(term)
+                continue
+
+            names = index.search(term, langs, fields)
+            found = names if found is None else found & names
+            if not found:
+                return set()
+
+        if found is None:
+            found = index.names()
+
+        if not patterns:
+            return found
+
+        return set(
+            name
+            for name in found
+            if self.__match_patterns(
+                name, self.pdb.get_item(name, repo), patterns, lang, fields
+            )
+        )
+
+    def search_in_packages(self, packages, terms, lang=None):
         if not lang:
             lang = pisi.pxml.autoxml.LocalText.get_lang()
+        fields = {"name": True, "summary": True, "desc": True}
+        matches = {}
         found = []
         for name in packages:
-            xml = self.pdb.get_item(name)
-            if terms == [
-                term
-                for term in terms
-                if re.compile(term, re.I).search(name)
-                or re.compile(resum % (lang, term), re.I).search(xml.decode())
-                or re.compile(redesc % (lang, term), re.I).search(xml.decode())
-            ]:
+            repo = self.which_repo(name)
+            if repo not in matches:
+                matches[repo] = self.__search_repo(repo, terms, lang, fields)
+            if name in matches[repo]:
                 found.append(name)
         return found
 
@@ -156,62 +604,55 @@ class PackageDB(lazydb.LazyDB):
         This method will return only package that contents terms in the package
         name or summary
         """
-        resum = "<Summary xml:lang=.(%s|en).>.*?%s.*?</Summary>"
-        redesc = "<Description xml:lang=.(%s|en).>.*?%s.*?</Description>"
         if not lang:
             lang = pisi.pxml.autoxml.LocalText.get_lang()
         if not fields:
             fields = {"name": True, "summary": True, "desc": True}
         found = []
-        for name, xml in self.pdb.get_items_iter(repo):
-            if terms == [
-                term
-                for term in terms
-                if (fields["name"] and re.compile(term, re.I).search(name))
-                or (
-                    fields["summary"]
-                    and re.compile(resum % (lang, term), re.I).search(xml.decode())
-                )
-                or (
-                    fields["desc"]
-                    and re.compile(redesc % (lang, term), re.I).search(xml.decode())
-                )
-            ]:
-                found.append(name)
+        for r in self.pdb.item_repos(repo):
+            if not self.pdb.has_repo(r):
+                raise Exception(_("Repository %s does not exist.") % repo)
+            found.extend(sorted(self.__search_repo(r, terms, lang, fields)))
         return found
 
-    def __get_version(self, meta_doc):
-        history = meta_doc.getTag("History")
-        version = history.getTag("Update").getTagData("Version")
-        release = history.getTag("Update").getAttribute("release")
-
-        # TODO Remove None
-        return version, release, None
-
-    def __get_distro_release(self, meta_doc):
-        distro = meta_doc.getTagData("Distribution")
-        release = meta_doc.getTagData("DistributionRelease")
-
-        return distro, release
-
     def get_version_and_distro_release(self, name, repo):
         if not self.has_package(name, repo):
             raise Exception(_("Package %s not found.") % name)
-        pkg_doc = iksemel.parseString(self.pdb.get_item(name, repo).decode())
-        return self.__get_version(pkg_doc) + self.__get_distro_release(pkg_doc)
+
+        record = self.get_package_record(name, repo)
+        # TODO Remove None
+        return (
+            record.version,
+            record.release,
+            None,
+            record.distribution,
+            record.distributionRelease,
+        )
 
     def get_version(self, name, repo):
         if not self.has_package(name, repo):
             raise Exception(_("Package %s not found.") % name)
 
-        pkg_doc = iksemel.parseString(self.pdb.get_item(name, repo).decode())
-        return self.__get_version(pkg_doc)
+        record = self.get_package_record(name, repo)
+        # TODO Remove None
+        return record.version, record.release, None
 
     def get_package_repo(self, name, repo=None):
-        pkg, repo = self.pdb.get_item_repo(name, repo)
+        """Return the decoded package and its repository.
+
+        Decoded packages are shared through an LRU cache and returned as
+        shallow copies, so callers may set their attributes but must not
+        modify the lists they hold."""
+        cached = self.package_cache.get((name, repo))
+        if cached:
+            package, pkg_repo = cached
+            return copy.copy(package), pkg_repo
+
+        pkg, pkg_repo = self.pdb.get_item_repo(name, repo)
         package = pisi.metadata.Package()
         package.parse(pkg)
-        return package, repo
+        self.package_cache.add((name, repo), (package, pkg_repo))
+        return copy.copy(package), pkg_repo
 
     def which_repo(self, name):
         return self.pdb.which_repo(name)
@@ -0,0 +1,185 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Memory mapped on-disk package index.
+
+One index file is kept per repository. It holds the compressed <Package>
+nodes back to back, followed by a name table sorted by package name, so a
+lookup only touches the pages of the table entries it bisects and of the
+records it actually reads. The generation is an opaque stamp given by the
+writer, to tell which write of the index a cached reference belongs to.
+
+Layout, all integers little endian:
+
+    header   magic, format, generation, entry count, table offset
+    records  zlib compressed <Package> nodes
+    table    entry count * entry offset, followed by the entries
+    entry    name length, record offset, record length, utf-8 name
+"""
+
+import mmap
+import os
+import struct
+
+import pisi
+import pisi.context as ctx
+from pisi import translate as _
+
+MAGIC = b"EOPKGIDX"
+FORMAT = 2
+
+_header = struct.Struct("<8sIQIQ")
+_offset = struct.Struct("<Q")
+_entry = struct.Struct("<HQI")
+
+
+class Error(pisi.Error):
+    pass
+
+
+def write(path, items, generation=0):
+    """Write the given (name, data) pairs into a new index file.
+
+    The file is written next to its final location and renamed over it, so
+    processes which still have the old index mapped are not disturbed."""
+
+    items = sorted((name.encode(), data) for name, data in items)
+
+    tmp = path + ctx.const.temporary_suffix
+    with open(tmp, "wb") as f:
+        f.write(_header.pack(MAGIC, FORMAT, generation, 0, 0))
+
+        records = []
+        pos = _header.size
+        for name, data in items:
+            f.write(data)
+            records.append((pos, len(data)))
+            pos += len(data)
+
+        table = pos
+        pos += _offset.size * len(items)
+        for name, data in items:
+            f.write(_offset.pack(pos))
+            pos += _entry.size + len(name)
+
+        for (name, data), (offset, length) in zip(items, records):
+            f.write(_entry.pack(len(name), offset, length))
+            f.write(name)
+
+        f.seek(0)
+        f.write(_header.pack(MAGIC, FORMAT, generation, len(items), table))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(tmp, path)
+
+
+def generation(path):
+    """Return the generation stamp of the index file at path"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_header.size)
+    except IOError as e:
+        raise Error(_("Cannot open package index %s: %s") % (path, e))
+
+    if len(header) != _header.size:
+        raise Error(_("Package index %s is corrupt or outdated.") % path)
+    magic, fmt, stamp, count, table = _header.unpack(header)
+    if magic != MAGIC or fmt != FORMAT:
+        raise Error(_("Package index %s is corrupt or outdated.") % path)
+    return stamp
+
+
+class PackageIndex(object):
+    """Read-only mapping of package names to their stored records.
+
+    The file is mapped on first access. Only the path survives pickling,
+    so the object can live inside the pickled PackageDB cache."""
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._count = 0
+        self._table = 0
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __open(self):
+        if self._map is None:
+            try:
+                with open(self.path, "rb") as f:
+                    _map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (IOError, ValueError) as e:
+                raise Error(_("Cannot open package index %s: %s") % (self.path, e))
+
+            magic, fmt, stamp, self._count, self._table = _header.unpack_from(_map, 0)
+            if magic != MAGIC or fmt != FORMAT:
+                _map.close()
+                raise Error(_("Package index %s is corrupt or outdated.") % self.path)
+            self._map = _map
+
+        return self._map
+
+    def __entry(self, i):
+        (pos,) = _offset.unpack_from(self._map, self._table + i * _offset.size)
+        length, offset, size = _entry.unpack_from(self._map, pos)
+        start = pos + _entry.size
+        return self._map[start : start + length], offset, size
+
+    def __find(self, name):
+        if not isinstance(name, str):
+            return None
+
+        self.__open()
+        key = name.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry, offset, size = self.__entry(mid)
+            if entry < key:
+                lo = mid + 1
+            elif entry > key:
+                hi = mid
+            else:
+                return offset, size
+
+        return None
+
+    def __contains__(self, name):
+        return self.__find(name) is not None
+
+    def __getitem__(self, name):
+        record = self.__find(name)
+        if record is None:
+            raise KeyError(name)
+
+        offset, size = record
+        return self._map[offset : offset + size]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        self.__open()
+        return self._count
+
+    def __iter__(self):
+        self.__open()
+        for i in range(self._count):
+            yield self.__entry(i)[0].decode()
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        self.__open()
+        for i in range(self._count):
+            name, offset, size = self.__entry(i)
+            yield name.decode(), self._map[offset : offset + size]
@@ -0,0 +1,171 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Inverted index of package summaries and descriptions.
+
+Texts are split into lowercase word tokens, and every token maps to the set
+of packages using it, per field and language. A search term made of word
+characters only can not span two tokens, so the packages containing it are
+found by searching the token vocabulary instead of matching every package
+text. The vocabulary is joined into a single string, searched with str.find,
+and matches are mapped back to their tokens by bisecting the token offsets.
+Terms with other characters are patterns the index can not answer, callers
+have to fall back to regular expressions for those.
+"""
+
+import bisect
+import os
+import pickle
+import re
+
+import pisi.context as ctx
+
+_token = re.compile(r"\w+")
+
+FIELDS = ("summary", "desc")
+
+
+def tokenize(text):
+    return set(_token.findall(text.lower()))
+
+
+def localized_text(node, tag):
+    """Return the {lang: text} dict of a localized tag of the given node"""
+    texts = {}
+    for x in node.tags(tag):
+        child = x.firstChild()
+        if child is not None:
+            texts[x.getAttribute("xml:lang") or "en"] = child.data()
+    return texts
+
+
+def is_plain(term):
+    return _token.fullmatch(term) is not None
+
+
+class SearchIndex(object):
+    """Word index of the packages of one repository.
+
+    With a path the index is read from disk on first use, only the path is
+    kept when it is pickled along with the PackageDB cache."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.__names = set()
+        self.__tokens = {}
+        self.__vocabularies = {}
+        self.__loaded = path is None
+
+    def __getstate__(self):
+        if self.path:
+            return {"path": self.path}
+        return {"path": None, "names": self.__names, "tokens": self.__tokens}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+        if self.path is None:
+            self.__names = state["names"]
+            self.__tokens = state["tokens"]
+
+    def __load(self):
+        if not self.__loaded:
+            with open(self.path, "rb") as f:
+                self.__names, self.__tokens = pickle.load(f)
+            self.__loaded = True
+
+    def __vocabulary(self, key):
+        """Return the joined tokens of the given field and language.
+
+        The tokens are returned along with the text they are joined into and
+        their offsets in it."""
+        try:
+            return self.__vocabularies[key]
+        except KeyError:
+            tokens = sorted(self.__tokens.get(key, ()))
+            offsets = []
+            offset = 0
+            for token in tokens:
+                offsets.append(offset)
+                offset += len(token) + 1
+            vocabulary = self.__vocabularies[key] = (
+                "\n".join(tokens),
+                offsets,
+                tokens,
+            )
+            return vocabulary
+
+    def __postings(self, name, node, update):
+        self.__vocabularies.clear()
+        for field, tag in zip(FIELDS, ("Summary", "Description")):
+            for lang, text in localized_text(node, tag).items():
+                tokens = self.__tokens.setdefault((field, lang), {})
+                for token in tokenize(text):
+                    update(tokens, token, name)
+
+    def add(self, name, node):
+        """Index the summaries and descriptions of the given <Package> node"""
+
+        def add(tokens, token, name):
+            tokens.setdefault(token, set()).add(name)
+
+        self.__load()
+        self.__names.add(name)
+        self.__postings(name, node, add)
+
+    def remove(self, name, node):
+        """Drop a package, node being the one it was indexed with"""
+
+        def discard(tokens, token, name):
+            names = tokens.get(token)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del tokens[token]
+
+        self.__load()
+        self.__names.discard(name)
+        self.__postings(name, node, discard)
+
+    def save(self, path):
+        self.__load()
+        tmp = path + ctx.const.temporary_suffix
+        with open(tmp, "wb") as f:
+            pickle.dump((self.__names, self.__tokens), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+        self.path = path
+
+    def names(self):
+        self.__load()
+        return self.__names
+
+    def search(self, term, langs, fields):
+        """Return the set of packages matching term in the given fields.
+
+        None is returned for terms which are not plain words."""
+        if not is_plain(term):
+            return None
+
+        self.__load()
+        term = term.lower()
+        found = set()
+
+        if fields["name"]:
+            found.update(x for x in self.__names if term in x.lower())
+
+        for field in FIELDS:
+            if not fields[field]:
+                continue
+            for lang in langs:
+                tokens = self.__tokens.get((field, lang))
+                if not tokens:
+                    continue
+
+                # Plain terms have no newline, a match lies within one token
+                text, offsets, vocabulary = self.__vocabulary((field, lang))
+                pos = text.find(term)
+                while pos != -1:
+                    i = bisect.bisect_right(offsets, pos) - 1
+                    found |= tokens[vocabulary[i]]
+                    pos = text.find(term, offsets[i] + len(vocabulary[i]) + 1)
+
+        return found
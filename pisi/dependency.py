@@ -6,7 +6,6 @@
 from pisi import translate as _
 
 import pisi.relation
-import pisi.db
 import pisi.pxml.autoxml as autoxml
 
 
@@ -45,24 +44,28 @@ class Dependency(pisi.relation.Relation):
         return pisi.relation.installed_package_satisfies(self)
 
     def satisfied_by_repo(self):
+        import pisi.db
+
         packagedb = pisi.db.packagedb.PackageDB()
         pkgconfig32 = False
         if self.type == "pkgconfig":
-            pkg = packagedb.get_package_by_pkgconfig(self.package)
-            if pkg:
+            name = packagedb.get_pkgconfig_provider(self.package)
+            if name:
+                pkg = packagedb.get_package_record(name)
                 return self.satisfies_relation(pkg.version, pkg.release)
             else:
                 return False
         elif self.type == "pkgconfig32":
-            pkg = packagedb.get_package_by_pkgconfig32(self.package)
-            if pkg:
+            name = packagedb.get_pkgconfig32_provider(self.package)
+            if name:
+                pkg = packagedb.get_package_record(name)
                 return self.satisfies_relation(pkg.version, pkg.release)
             else:
                 return False
         if not packagedb.has_package(self.package):
             return False
         else:
-            pkg = packagedb.get_package(self.package)
+            pkg = packagedb.get_package_record(self.package)
             return self.satisfies_relation(pkg.version, pkg.release)
 
     # Added for AnyDependency, single Dependency always returns False
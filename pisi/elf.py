@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Minimal ELF reader for the dynamic linking information of built files.
+
+Only the section headers, the dynamic section with its string table and the
+notes are read, which is all the build needs to know about the sonames,
+NEEDED entries, library search paths and build IDs of the installed files.
+Results are cached by the inode and modification time of the files until
+clear_cache is called."""
+
+import os
+import struct
+import threading
+
+ELF_MAGIC = b"\x7fELF"
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+NT_GNU_BUILD_ID = 3
+
+# ELF class -> (header, section header, dynamic entry) formats
+_formats = {
+    1: ("HHIIIIIHHHHHH", "IIIIIIIIII", "iI"),
+    2: ("HHIQQQIHHHHHH", "IIQQQQIIQQ", "qQ"),
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class ElfFile(object):
+    """Dynamic linking information and build ID of an ELF file"""
+
+    def __init__(self, bits, type):
+        self.bits = bits
+        self.type = type
+        self.needed = []
+        self.soname = None
+        self.rpath = []
+        self.runpath = []
+        self.build_id = None
+
+    def search_paths(self, origin):
+        """Return the RPATH and RUNPATH directories, $ORIGIN being origin"""
+        paths = []
+        for path in self.rpath + self.runpath:
+            path = path.replace("${ORIGIN}", origin).replace("$ORIGIN", origin)
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+
+def _read_at(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("truncated ELF file")
+    return data
+
+
+def _parse(f):
+    ident = f.read(16)
+    if len(ident) != 16 or ident[:4] != ELF_MAGIC or ident[4] not in _formats:
+        return None
+
+    order = "<" if ident[5] == 1 else ">"
+    header_fmt, section_fmt, dynamic_fmt = (order + x for x in _formats[ident[4]])
+
+    header = struct.unpack(header_fmt, _read_at(f, 16, struct.calcsize(header_fmt)))
+    e_type, e_shoff, e_shentsize, e_shnum = header[0], header[5], header[10], header[11]
+
+    elf = ElfFile(32 if ident[4] == 1 else 64, e_type)
+    if not e_shoff:
+        return elf
+
+    def section(index):
+        data = _read_at(f, e_shoff + index * e_shentsize, struct.calcsize(section_fmt))
+        return struct.unpack(section_fmt, data)
+
+    if e_shnum == 0:
+        # More sections than fit in the header, the count is in section 0
+        e_shnum = section(0)[5]
+
+    sections = [section(i) for i in range(e_shnum)]
+
+    for sh in sections:
+        sh_type, sh_offset, sh_size, sh_link, sh_align = (
+            sh[1],
+            sh[4],
+            sh[5],
+            sh[6],
+            sh[8],
+        )
+
+        if sh_type == SHT_DYNAMIC and sh_link < len(sections):
+            strtab = sections[sh_link]
+            strings = _read_at(f, strtab[4], strtab[5])
+
+            def string(offset):
+                return strings[offset : strings.index(b"\0", offset)].decode(
+                    "utf-8", "replace"
+                )
+
+            data = _read_at(f, sh_offset, sh_size)
+            for tag, value in struct.iter_unpack(
+                dynamic_fmt, data[: len(data) - len(data) % struct.calcsize(dynamic_fmt)]
+            ):
+                if tag == DT_NULL:
+                    break
+                elif tag == DT_NEEDED:
+                    elf.needed.append(string(value))
+                elif tag == DT_SONAME:
+                    elf.soname = string(value)
+                elif tag == DT_RPATH:
+                    elf.rpath.extend(x for x in string(value).split(":") if x)
+                elif tag == DT_RUNPATH:
+                    elf.runpath.extend(x for x in string(value).split(":") if x)
+
+        elif sh_type == SHT_NOTE and elf.build_id is None:
+            align = 8 if sh_align == 8 else 4
+            data = _read_at(f, sh_offset, sh_size)
+            pos = 0
+            while pos + 12 <= len(data):
+                namesz, descsz, note_type = struct.unpack_from(order + "III", data, pos)
+                name_pos = pos + 12
+                desc_pos = name_pos + (namesz + align - 1) // align * align
+                name = data[name_pos : name_pos + namesz]
+                if note_type == NT_GNU_BUILD_ID and name == b"GNU\0":
+                    elf.build_id = data[desc_pos : desc_pos + descsz].hex()
+                    break
+                pos = desc_pos + (descsz + align - 1) // align * align
+
+    return elf
+
+
+def read(path):
+    """Return the ElfFile of the file at path, None if it is not an ELF file"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+
+    elf = None
+    if os.path.isfile(path):
+        try:
+            with open(path, "rb") as f:
+                elf = _parse(f)
+        except (OSError, ValueError, IndexError, struct.error):
+            elf = None
+
+    with _cache_lock:
+        _cache[key] = elf
+    return elf
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -9,8 +9,12 @@ knows what."""
 # python standard library modules
 import base64
 import contextlib
+import hashlib
+import http.client
 import os
 import shutil
+import ssl
+import threading
 import time
 import urllib.request, urllib.error, urllib.parse
 
@@ -27,9 +31,116 @@ class FetchError(pisi.Error):
     pass
 
 
+class NotFoundError(FetchError):
+    pass
+
+
+class HTTPError(IOError):
+    """Error status answered by an HTTP server"""
+
+    def __init__(self, code, reason):
+        IOError.__init__(self, "HTTP Error %d: %s" % (code, reason))
+        self.code = code
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP connections shared by all the fetchers.
+
+    Idle connections are kept per scheme and host, and the next request to
+    the same server reuses one of them instead of going through a new TCP
+    and TLS handshake. Whether a host honours range requests is remembered
+    as well, so resuming a download needs no probing request."""
+
+    max_idle = 8
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.range_support = {}
+
+    def __connect(self, key, timeout):
+        scheme, netloc = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(
+                netloc, timeout=timeout, context=ssl.create_default_context()
+            )
+        return http.client.HTTPConnection(netloc, timeout=timeout)
+
+    def __acquire(self, key, timeout):
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self.__connect(key, timeout), False
+
+    def release(self, key, conn, response):
+        """Give back a connection whose response was read completely"""
+        if response.will_close:
+            conn.close()
+            return
+
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for conn in idle:
+                    conn.close()
+            self.idle = {}
+
+    def __send(self, key, path, headers, timeout):
+        conn, reused = self.__acquire(key, timeout)
+        while True:
+            try:
+                conn.request("GET", path, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if not reused:
+                    raise IOError(e)
+                # The server has dropped the idle connection, open a new one
+                conn, reused = self.__connect(key, timeout), False
+
+    def request(self, uri, headers, timeout=15, redirects=5):
+        """Send a GET request, following redirects.
+
+        Returns the key of the server which answered, the connection and
+        the response, which has to be read before releasing the connection."""
+        for redirect in range(redirects + 1):
+            parts = urllib.parse.urlsplit(uri)
+            key = (parts.scheme, parts.netloc)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            conn, response = self.__send(key, path, headers, timeout)
+
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                self.release(key, conn, response)
+                uri = urllib.parse.urljoin(uri, location)
+                continue
+
+            if response.status >= 400:
+                response.read()
+                self.release(key, conn, response)
+                raise HTTPError(response.status, response.reason)
+
+            return key, conn, response
+
+        raise IOError(_("Too many redirects for %s") % uri)
+
+
+connection_pool = ConnectionPool()
+
+
 class FetchHandler:
-    def __init__(self, url, archive, bandwidth_limit, start_time):
+    def __init__(self, url, archive, bandwidth_limit, start_time, listener=None):
         self.url = url
+        self.listener = listener
         self.percent = None
         self.rate = 0.0
         self.size = 0
@@ -76,7 +187,10 @@ class FetchHandler:
                     ]
                 )
 
-        self._update_ui()
+        if self.listener:
+            self.listener(self.url, self.size, self.total_size)
+        else:
+            self._update_ui()
         self._limit_bandwidth()
 
     def _limit_bandwidth(self):
@@ -103,9 +217,17 @@ class FetchHandler:
 
 class Fetcher:
     """Fetcher can fetch a file from various sources using various
-    protocols."""
+    protocols.
 
-    def __init__(self, url, destdir="/tmp", destfile=None):
+    A listener, if given, is called with the url, the downloaded and the
+    total size instead of displaying the progress of the file, so several
+    fetchers can run in parallel threads. Without retry, a failed request
+    raises FetchError at once, NotFoundError if the file does not exist.
+
+    Downloaded bytes are hashed as they arrive, the sha1 hash of the
+    fetched file is left in the hash attribute and stored along with it."""
+
+    def __init__(self, url, destdir="/tmp", destfile=None, listener=None, retry=True):
         if not isinstance(url, pisi.uri.URI):
             url = pisi.uri.URI(url)
 
@@ -116,6 +238,11 @@ class Fetcher:
         self.destdir = destdir
         self.destfile = destfile
         self.progress = None
+        self.listener = listener
+        self.retry = retry
+        self.opener = None
+        self.hash = None
+        self.sha1 = None
 
         self.archive_file = os.path.join(destdir, destfile or url.filename())
         self.partial_file = (
@@ -156,12 +283,20 @@ class Fetcher:
                     self.partial_file,
                     self._get_bandwidth_limit(),
                     self.start_time,
+                    self.listener,
                 )
 
-                proxy = urllib.request.ProxyHandler(self._get_proxies())
-                opener = urllib.request.build_opener(proxy)
+                proxies = self._get_proxies()
+                if self.url.scheme() in ("http", "https") and not proxies:
+                    self._fetch_pooled(fetch_handler)
+                    success = True
+                    continue
+
+                # The opener is not installed globally, fetchers may be
+                # running in parallel
+                proxy = urllib.request.ProxyHandler(proxies)
+                self.opener = opener = urllib.request.build_opener(proxy)
                 opener.addheaders = self._get_headers()
-                urllib.request.install_opener(opener)
                 has_range_support = self._test_range_support()
 
                 if has_range_support and os.path.exists(self.partial_file):
@@ -169,36 +304,25 @@ class Fetcher:
                     opener.addheaders.append(("Range", "bytes=%s-" % partial_file_size))
 
                 with contextlib.closing(
-                    urllib.request.urlopen(self.url.get_uri(), timeout=15)
+                    opener.open(self.url.get_uri(), timeout=15)
                 ) as fp:
                     headers = fp.info()
 
                     if self.url.is_local_file():
                         return os.path.normpath(self.url.path())
 
-                    if has_range_support:
-                        tfp = open(self.partial_file, "ab")
-                    else:
-                        tfp = open(self.partial_file, "wb")
-
-                    with tfp:
-                        bs = 1024 * 8
-                        size = -1
-                        read = 0
-                        blocknum = 0
-                        if "content-length" in headers:
-                            size = int(headers["Content-Length"])
-                        fetch_handler.update(blocknum, bs, size)
-                        while True:
-                            block = fp.read(bs)
-                            if not block:
-                                break
-                            read += len(block)
-                            tfp.write(block)
-                            blocknum += 1
-                            fetch_handler.update(blocknum, bs, size)
+                    with self._open_partial(has_range_support) as tfp:
+                        self._receive(fp, headers, tfp, fetch_handler)
                     success = True
             except IOError as e:
+                if not self.retry:
+                    if getattr(e, "code", None) == 404:
+                        raise NotFoundError(
+                            _('File not found: "%s"') % self.url.get_uri()
+                        )
+                    raise FetchError(
+                        _('Failed to fetch file "%s": %s') % (self.url.get_uri(), e)
+                    )
                 attempt += 1
                 if attempt == self._get_retry_attempts() + 1:
                     raise FetchError(
@@ -220,9 +344,85 @@ class Fetcher:
             )
 
         shutil.move(self.partial_file, self.archive_file)
+        self.hash = self.sha1.hexdigest()
+        util.store_sha1(self.archive_file, self.hash)
 
         return self.archive_file
 
+    def _open_partial(self, resume):
+        """Open the partial file, hashing what is already downloaded"""
+        self.sha1 = hashlib.sha1()
+        if not resume:
+            return open(self.partial_file, "wb")
+
+        tfp = open(self.partial_file, "a+b")
+        tfp.seek(0)
+        while True:
+            block = tfp.read(256 * 1024)
+            if not block:
+                break
+            self.sha1.update(block)
+        return tfp
+
+    def _receive(self, fp, headers, tfp, fetch_handler):
+        bs = 1024 * 8
+        size = -1
+        blocknum = 0
+        if "content-length" in headers:
+            size = int(headers["Content-Length"])
+        fetch_handler.update(blocknum, bs, size)
+        while True:
+            block = fp.read(bs)
+            if not block:
+                break
+            tfp.write(block)
+            self.sha1.update(block)
+            blocknum += 1
+            fetch_handler.update(blocknum, bs, size)
+
+    def _fetch_pooled(self, fetch_handler):
+        """Fetch over a pooled keep-alive connection.
+
+        A partial file is resumed with a range request unless the host is
+        known not to support them. The answer tells whether it does, there
+        is no separate probing request."""
+        headers = dict(self._get_headers())
+        host = urllib.parse.urlsplit(self.url.get_uri()).netloc
+
+        exist_size = 0
+        if os.path.exists(self.partial_file):
+            if connection_pool.range_support.get(host, True):
+                exist_size = os.path.getsize(self.partial_file)
+                headers["Range"] = "bytes=%d-" % exist_size
+            else:
+                os.remove(self.partial_file)
+
+        try:
+            key, conn, response = connection_pool.request(self.url.get_uri(), headers)
+        except IOError as e:
+            if exist_size and "HTTP Error 416" in str(e):
+                # The partial file can not be resumed, start over
+                os.remove(self.partial_file)
+            raise
+
+        try:
+            if exist_size:
+                connection_pool.range_support[host] = response.status == 206
+
+            if response.status != 206:
+                fetch_handler.exist_size = 0
+
+            with self._open_partial(response.status == 206) as tfp:
+                self._receive(response, response.headers, tfp, fetch_handler)
+        except http.client.HTTPException as e:
+            conn.close()
+            raise IOError(e)
+        except BaseException:
+            conn.close()
+            raise
+
+        connection_pool.release(key, conn, response)
+
     def _get_headers(self):
         headers = []
         if self.url.auth_info():
@@ -283,9 +483,7 @@ class Fetcher:
             return False
 
         try:
-            file_obj = urllib.request.urlopen(
-                urllib.request.Request(self.url.get_uri())
-            )
+            file_obj = self.opener.open(urllib.request.Request(self.url.get_uri()))
         except urllib.error.URLError:
             ctx.ui.debug(
                 _(
@@ -314,3 +512,15 @@ def fetch_url(url, destdir, progress=None, destfile=None):
     fetch = Fetcher(url, destdir, destfile)
     fetch.progress = progress
     fetch.fetch()
+
+
+def fetch_optional(url, destdir, destfile=None):
+    """Fetch a file the server may not have, with a single request.
+
+    Returns the path of the fetched file, or None if the server answered
+    that there is no such file."""
+    fetch = Fetcher(url, destdir, destfile, retry=False)
+    try:
+        return fetch.fetch()
+    except NotFoundError:
+        return None
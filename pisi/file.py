@@ -9,6 +9,7 @@ like all pisi classes, it has been programmed in a non-restrictive way
 """
 
 import bz2
+import hashlib
 import lzma
 import os
 import shutil
@@ -46,6 +47,33 @@ class InvalidSignature(pisi.Error):
         self.url = url
 
 
+class HashedFile(object):
+    """Binary output file computing the sha1 of the data written to it"""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.hash = hashlib.sha1()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def isatty(self):
+        return self.file.isatty()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
 class File:
     # Compression types
     COMPRESSION_TYPE_AUTO = 0
@@ -103,7 +131,12 @@ class File:
         compress=None,
         sign=None,
         copylocal=False,
+        sha1=None,
     ):
+        """Download uri into transfer_dir and return the local file.
+
+        With sha1sum, the file is checked against its published .sha1sum
+        file, or against sha1 if the caller already fetched it."""
         assert isinstance(uri, pisi.uri.URI)
 
         pisi.util.ensure_dirs(transfer_dir)
@@ -113,7 +146,10 @@ class File:
 
         origfile = pisi.util.join_path(transfer_dir, uri.filename())
 
-        if sha1sum:
+        sha1filename = None
+        if sha1sum and sha1:
+            newsha1 = sha1
+        elif sha1sum:
             sha1filename = File.download(
                 pisi.uri.URI(uri.get_uri() + ".sha1sum"), transfer_dir
             )
@@ -129,7 +165,7 @@ class File:
             # if os.exists(oldsha1fn):
             # oldsha1 = file(oldsha1fn).readlines()[0]
             if sha1sum and os.path.exists(origfile):
-                oldsha1 = pisi.util.sha1_file(origfile)
+                oldsha1 = pisi.util.cached_sha1_file(origfile)
                 if newsha1 == oldsha1:
                     # early terminate, we already got it ;)
                     raise AlreadyHaveException(uri, origfile)
@@ -156,7 +192,7 @@ class File:
 
         def clean_temporary():
             temp_files = []
-            if sha1sum:
+            if sha1filename:
                 temp_files.append(sha1filename)
             if check_integrity:
                 temp_files.append(localfile)
@@ -167,7 +203,7 @@ class File:
                     pass
 
         if sha1sum:
-            if pisi.util.sha1_file(localfile) != newsha1:
+            if pisi.util.cached_sha1_file(localfile) != newsha1:
                 clean_temporary()
                 raise Error(_("File integrity of %s compromised.") % uri)
 
@@ -204,12 +240,21 @@ class File:
             if self.mode == File.read:
                 localfile = File.decompress(localfile, self.compress)
 
+        self.localfile = localfile
         if self.mode == File.read:
-            access = "r"
+            self.__file__ = open(localfile, "r")
         else:
-            access = "w"
-        self.__file__ = open(localfile, access)
-        self.localfile = localfile
+            # Written data goes through the compressors and hashes as it
+            # comes, the output is never held in memory as a whole
+            self.__file__ = HashedFile(localfile)
+            self.__compressors = []
+            ctypes = self.compress or 0
+            if ctypes & File.COMPRESSION_TYPE_XZ:
+                output = HashedFile(localfile + ".xz")
+                self.__compressors.append((output, lzma.open(output, "w")))
+            if ctypes & File.COMPRESSION_TYPE_BZ2:
+                output = HashedFile(localfile + ".bz2")
+                self.__compressors.append((output, bz2.open(output, "w")))
 
     def local_file(self):
         "returns the underlying file object"
@@ -217,41 +262,44 @@ class File:
 
     def close(self, delete_transfer=False):
         "this method must be called at the end of operation"
+        if self.mode == File.read:
+            self.__file__.close()
+            return
+
+        for output, compressor in self.__compressors:
+            compressor.close()
+            output.close()
         self.__file__.close()
-        if self.mode == File.write:
-            compressed_files = []
-            ctypes = self.compress or 0
-            if ctypes & File.COMPRESSION_TYPE_XZ:
-                compressed_file = self.localfile + ".xz"
-                compressed_files.append(compressed_file)
-                lzma_file = lzma.open(compressed_file, "w")
-                lzma_file.write(open(self.localfile, "r").read().encode())
-                lzma_file.close()
 
-            if ctypes & File.COMPRESSION_TYPE_BZ2:
-                compressed_file = self.localfile + ".bz2"
-                compressed_files.append(compressed_file)
-                bz2.open(compressed_file, "w").write(
-                    open(self.localfile, "r").read().encode()
-                )
+        outputs = [self.__file__] + [x[0] for x in self.__compressors]
+        compressed_files = [x.file.name for x in outputs[1:]]
+
+        if self.sha1sum:
+            for output in outputs:
+                with open(output.file.name + ".sha1sum", "w") as cs:
+                    cs.write(output.hash.hexdigest())
+
+        if self.sign == File.detached:
+            if pisi.util.run_batch("gpg --detach-sig " + self.localfile)[0]:
+                raise Error(_("ERROR: gpg --detach-sig %s failed") % self.localfile)
+            for compressed_file in compressed_files:
+                if pisi.util.run_batch("gpg --detach-sig " + compressed_file)[0]:
+                    raise Error(
+                        _("ERROR: gpg --detach-sig %s failed") % compressed_file
+                    )
+
+    def discard(self):
+        "close a file being written and remove its outputs"
+        outputs = [self.__file__]
+        if self.mode == File.write:
+            for output, compressor in self.__compressors:
+                compressor.close()
+                outputs.append(output)
 
-            if self.sha1sum:
-                sha1 = pisi.util.sha1_file(self.localfile)
-                with open(self.localfile + ".sha1sum", "w") as cs:
-                    cs.write(sha1)
-                for compressed_file in compressed_files:
-                    sha1 = pisi.util.sha1_file(compressed_file)
-                    with open(compressed_file + ".sha1sum", "w") as cs:
-                        cs.write(sha1)
-
-            if self.sign == File.detached:
-                if pisi.util.run_batch("gpg --detach-sig " + self.localfile)[0]:
-                    raise Error(_("ERROR: gpg --detach-sig %s failed") % self.localfile)
-                for compressed_file in compressed_files:
-                    if pisi.util.run_batch("gpg --detach-sig " + compressed_file)[0]:
-                        raise Error(
-                            _("ERROR: gpg --detach-sig %s failed") % compressed_file
-                        )
+        for output in outputs:
+            output.close()
+            if self.mode == File.write:
+                os.unlink(output.file.name)
 
     @staticmethod
     def check_signature(uri, transfer_dir, sign=detached):
@@ -302,16 +350,26 @@ class File:
         return self.__file__
 
     def seek(self, offset, whence=0):
+        # Written data has already gone into the hashes and compressors
+        if self.mode == File.write:
+            raise Error(_("Cannot seek in %s, it is being written") % self.localfile)
         self.__file__.seek(offset, whence)
 
     def tell(self):
         return self.__file__.tell()
 
     def truncate(self):
+        if self.mode == File.write:
+            raise Error(_("Cannot truncate %s, it is being written") % self.localfile)
         self.__file__.truncate()
 
-    def write(self, str):
-        self.__file__.write(str)
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.__file__.write(data)
+        for output, compressor in self.__compressors:
+            compressor.write(data)
 
     def writelines(self, sequence):
-        self.__file__.writelines(sequence)
+        for data in sequence:
+            self.write(data)
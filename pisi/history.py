@@ -1,6 +1,7 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import marshal
 import os
 import time
 from functools import cmp_to_key
@@ -9,6 +10,11 @@ from pisi import context as ctx
 from pisi import translate as _
 from pisi.pxml import autoxml, xmlfile
 
+# Suffix of the journal an operation is recorded in until it is compacted
+# into its xml file, and the number of records written between two fsyncs
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_SYNC_INTERVAL = 32
+
 
 class PackageInfo(metaclass=autoxml.autoxml):
     a_version = [autoxml.String, autoxml.MANDATORY]
@@ -92,10 +98,20 @@ class Operation(metaclass=autoxml.autoxml):
 
 
 class History(xmlfile.XmlFile, metaclass=autoxml.autoxml):
+    """Record of one operation.
+
+    Changes are appended to a journal next to the history file as they are
+    made, so every package of a long operation is not followed by a rewrite
+    of the whole file. The journal is compacted into the xml file when the
+    history is updated."""
+
     tag = "PISI"
 
     t_Operation = [Operation, autoxml.MANDATORY]
 
+    journal = None
+    unsynced = 0
+
     def create(self, operation):
         if operation not in [
             "upgrade",
@@ -116,12 +132,72 @@ class History(xmlfile.XmlFile, metaclass=autoxml.autoxml):
         self.operation.time = "%02d:%02d" % (hour, minute)
         self.operation.no = opno
 
+    def history_path(self):
+        return os.path.join(ctx.config.history_dir(), self.histfile)
+
+    def journal_path(self):
+        return self.history_path() + JOURNAL_SUFFIX
+
+    def __log(self, *record):
+        if self.journal is None:
+            self.journal = open(self.journal_path(), "ab")
+            if not self.journal.tell():
+                # Also note what the history file already holds, the records
+                # of a journal compacted just before a crash are not repeated
+                operation = self.operation
+                header = (
+                    "operation",
+                    operation.type,
+                    operation.date,
+                    operation.time,
+                    len(operation.packages),
+                    len(operation.repos),
+                )
+                marshal.dump(header, self.journal)
+        marshal.dump(record, self.journal)
+        self.journal.flush()
+
+        self.unsynced += 1
+        if self.unsynced >= JOURNAL_SYNC_INTERVAL:
+            self.sync_journal()
+
+    def sync_journal(self):
+        if self.journal is not None and self.unsynced:
+            os.fsync(self.journal.fileno())
+            self.unsynced = 0
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.sync_journal()
+            self.journal.close()
+            self.journal = None
+
+    def apply(self, record):
+        """Apply a journal record to the operation"""
+        operation = self.operation
+        if record[0] == "operation":
+            operation.type, operation.date, operation.time = record[1:4]
+            del operation.packages[record[4] :]
+            del operation.repos[record[5] :]
+        elif record[0] == "repo":
+            repo = Repo()
+            repo.operation, repo.name, repo.uri = record[1:]
+            operation.repos.append(repo)
+        elif record[0] == "package":
+            package = Package()
+            package.operation, package.type, package.name = record[1:4]
+            package.before = package.after = None
+            for attr, info in zip(("before", "after"), record[4:]):
+                if info:
+                    histInfo = PackageInfo()
+                    histInfo.version, histInfo.release = info
+                    setattr(package, attr, histInfo)
+            operation.packages.append(package)
+
     def update_repo(self, name, uri, operation=None):
-        repo = Repo()
-        repo.operation = operation
-        repo.name = name
-        repo.uri = uri
-        self.operation.repos.append(repo)
+        record = ("repo", operation, name, uri)
+        self.__log(*record)
+        self.apply(record)
 
     # @param otype is currently only used to hold if an upgrade is from "delta"
     def add(self, pkgBefore=None, pkgAfter=None, operation=None, otype=None):
@@ -135,32 +211,53 @@ class History(xmlfile.XmlFile, metaclass=autoxml.autoxml):
         ]:
             raise Exception(_("Unknown package operation"))
 
-        package = Package()
-        package.operation = operation
-        package.type = otype
-        package.name = (pkgAfter and pkgAfter.name) or (pkgBefore and pkgBefore.name)
-
-        if not pkgBefore:
-            package.before = None
-
-        if not pkgAfter:
-            package.after = None
-
-        for histInfo, pkgInfo in [
-            (package.before, pkgBefore),
-            (package.after, pkgAfter),
-        ]:
-            if pkgInfo:
-                histInfo.version = str(pkgInfo.version)
-                histInfo.release = str(pkgInfo.release)
-
-        self.operation.packages.append(package)
+        name = (pkgAfter and pkgAfter.name) or (pkgBefore and pkgBefore.name)
+        before, after = [
+            (str(pkgInfo.version), str(pkgInfo.release)) if pkgInfo else None
+            for pkgInfo in (pkgBefore, pkgAfter)
+        ]
+
+        record = ("package", operation, otype, name, before, after)
+        self.__log(*record)
+        self.apply(record)
+
+    def records(self):
+        """Return the operation as a list of journal records"""
+        operation = self.operation
+        records = [
+            ("operation", operation.type, operation.date, operation.time, 0, 0)
+        ]
+        for package in operation.packages:
+            before, after = [
+                (info.version, info.release) if info else None
+                for info in (package.before, package.after)
+            ]
+            records.append(
+                ("package", package.operation, package.type, package.name, before, after)
+            )
+        for repo in operation.repos:
+            records.append(("repo", repo.operation, repo.name, repo.uri))
+        return records
 
     def update(self):
-        self.write(os.path.join("%s/%s", ctx.config.history_dir(), self.histfile))
+        """Write the history file and drop the journal it replaces"""
+        self.close_journal()
+        path = self.history_path()
+        tmp = path + ctx.const.temporary_suffix
+        self.write(tmp)
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+
+        if os.path.exists(self.journal_path()):
+            os.unlink(self.journal_path())
 
     def _get_latest(self):
-        files = [h for h in os.listdir(ctx.config.history_dir()) if h.endswith(".xml")]
+        files = [
+            h
+            for h in os.listdir(ctx.config.history_dir())
+            if h.endswith(".xml") or h.endswith(".xml" + JOURNAL_SUFFIX)
+        ]
         if not files:
             return "001"
 
@@ -169,3 +266,32 @@ class History(xmlfile.XmlFile, metaclass=autoxml.autoxml):
         )
         no, opxml = files[-1].split("_")
         return "%03d" % (int(no) + 1)
+
+
+def recover_journal(journal):
+    """Compact the journal of an interrupted operation into its history file"""
+    path = journal[: -len(JOURNAL_SUFFIX)]
+    hist = History(path) if os.path.exists(path) else History()
+    hist.histfile = os.path.basename(path)
+
+    with open(journal, "rb") as f:
+        while True:
+            try:
+                record = marshal.load(f)
+            except (EOFError, ValueError, TypeError):
+                break
+            hist.apply(record)
+
+    if hist.operation.type:
+        hist.update()
+    else:
+        os.unlink(journal)
+
+
+def load_operation(no, records):
+    """Return the operation of the given number built from its records"""
+    hist = History()
+    for record in records:
+        hist.apply(record)
+    hist.operation.no = no
+    return hist.operation
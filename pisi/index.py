@@ -3,6 +3,11 @@
 
 """eopkg source/package index"""
 
+import difflib
+import glob
+import hashlib
+import json
+import lzma
 import os
 import shutil
 import multiprocessing
@@ -16,17 +21,95 @@ import pisi.metadata as metadata
 import pisi.util as util
 import pisi.package
 import pisi.pxml.xmlfile as xmlfile
+import pisi.pxml.xmlext as xmlext
+import pisi.fetcher
 import pisi.file
+import pisi.uri
 import pisi.pxml.autoxml as autoxml
 import pisi.component as component
 import pisi.group as group
-import pisi.operations.build
 
 
 class Error(pisi.Error):
     pass
 
 
+DELTA_MAGIC = b"EOPKGINDEXDELTA 1\n"
+
+
+class IndexCache(object):
+    """Index records of the files of a repository directory.
+
+    Records are kept between index runs in a JSON file under the cache
+    directory, named after the real path of the repository directory, as
+    anyone uploading to the repository could plant files in it. They are
+    keyed by the path of the file relative to the directory and only used
+    while the size, mtime and inode of the file are unchanged, so only new
+    or changed packages have to be read and hashed again. Entries of files
+    which are not looked up during a run are dropped on save."""
+
+    def __init__(self, repo_uri):
+        self.repo_uri = repo_uri
+        self.path = util.join_path(
+            ctx.config.cache_root_dir(),
+            ctx.const.index_cache,
+            "%s.json"
+            % hashlib.sha1(os.path.realpath(repo_uri).encode()).hexdigest(),
+        )
+        self.old = {}
+        self.new = {}
+
+        try:
+            with open(self.path) as f:
+                version, entries = json.load(f)
+            if version == pisi.__version__:
+                self.old = dict(
+                    (key, (tuple(stamp), record))
+                    for key, (stamp, record) in entries.items()
+                )
+        except (IOError, ValueError, TypeError, AttributeError):
+            pass
+
+    @staticmethod
+    def stamp(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def __key(self, path):
+        return os.path.relpath(path, self.repo_uri)
+
+    def get(self, path):
+        """Return the record of an unchanged file or None"""
+        key = self.__key(path)
+        entry = self.new.get(key) or self.old.get(key)
+        if entry is None or entry[0] != self.stamp(path):
+            return None
+        self.new[key] = entry
+        return entry[1]
+
+    def set(self, path, stamp, record):
+        """Store the record of a file, stamp being taken before reading it"""
+        self.new[self.__key(path)] = (stamp, record)
+
+    def sha1(self, path):
+        """Return the hash of a file, from the cache if it is unchanged"""
+        sha1 = self.get(path)
+        if sha1 is None:
+            stamp = self.stamp(path)
+            sha1 = util.sha1_file(path)
+            self.set(path, stamp, sha1)
+        return sha1
+
+    def save(self):
+        if not os.access(ctx.config.cache_root_dir(), os.W_OK):
+            return
+        util.ensure_dirs(os.path.dirname(self.path))
+        tmp = self.path + ctx.const.temporary_suffix
+        with open(tmp, "w") as f:
+            json.dump((pisi.__version__, self.new), f)
+        os.rename(tmp, self.path)
+
+
 class Index(xmlfile.XmlFile, metaclass=autoxml.autoxml):
     tag = "PISI"
 
@@ -38,6 +121,24 @@ class Index(xmlfile.XmlFile, metaclass=autoxml.autoxml):
     t_Groups = [[group.Group], autoxml.OPTIONAL, "Group"]
 
     def read_uri(self, uri, tmpdir, force=False):
+        if not force:
+            updated, published = update_by_delta(uri, tmpdir)
+            if updated:
+                return self.read(updated, tmpDir=tmpdir, nodecode=True)
+
+            if published:
+                # Checked against the sha1 the delta probe already fetched
+                localfile = pisi.file.File.download(
+                    pisi.file.File.make_uri(uri),
+                    tmpdir,
+                    sha1sum=True,
+                    compress=pisi.file.File.COMPRESSION_TYPE_AUTO,
+                    sign=pisi.file.File.detached,
+                    copylocal=True,
+                    sha1=published,
+                )
+                return self.read(localfile, tmpDir=tmpdir, nodecode=True)
+
         return self.read(
             uri,
             tmpDir=tmpdir,
@@ -78,6 +179,14 @@ class Index(xmlfile.XmlFile, metaclass=autoxml.autoxml):
         pisi.file.File.check_signature(filename, tmpdir)
 
     def index(self, repo_uri):
+        self.packages = list(self.iter_packages(repo_uri, *self.scan(repo_uri)))
+
+    def scan(self, repo_uri):
+        """Collect the index files of a repository directory.
+
+        Distribution, components, groups and specs are added to the index
+        object, the latest packages to index and the delta packages found
+        are returned."""
         self.repo_dir = repo_uri
 
         packages = []
@@ -106,12 +215,11 @@ class Index(xmlfile.XmlFile, metaclass=autoxml.autoxml):
 
         ctx.ui.info("")
 
-        # Create a process pool, as many processes as the number of CPUs we
-        # have
-        pool = multiprocessing.Pool()
-
         # Before calling pool.map check if list is empty or not: python#12157
         if specs:
+            # Create a process pool, as many processes as the number of CPUs
+            # we have
+            pool = multiprocessing.Pool()
             try:
                 # Add source packages to index using a process pool
                 self.specs = pool.map(add_spec, specs)
@@ -124,6 +232,8 @@ class Index(xmlfile.XmlFile, metaclass=autoxml.autoxml):
                 pool.join()
                 ctx.ui.info("")
                 raise
+            pool.close()
+            pool.join()
 
         try:
             obsoletes_list = list(map(str, self.distribution.obsoletes))
@@ -137,27 +247,346 @@ class Index(xmlfile.XmlFile, metaclass=autoxml.autoxml):
             if pkg_name.endswith(ctx.const.debug_name_suffix):
                 pkg_name = util.remove_suffix(ctx.const.debug_name_suffix, pkg_name)
             if pkg_name not in obsoletes_list:
-                # Currently, multiprocessing.Pool.map method accepts methods
-                # with single parameters only. So we have to send our
-                # parameters as a tuple to workaround that
+                latest_packages.append(pkg)
 
-                latest_packages.append((pkg, deltas, repo_uri))
+        return latest_packages, deltas
 
-        # Before calling pool.map check if list is empty or not: python#12157
-        if latest_packages:
-            try:
-                # Add binary packages to index using a process pool
-                self.packages = pool.map(add_package, latest_packages)
-            except:
-                pool.terminate()
-                pool.join()
-                ctx.ui.info("")
-                raise
+    def iter_packages(self, repo_uri, latest_packages, deltas):
+        """Yield the index entries of the packages found by scan, in order"""
+        # Only read the packages which changed since the last run
+        cache = IndexCache(repo_uri)
+        changed = [x for x in latest_packages if cache.get(x) is None]
+        stamps = dict((x, IndexCache.stamp(x)) for x in changed)
+
+        # Create a process pool, as many processes as the number of CPUs we
+        # have
+        pool = multiprocessing.Pool()
+
+        try:
+            # Changed packages are read by the process pool, in the order
+            # they are needed below
+            records = pool.imap(read_package, changed)
+
+            for pkg in latest_packages:
+                if pkg in stamps:
+                    record = next(records)
+                    if record is None:
+                        # Packages with errors are read again to report them
+                        yield add_package((pkg, deltas, repo_uri))
+                        continue
+                    cache.set(pkg, stamps[pkg], record)
+                else:
+                    record = cache.get(pkg)
+
+                yield make_package(pkg, record, deltas, repo_uri, cache)
+        except:
+            pool.terminate()
+            pool.join()
+            ctx.ui.info("")
+            raise
+
+        cache.save()
 
         ctx.ui.info("")
         pool.close()
         pool.join()
 
+    def write_index(self, dirs, uri, sha1sum=False, compress=None, sign=None):
+        """Index the given repository directories into an index file.
+
+        Package entries are written out as they are built instead of being
+        collected into one document, so the memory used does not depend on
+        the number of packages."""
+        scanned = []
+        for repo_uri in dirs:
+            ctx.ui.info(_("Building index of eopkg files under %s") % repo_uri)
+            scanned.append((repo_uri,) + self.scan(repo_uri))
+
+        writer = IndexWriter(uri, sha1sum=sha1sum, compress=compress, sign=sign)
+        try:
+            if self.distribution:
+                writer.add("Distribution", self.distribution)
+            for spec in self.specs:
+                writer.add("SpecFile", spec)
+            for args in scanned:
+                for package in self.iter_packages(*args):
+                    writer.add("Package", package)
+            for obj in self.components:
+                writer.add("Component", obj)
+            for obj in self.groups:
+                writer.add("Group", obj)
+        except:
+            writer.discard()
+            raise
+
+        writer.close()
+
+
+def delta_uri(index_uri, sha1):
+    """Return the uri of the delta to an index from the one with the given hash"""
+    return "%s.%s%s" % (index_uri, sha1, ctx.const.index_delta_suffix)
+
+
+def make_delta(old, new, delta):
+    """Write the delta between two uncompressed index files.
+
+    Deltas are xz compressed. After a header with the hashes of both files,
+    they hold "c <start> <count>" lines to copy lines of the old file and
+    "i <count>" lines followed by the lines to insert."""
+    with open(old, "rb") as f:
+        old_lines = f.readlines()
+    with open(new, "rb") as f:
+        new_lines = f.readlines()
+
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+
+    tmp = delta + ctx.const.temporary_suffix
+    with lzma.open(tmp, "wb") as f:
+        f.write(DELTA_MAGIC)
+        f.write(b"%s %s\n" % (util.sha1_file(old).encode(), util.sha1_file(new).encode()))
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == "equal":
+                f.write(b"c %d %d\n" % (i1, i2 - i1))
+            elif j2 > j1:
+                f.write(b"i %d\n" % (j2 - j1))
+                f.writelines(new_lines[j1:j2])
+    os.rename(tmp, delta)
+
+
+def apply_delta(old, delta, output):
+    """Write the index made by applying a delta to old and return its hash"""
+    with open(old, "rb") as f:
+        old_lines = f.readlines()
+
+    sha1 = hashlib.sha1()
+    try:
+        with lzma.open(delta, "rb") as f, open(output, "wb") as out:
+            if f.readline() != DELTA_MAGIC:
+                raise ValueError
+            f.readline()
+
+            while True:
+                op = f.readline().split()
+                if not op:
+                    break
+                elif op[0] == b"c":
+                    start = int(op[1])
+                    lines = old_lines[start : start + int(op[2])]
+                elif op[0] == b"i":
+                    lines = [f.readline() for x in range(int(op[1]))]
+                else:
+                    raise ValueError
+
+                for line in lines:
+                    sha1.update(line)
+                    out.write(line)
+    except (lzma.LZMAError, EOFError, ValueError, IndexError):
+        raise Error(_("Index delta %s is corrupt.") % delta)
+
+    return sha1.hexdigest()
+
+
+def read_sha1(sha1file):
+    with open(sha1file) as f:
+        return f.read().split("\n")[0]
+
+
+def update_by_delta(uri, tmpdir):
+    """Update the local copy of a remote index with a delta.
+
+    Returns the path of the updated uncompressed index, or None if the whole
+    index has to be downloaded, along with the published sha1 of the index
+    at uri if it was fetched. AlreadyHaveException is raised when a delta
+    already brought the index up to date.
+
+    The delta files are optional, they are probed with a single request and
+    servers not publishing them cost one request per update."""
+    uri = pisi.file.File.make_uri(uri)
+    if not uri.is_remote_file():
+        return None, None
+
+    index_uri = uri.get_uri()
+    if pisi.file.File.is_compressed(index_uri):
+        index_uri = os.path.splitext(index_uri)[0]
+
+    local = util.join_path(tmpdir, os.path.basename(index_uri))
+    origfile = util.join_path(tmpdir, uri.filename())
+    state = util.join_path(tmpdir, ctx.const.index_delta_state)
+    if not os.path.exists(local):
+        return None, None
+
+    # Needed by the regular download as well, which is given the result
+    published = read_sha1(
+        pisi.file.File.download(pisi.uri.URI(uri.get_uri() + ".sha1sum"), tmpdir)
+    )
+    if os.path.exists(origfile) and util.cached_sha1_file(origfile) == published:
+        # Unchanged, the regular download reports it
+        return None, published
+
+    if os.path.exists(state):
+        with open(state) as f:
+            if f.read() == published:
+                raise pisi.file.AlreadyHaveException(uri, local)
+
+    try:
+        sha1file = pisi.fetcher.fetch_optional(index_uri + ".sha1sum", tmpdir)
+        if sha1file is None:
+            ctx.ui.debug("No index delta for %s" % uri.get_uri())
+            return None, published
+
+        new_sha1 = read_sha1(sha1file)
+        old_sha1 = util.cached_sha1_file(local)
+        if new_sha1 != old_sha1:
+            ctx.ui.info(_("Fetching index delta for %s") % uri.get_uri(), verbose=True)
+            delta = pisi.fetcher.fetch_optional(delta_uri(index_uri, old_sha1), tmpdir)
+            if delta is None:
+                ctx.ui.debug("No index delta for %s" % uri.get_uri())
+                return None, published
+    except (pisi.fetcher.FetchError, IOError) as e:
+        ctx.ui.debug("No index delta for %s: %s" % (uri.get_uri(), e))
+        return None, published
+
+    if new_sha1 != old_sha1:
+        tmp = local + ctx.const.temporary_suffix
+        try:
+            sha1 = apply_delta(local, delta, tmp)
+        except Error as e:
+            ctx.ui.warning(str(e))
+            sha1 = None
+        finally:
+            os.unlink(delta)
+
+        if sha1 != new_sha1:
+            ctx.ui.debug("Index delta of %s did not apply" % uri.get_uri())
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return None, published
+
+        os.rename(tmp, local)
+        util.store_sha1(local, sha1)
+
+    # The compressed copy is outdated now, remember which published index the
+    # local one matches instead
+    if os.path.exists(origfile):
+        os.unlink(origfile)
+    with open(state, "w") as f:
+        f.write(published)
+
+    if new_sha1 == old_sha1:
+        raise pisi.file.AlreadyHaveException(uri, local)
+    return local, published
+
+
+class IndexWriter(object):
+    """Write an index file one entry at a time.
+
+    Every entry is encoded into its own small document and written through
+    the compressors and hashes of the output file right away."""
+
+    def __init__(self, uri, sha1sum=False, compress=None, sign=None):
+        self.file = pisi.file.File(
+            uri, pisi.file.File.write, sha1sum=sha1sum, compress=compress, sign=sign
+        )
+        self.file.write("<%s>\n" % Index.tag)
+
+    def add(self, tag, obj):
+        errs = obj.errors()
+        if not errs:
+            node = xmlext.newNode(None, tag)
+            obj.encode(node, errs)
+        if errs:
+            errs.append(_("autoxml.write: object validation has failed."))
+            raise Error(*errs)
+        self.file.write(node.toPrettyString())
+        self.file.write("\n")
+
+    def close(self):
+        self.file.write("</%s>\n" % Index.tag)
+        self.file.close()
+
+    def discard(self):
+        self.file.discard()
+
+
+def read_package(path):
+    """Read a package file for the index cache.
+
+    Returns the XML of the index entry of the package and its hash, or None
+    if its metadata is corrupt."""
+    try:
+        ctx.ui.info(
+            "%-80.80s\r" % (_("Adding package to index: %s") % os.path.basename(path)),
+            noln=True,
+        )
+
+        package = pisi.package.Package(path, "r")
+        md = package.get_metadata()
+        if md.errors():
+            return None
+
+        # No need to carry these with index (#3965)
+        md.package.files = None
+        md.package.additionalFiles = None
+
+        node = xmlext.newNode(None, "Package")
+        md.package.encode(node, [])
+        return node.toString(), util.sha1_file(path)
+
+    except KeyboardInterrupt:
+        # Multiprocessing hack, see add_package method for explanation
+        raise Exception
+
+
+def make_package(path, record, deltas, repo_uri, cache):
+    """Build the index entry of a package from its cached record"""
+    xml, sha1 = record
+    package = metadata.Package()
+    package.parse(xml)
+    package.packageSize = int(os.path.getsize(path))
+    package.packageHash = sha1
+    if ctx.config.options and ctx.config.options.absolute_urls:
+        package.packageURI = os.path.realpath(path)
+    else:
+        package.packageURI = util.removepathprefix(repo_uri, path)
+
+    for delta in find_deltas(path, package, deltas, repo_uri):
+        delta.packageHash = cache.sha1(os.path.join(repo_uri, delta.packageURI))
+        package.deltaPackages.append(delta)
+
+    return package
+
+
+def find_deltas(path, package, deltas, repo_uri):
+    """Return the Delta entries to the given build of a package"""
+    found = []
+    if package.name not in deltas:
+        return found
+
+    name, version, release, distro_id, arch = util.split_package_filename(path)
+
+    for delta_path in deltas[package.name]:
+        (
+            src_release,
+            dst_release,
+            delta_distro_id,
+            delta_arch,
+        ) = util.split_delta_package_filename(delta_path)[1:]
+
+        # Add only delta to latest build of the package
+        if dst_release != package.release or (
+            delta_distro_id,
+            delta_arch,
+        ) != (distro_id, arch):
+            continue
+
+        delta = metadata.Delta()
+        delta.packageURI = util.removepathprefix(repo_uri, delta_path)
+        delta.packageSize = int(os.path.getsize(delta_path))
+        delta.releaseFrom = src_release
+        found.append(delta)
+
+    return found
+
 
 def add_package(params):
     try:
@@ -190,33 +619,11 @@ def add_package(params):
             md.package.files = None
             md.package.additionalFiles = None
 
-            if md.package.name in deltas:
-                name, version, release, distro_id, arch = util.split_package_filename(
-                    path
+            for delta in find_deltas(path, md.package, deltas, repo_uri):
+                delta.packageHash = util.sha1_file(
+                    os.path.join(repo_uri, delta.packageURI)
                 )
-
-                for delta_path in deltas[md.package.name]:
-                    (
-                        src_release,
-                        dst_release,
-                        delta_distro_id,
-                        delta_arch,
-                    ) = util.split_delta_package_filename(delta_path)[1:]
-
-                    # Add only delta to latest build of the package
-                    if dst_release != md.package.release or (
-                        delta_distro_id,
-                        delta_arch,
-                    ) != (distro_id, arch):
-                        continue
-
-                    delta = metadata.Delta()
-                    delta.packageURI = util.removepathprefix(repo_uri, delta_path)
-                    delta.packageSize = int(os.path.getsize(delta_path))
-                    delta.packageHash = util.sha1_file(delta_path)
-                    delta.releaseFrom = src_release
-
-                    md.package.deltaPackages.append(delta)
+                md.package.deltaPackages.append(delta)
 
         return md.package
 
@@ -266,6 +673,8 @@ def add_distro(path):
 
 def add_spec(params):
     try:
+        import pisi.operations.build
+
         path, repo_uri = params
         # TODO: may use try/except to handle this
         builder = pisi.operations.build.Builder(path)
@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Hashes and metadata of the files of an install directory.
+
+A Manifest walks its directory once with os.scandir, keeping the lstat
+results of every entry, and hashes the regular files on a pool of threads
+(hashlib releases the GIL while hashing). All of the packages built from
+the same directory share one manifest, so each file is read only once."""
+
+import concurrent.futures
+import fnmatch
+import os
+import re
+import stat
+
+from pisi import translate as _
+
+import pisi.context as ctx
+import pisi.util as util
+
+
+class Matcher(object):
+    """Match paths, or any of their parent directories, against globs"""
+
+    def __init__(self, patterns):
+        if patterns:
+            self.regex = re.compile("|".join(fnmatch.translate(x) for x in patterns))
+        else:
+            self.regex = None
+        self.dirs = {}
+
+    def __dir_matches(self, path):
+        if path in ("/", ""):
+            return False
+        try:
+            return self.dirs[path]
+        except KeyError:
+            found = self.dirs[path] = bool(
+                self.regex.match(path)
+            ) or self.__dir_matches(os.path.dirname(path))
+            return found
+
+    def matches(self, path):
+        if self.regex is None:
+            return False
+        return bool(self.regex.match(path)) or self.__dir_matches(
+            os.path.dirname(path)
+        )
+
+
+class FileTypes(object):
+    """File types of paths according to a PathInfo list.
+
+    Gives the same results as build.get_file_type, with the patterns of the
+    list compiled once instead of for each path."""
+
+    def __init__(self, pinfo_list):
+        self.pinfo_list = [
+            (
+                pinfo,
+                re.compile(fnmatch.translate(pinfo.path)),
+                re.compile(fnmatch.translate(util.join_path(pinfo.path, "*"))),
+            )
+            for pinfo in pinfo_list
+        ]
+
+    def get(self, path):
+        """Return the (fileType, permanent) of a path relative to the root"""
+        path = "/%s" % path
+        info = None
+        glob_match = parent_match = None
+
+        for pinfo, glob_regex, parent_regex in self.pinfo_list:
+            if path == pinfo.path:
+                info = pinfo
+                break
+
+            elif glob_regex.match(path):
+                glob_match = pinfo
+
+            elif parent_regex.match(path):
+                if parent_match is None or parent_match.path < pinfo.path:
+                    parent_match = pinfo
+
+        else:
+            info = glob_match or parent_match
+
+        return info.fileType, info.permanent
+
+
+class Manifest(object):
+    """Stats and hashes of the files under the directory top"""
+
+    def __init__(self, top, threads=None):
+        self.top = top
+        self.stats = {}
+        self.children = {}
+        self.hashes = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            threads or os.cpu_count() or 1
+        )
+        self.__scan(top)
+
+    def __scan(self, top):
+        if self.__lstat(top) is None:
+            return
+
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            names = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        st = entry.stat(follow_symlinks=False)
+                        self.stats[entry.path] = st
+                        names.append(entry.name)
+                        if stat.S_ISDIR(st.st_mode):
+                            stack.append(entry.path)
+                        elif stat.S_ISREG(st.st_mode):
+                            self.hashes[entry.path] = self.executor.submit(
+                                util.sha1_file, entry.path
+                            )
+            except NotADirectoryError:
+                continue
+            self.children[path] = sorted(names)
+
+    def __lstat(self, path):
+        try:
+            return self.stats[path]
+        except KeyError:
+            try:
+                st = self.stats[path] = os.lstat(path)
+            except OSError:
+                st = None
+            return st
+
+    def paths(self, top):
+        """Return the paths util.get_file_hashes reports under top.
+
+        Those are the files and symlinks, including symlinks to directories,
+        and the empty directories."""
+        st = self.__lstat(top)
+        if st is None or not stat.S_ISDIR(st.st_mode):
+            return [top]
+
+        if top not in self.children:
+            # Reached through a symlinked directory
+            self.__scan(top)
+
+        found = []
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            names = self.children[path]
+            if not names:
+                found.append(path)
+            dirs = []
+            for name in names:
+                child = os.path.join(path, name)
+                if stat.S_ISDIR(self.stats[child].st_mode):
+                    dirs.append(child)
+                else:
+                    found.append(child)
+            stack.extend(reversed(dirs))
+        return found
+
+    def hash(self, path):
+        """Return the hash of a path as util.calculate_hash does"""
+        st = self.__lstat(path)
+        if st is None:
+            return util.sha1_file(path)
+
+        if stat.S_ISLNK(st.st_mode):
+            # For symlinks, path string is hashed instead of the content
+            if not os.path.exists(path):
+                ctx.ui.info(_("Including external link '%s'") % path)
+            return util.sha1_data(util.read_link(path))
+        elif stat.S_ISDIR(st.st_mode):
+            ctx.ui.info(_("Including directory '%s'") % path)
+            return None
+
+        future = self.hashes.get(path)
+        if future is None:
+            return util.sha1_file(path)
+        return future.result()
+
+    def size(self, path):
+        """Return the size of a path as util.dir_size does"""
+        st = self.__lstat(path)
+        if st is None:
+            return util.dir_size(path)
+
+        if stat.S_ISLNK(st.st_mode):
+            return len(util.read_link(path))
+        elif not stat.S_ISDIR(st.st_mode):
+            return st.st_size
+
+        return sum(
+            self.stats[x].st_size
+            for x in self.paths(path)
+            if stat.S_ISREG(self.stats[x].st_mode)
+        )
+
+    def stat(self, path):
+        """Return the stat result of a path, not following symlinks"""
+        st = self.__lstat(path)
+        if st is None:
+            return os.stat(path)
+        return st
+
+    def close(self):
+        for future in self.hashes.values():
+            future.cancel()
+        self.executor.shutdown()
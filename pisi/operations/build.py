@@ -4,6 +4,7 @@
 """package building code"""
 
 # python standard library
+import concurrent.futures
 import os
 import re
 import glob
@@ -11,6 +12,7 @@ import stat
 import pwd
 import grp
 import fnmatch
+import time
 
 from pisi import translate as _
 
@@ -31,6 +33,9 @@ import pisi.component as component
 import pisi.archive as archive
 import pisi.actionsapi.variables
 import pisi.db
+import pisi.elf
+import pisi.manifest
+import pisi.buildcache
 
 import magic
 
@@ -160,39 +165,35 @@ def get_debug_path(filepath, fileinfo, install_dir):
     ):
         return (None, None)
 
-    code, out, err = pisi.util.run_batch('LC_ALL=C readelf -n "%s"' % filepath)
-    if code != 0 or not out:
+    elf = pisi.elf.read(filepath)
+    if elf is None or not elf.build_id:
         return (None, None)
-    for line in out.split("\n"):
-        if "Build ID:" not in line:
-            continue
-        val = line.split(":")[1].strip()
 
-        suffix = util.join_path(
-            ctx.const.debug_files_suffix, ".build-id", val[0:2], val[2:]
-        )
+    val = elf.build_id
+    suffix = util.join_path(ctx.const.debug_files_suffix, ".build-id", val[0:2], val[2:])
 
-        path = util.join_path(
-            os.path.dirname(install_dir),
-            ctx.const.debug_dir_suffix,
-            ctx.const.debug_files_suffix,
-            ".build-id",
-            val[0:2],
-            val[2:],
-        )
+    path = util.join_path(
+        os.path.dirname(install_dir),
+        ctx.const.debug_dir_suffix,
+        ctx.const.debug_files_suffix,
+        ".build-id",
+        val[0:2],
+        val[2:],
+    )
 
-        return (path, suffix)
+    return (path, suffix)
 
 
 def strip_debug_action(filepath, fileinfo, install_dir, ag):
+    """Strip a file, returning its debug_map entry if it has a build ID"""
     excludelist = tuple(ag.get("NoStrip", []))
-    global debug_map
+    debug_entry = None
 
     # real path in .pisi package
     path = "/" + util.removepathprefix(install_dir, filepath)
 
     if path.startswith(excludelist):
-        return
+        return None
 
     outputpath, outclean = get_debug_path(filepath, fileinfo, install_dir)
     buildID = None
@@ -210,13 +211,40 @@ def strip_debug_action(filepath, fileinfo, install_dir, ag):
         if clean[0] != "/":
             clean = "/%s" % clean
 
-        debug_map[clean] = outclean
+        debug_entry = (clean, outclean)
         buildID = True
     if util.strip_file(filepath, fileinfo, outputpath):
         ctx.ui.debug("%s [%s]" % (path, "stripped"))
         if not buildID:
             ctx.ui.warning("%s [%s]" % (path, "missing buildID"))
 
+    return debug_entry
+
+
+def process_file(filepath, install_dir, ag):
+    """Run the post install actions on a file of the install directory.
+
+    Returns the debug_map entry of the file, or None, and the time spent on
+    each action."""
+    times = [0.0, 0.0, 0.0]
+    debug_entry = None
+    try:
+        start = time.monotonic()
+        fileinfo = magic.from_file(filepath)
+        times[0] = time.monotonic() - start
+
+        start = time.monotonic()
+        debug_entry = strip_debug_action(filepath, fileinfo, install_dir, ag)
+        times[1] = time.monotonic() - start
+
+        start = time.monotonic()
+        exclude_special_files(filepath, fileinfo, ag)
+        times[2] = time.monotonic() - start
+    except Exception:
+        pass
+
+    return debug_entry, times
+
 
 class Builder:
     """Provides the package build and creation routines"""
@@ -231,11 +259,10 @@ class Builder:
 
         self.v_dyn = re.compile(r"ELF (64|32)\-bit LSB shared object,")
         self.v_bin = re.compile(r"ELF (64|32)\-bit LSB executable,")
-        self.shared_lib = re.compile(r".*Shared library: \[(.*)\].*")
-        self.r_path = re.compile(r".*Library rpath: \[(.*)\].*")
-        self.r_soname = re.compile(r".*Library soname: \[(.*)\].*")
         # Currently don't differentiate between internal and public
         self.soname_providers = None
+        self.file_action_stats = None
+        self.manifests = {}
 
         # process args
         if not isinstance(specuri, pisi.uri.URI):
@@ -371,6 +398,11 @@ class Builder:
         self.check_patches()
 
         self.check_build_dependencies()
+
+        cache_key = pisi.buildcache.build_key(self)
+        if cache_key and pisi.buildcache.restore(self, cache_key):
+            return
+
         self.fetch_component()
         self.fetch_source_archives()
 
@@ -397,6 +429,9 @@ class Builder:
         # after all, we are ready to build/prepare the packages
         self.build_packages()
 
+        if cache_key:
+            pisi.buildcache.store(self, cache_key)
+
     def get_build_types(self):
         ignored_build_types = ctx.config.values.build.ignored_build_types.split(",")
         build_types = [""]
@@ -1330,18 +1365,29 @@ class Builder:
         # FIXME: We need to expand globs before trying to calculate hashes
         # Not on the fly like now.
 
-        # we'll exclude collisions in get_file_hashes. Having a
-        # collisions list is not wrong, we must just handle it :).
-        collisions = check_path_collision(package, self.spec.packages)
+        # The packages built from the same directory share its manifest,
+        # so each file is hashed once.
+        if install_dir not in self.manifests:
+            self.manifests[install_dir] = pisi.manifest.Manifest(install_dir)
+        manifest = self.manifests[install_dir]
+
+        # we'll exclude collisions here. Having a collisions list is
+        # not wrong, we must just handle it :).
+        collisions = pisi.manifest.Matcher(
+            check_path_collision(package, self.spec.packages)
+        )
         # FIXME: material collisions after expanding globs could be
         # reported as errors
+        file_types = pisi.manifest.FileTypes(package.files)
 
         # Use a dict to avoid duplicate entries in files.xml.
         d = {}
 
         def add_path(path):
             # add the files under material path
-            for fpath, fhash in util.get_file_hashes(path, collisions, install_dir):
+            for fpath in manifest.paths(path):
+                if collisions.matches(util.remove_prefix(install_dir, fpath)):
+                    continue
                 if (
                     ctx.get_option("create_static")
                     and fpath.endswith(ctx.const.ar_file_suffix)
@@ -1352,12 +1398,10 @@ class Builder:
                     # don't include this file into the package.
                     continue
                 frpath = util.removepathprefix(install_dir, fpath)  # relative path
-                ftype, permanent = get_file_type(frpath, package.files)
-                fsize = int(util.dir_size(fpath))
-                if not os.path.islink(fpath):
-                    st = os.stat(fpath)
-                else:
-                    st = os.lstat(fpath)
+                ftype, permanent = file_types.get(frpath)
+                fhash = manifest.hash(fpath)
+                fsize = int(manifest.size(fpath))
+                st = manifest.stat(fpath)
 
                 d[frpath] = pisi.files.FileInfo(
                     path=frpath,
@@ -1387,46 +1431,74 @@ class Builder:
         self.files = files
 
     def file_actions(self):
+        """Detect, strip and filter the installed files on a thread pool.
+
+        The work on each file is mostly done by the file, strip and objcopy
+        commands, so the threads run in parallel. Hard links of a file share
+        its inode and build-id, they are handled one after the other by the
+        same thread. Results are merged into debug_map in path order,
+        whatever the order the files finish in."""
+        global debug_map
+
         install_dir = self.pkg_install_dir()
+        start = time.monotonic()
 
+        paths = []
         for root, dirs, files in os.walk(install_dir):
-            for fn in files:
-                filepath = util.join_path(root, fn)
-                try:
-                    fileinfo = magic.from_file(filepath)
-                    strip_debug_action(
-                        filepath, fileinfo, install_dir, self.actionGlobals
-                    )
-                    exclude_special_files(filepath, fileinfo, self.actionGlobals)
-                except Exception:
-                    pass
+            paths.extend(util.join_path(root, fn) for fn in files)
+        paths.sort()
+
+        links = {}
+        for path in paths:
+            st = os.lstat(path)
+            links.setdefault((st.st_dev, st.st_ino), []).append(path)
+
+        def process_links(group):
+            return [process_file(x, install_dir, self.actionGlobals) for x in group]
+
+        results = {}
+        threads = os.cpu_count() or 1
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            for group, group_results in zip(
+                links.values(), executor.map(process_links, links.values())
+            ):
+                results.update(zip(group, group_results))
+
+        totals = [0.0, 0.0, 0.0]
+        for debug_entry, times in (results[x] for x in paths):
+            if debug_entry:
+                debug_map[debug_entry[0]] = debug_entry[1]
+            totals = [x + y for x, y in zip(totals, times)]
+
+        self.file_action_stats = (
+            len(paths),
+            threads,
+            time.monotonic() - start,
+            totals,
+        )
 
-    def get_soname(self, path):
-        """Get the soname for a given path"""
-        code, out, err = pisi.util.run_batch(
-            "LC_ALL=C /usr/bin/readelf -d {}".format(path)
+    def report_file_actions(self):
+        if self.file_action_stats is None:
+            return
+
+        count, threads, elapsed, (detect, strip, special) = self.file_action_stats
+        ctx.ui.info(
+            _(
+                "Processed %d files in %.2fs with %d threads "
+                "(file type %.2fs, strip %.2fs, special files %.2fs)"
+            )
+            % (count, elapsed, threads, detect, strip, special)
         )
 
-        if code != 0:
-            return None
-        for line in out.split(b"\n"):
-            line = line.strip()
-            g = self.r_soname.match(str(line))
-            if g:
-                return g.group(1)
-        return None
+    def get_soname(self, path):
+        """Get the soname for a given path"""
+        elf = pisi.elf.read(path)
+        return elf and elf.soname
 
     def is_dynamic_library(self, path):
         """Similar to is_dynamic_binary, but only for libraries"""
-        if not os.path.exists(path) or not os.path.isfile(path):
-            return False
-        try:
-            mg = magic.from_file(path)
-        except Exception as e:
-            return False
-        if self.v_dyn.match(mg):
-            return True
-        return False
+        elf = pisi.elf.read(path)
+        return elf is not None and elf.type == pisi.elf.ET_DYN
 
     def is_dynamic_binary(self, path, mg):
         """Determine if the given path is a dynamic binary file"""
@@ -1444,24 +1516,21 @@ class Builder:
 
         for root, dirs, files in os.walk(directory):
             for f in files:
-                p = os.path.join(root, f)
-                if not self.is_dynamic_library(p):
-                    continue
-                s = self.get_soname(p)
-                if s is not None:
-                    self.soname_providers.add(s)
+                elf = pisi.elf.read(os.path.join(root, f))
+                if elf is not None and elf.type == pisi.elf.ET_DYN and elf.soname:
+                    self.soname_providers.add(elf.soname)
 
     def accumulate_dependencies(self, path, emul32=False):
         """Accumulate all shared dependencies of a given path"""
-        code, out, err = pisi.util.run_batch(
-            "LC_ALL=C /usr/bin/readelf -d {}".format(path)
-        )
-
-        if code != 0:
+        elf = pisi.elf.read(path)
+        if elf is None:
             return []
 
-        check_deps = set()
-        r_paths = set()
+        dirname = os.path.dirname(path)
+
+        # Skip internally provided symbols
+        check_deps = set(x for x in elf.needed if x not in self.soname_providers)
+        r_paths = set(elf.search_paths(dirname))
         valid_libs = set()
 
         if emul32:
@@ -1470,22 +1539,6 @@ class Builder:
             # Currently on Solus this is the same thing as /usr/lib.
             valid_libs.update(["/usr/lib64", "/lib64"])
 
-        for line in out.split("\n"):
-            line = line.strip()
-            g = self.shared_lib.match(line)
-            if g:
-                lib = g.group(1)
-                # Skip internally provided symbols
-                if lib in self.soname_providers:
-                    continue
-                check_deps.add(lib)
-                continue
-            r = self.r_path.match(line)
-            if r:
-                r_paths.add(r.group(1))
-
-        dirname = os.path.dirname(path)
-
         # Filter rpath and same-dir files
         filter_deps = [
             x
@@ -1513,6 +1566,10 @@ class Builder:
 
         doc_ptrn = re.compile(ctx.const.doc_package_end)
 
+        # ELF files are read again from now on, as they change while building
+        pisi.elf.clear_cache()
+        self.manifests = {}
+
         self.fetch_component()  # bug 856
 
         # Operations and filters for package files
@@ -1691,6 +1748,11 @@ class Builder:
             pkg.close()
 
         self.set_state("buildpackages")
+        self.report_file_actions()
+        pisi.elf.clear_cache()
+        for manifest in self.manifests.values():
+            manifest.close()
+        self.manifests = {}
 
         if ctx.config.values.general.autoclean is True:
             ctx.ui.info(_("Cleaning build directory..."))
@@ -1,7 +1,9 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import multiprocessing
 import os
+import shutil
 
 import gettext
 
@@ -14,6 +16,12 @@ import pisi.util as util
 
 
 def create_delta_packages_from_obj(old_packages, new_package_obj, specdir):
+    """Create the delta packages from old_packages to an extracted package.
+
+    Deltas sharing the same changed files have the same contents, so each
+    different delta is only compressed once and copied for the others.
+    Those are written in parallel by a process pool, all of them reading the
+    one extracted copy of the new package."""
     new_pkg_info = new_package_obj.metadata.package
     new_pkg_files = new_package_obj.files
 
@@ -28,10 +36,11 @@ def create_delta_packages_from_obj(old_packages, new_package_obj, specdir):
         new_arch,
     ) = util.split_package_filename(new_pkg_name)
 
-    cwd = os.getcwd()
     out_dir = ctx.get_option("output_dir")
     target_format = ctx.get_option("package_format")
     delta_packages = []
+    # Changed paths of each different delta -> names of its delta packages
+    deltas = {}
 
     for old_package in old_packages:
         old_pkg = pisi.package.Package(old_package)
@@ -70,8 +79,6 @@ def create_delta_packages_from_obj(old_packages, new_package_obj, specdir):
             + ctx.const.delta_package_suffix
         )
 
-        ctx.ui.info(_("Creating %s...") % delta_name)
-
         if out_dir:
             delta_name = util.join_path(out_dir, delta_name)
 
@@ -90,12 +97,87 @@ def create_delta_packages_from_obj(old_packages, new_package_obj, specdir):
             )
             continue
 
-        delta_pkg = pisi.package.Package(delta_name, "w", format=target_format)
+        # Sort the files according to their path for an ordered tarfile
+        # layout which dramatically improves the compression performance of
+        # lzma. This improvement is stolen from build.py (commit r23485).
+        paths = tuple(sorted(x.path for x in files_delta))
+        deltas.setdefault(paths, []).append(delta_name)
+        delta_packages.append(delta_name)
+
+    jobs = [
+        (
+            names[0],
+            paths,
+            new_pkg_path,
+            specdir,
+            [x.script for x in new_pkg_info.providesComar],
+            new_pkg_info.debug_package,
+            target_format,
+        )
+        for paths, names in deltas.items()
+    ]
+
+    for delta_name in delta_packages:
+        ctx.ui.info(_("Creating %s...") % os.path.basename(delta_name))
+
+    if len(jobs) > 1:
+        pool = multiprocessing.Pool(min(len(jobs), os.cpu_count() or 1))
+        try:
+            written = pool.imap_unordered(write_delta_package, jobs)
+            for count, delta_name in enumerate(written, 1):
+                ctx.ui.info(
+                    _("Created %s [%d/%d]")
+                    % (os.path.basename(delta_name), count, len(jobs)),
+                    verbose=True,
+                )
+        except:
+            pool.terminate()
+            pool.join()
+            raise
+
+        pool.close()
+        pool.join()
+    else:
+        for job in jobs:
+            write_delta_package(job)
+
+    for names in deltas.values():
+        for delta_name in names[1:]:
+            ctx.ui.debug("%s has the same contents as %s" % (delta_name, names[0]))
+            shutil.copyfile(names[0], delta_name)
+
+    # Return delta package names
+    return delta_packages
+
+
+def write_delta_package(params):
+    """Write a delta package adding the given paths of the new package"""
+    try:
+        (
+            delta_name,
+            paths,
+            new_pkg_path,
+            specdir,
+            comar_scripts,
+            debug_package,
+            target_format,
+        ) = params
+
+        cwd = os.getcwd()
+
+        # Every delta builds its install archive in a directory of its own
+        tmp_dir = util.join_path(ctx.config.tmp_dir(), os.path.basename(delta_name))
+        util.clean_dir(tmp_dir)
+        util.ensure_dirs(tmp_dir)
+
+        delta_pkg = pisi.package.Package(
+            delta_name, "w", format=target_format, tmp_dir=tmp_dir
+        )
 
         # add comar files to package
         os.chdir(specdir)
-        for pcomar in new_pkg_info.providesComar:
-            fname = util.join_path(ctx.const.comar_dir, pcomar.script)
+        for script in comar_scripts:
+            fname = util.join_path(ctx.const.comar_dir, script)
             delta_pkg.add_to_package(fname)
 
         # add xmls and files
@@ -106,26 +188,23 @@ def create_delta_packages_from_obj(old_packages, new_package_obj, specdir):
 
         # only metadata information may change in a package,
         # so no install archive added to delta package
-        if files_delta:
-            # Sort the files in-place according to their path for an ordered
-            # tarfile layout which dramatically improves the compression
-            # performance of lzma. This improvement is stolen from build.py
-            # (commit r23485).
-            files_delta.sort(key=lambda x: x.path)
-
-            for finfo in files_delta:
-                orgname = util.join_path("install", finfo.path)
-                if new_pkg_info.debug_package:
-                    orgname = util.join_path("debug", finfo.path)
-                delta_pkg.add_to_install(orgname, finfo.path)
+        for path in paths:
+            orgname = util.join_path("install", path)
+            if debug_package:
+                orgname = util.join_path("debug", path)
+            delta_pkg.add_to_install(orgname, path)
 
         os.chdir(cwd)
 
         delta_pkg.close()
-        delta_packages.append(delta_name)
+        util.clean_dir(tmp_dir)
 
-    # Return delta package names
-    return delta_packages
+        return delta_name
+
+    except KeyboardInterrupt:
+        # Worker processes do not propagate KeyboardInterrupt, see
+        # pisi.index.add_package
+        raise Exception
 
 
 def create_delta_packages(old_packages, new_package):
@@ -0,0 +1,224 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Parallel package downloads for the install and upgrade operations.
+
+Packages are downloaded by a pool of threads, with a limit on the number of
+connections opened to the same mirror. They are handed out in install order
+as soon as each one is downloaded and verified, so the first packages can
+be installed while the rest are still being downloaded."""
+
+import concurrent.futures
+import os
+import threading
+import time
+import urllib.parse
+
+from pisi import translate as _
+
+import pisi
+import pisi.context as ctx
+import pisi.db
+import pisi.fetcher
+import pisi.package
+import pisi.uri
+import pisi.util as util
+
+
+class Error(pisi.Error):
+    pass
+
+
+def package_source(name):
+    """Return the uri, hash and size of the file to get for a package.
+
+    That is the delta package if there is one from the installed release."""
+    packagedb = pisi.db.packagedb.PackageDB()
+    repodb = pisi.db.repodb.RepoDB()
+    installdb = pisi.db.installdb.InstallDB()
+
+    pkg, repo = packagedb.get_package_repo(name)
+    delta = None
+
+    # Package is installed. This is an upgrade. Check delta.
+    if installdb.has_package(pkg.name):
+        (
+            version,
+            release,
+            build,
+            distro,
+            distro_release,
+        ) = installdb.get_version_and_distro_release(pkg.name)
+        if distro_release == pkg.distributionRelease:
+            delta = pkg.get_delta(release)
+
+    # If delta exists than use the delta uri.
+    if delta and not ctx.config.values.general.ignore_delta:
+        pkg_uri, pkg_hash, pkg_size = (
+            delta.packageURI,
+            delta.packageHash,
+            delta.packageSize,
+        )
+    else:
+        pkg_uri, pkg_hash, pkg_size = (
+            pkg.packageURI,
+            pkg.packageHash,
+            pkg.packageSize,
+        )
+
+    uri = pisi.uri.URI(pkg_uri)
+    if uri.is_absolute_path():
+        pkg_path = str(pkg_uri)
+    else:
+        indexuri = repodb.get_repo(repo).indexuri.get_uri()
+        pkg_path = os.path.join(os.path.dirname(indexuri), str(uri.path()))
+
+    return pkg_path, pkg_hash, pkg_size or 0
+
+
+def parallel_downloads():
+    # Per file bandwidth limits do not add up, keep to one download then
+    if ctx.config.options.bandwidth_limit or (
+        ctx.config.values.general.bandwidth_limit
+        and str(ctx.config.values.general.bandwidth_limit) != "0"
+    ):
+        return 1
+    return max(1, int(ctx.config.values.general.parallel_downloads))
+
+
+class Downloader(object):
+    """Download the packages of the given names in parallel.
+
+    Iterating over the downloader yields the (name, path) pairs of the
+    packages in the given order, each one as soon as its file is
+    verified. Aggregate progress is reported while waiting for them."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.sources = []
+        for name in self.names:
+            pkg_path, pkg_hash, pkg_size = package_source(name)
+            ctx.ui.info(_("Package URI: %s") % pkg_path, verbose=True)
+            self.sources.append((pkg_path, pkg_hash, pkg_size))
+
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.mirrors = {}
+        self.sizes = {}
+        self.total_size = sum(x[2] for x in self.sources)
+        self.start_time = time.time()
+        self.progress_shown = False
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(parallel_downloads())
+        self.futures = [
+            self.executor.submit(self.__download, *source) for source in self.sources
+        ]
+
+    def __mirror(self, uri):
+        host = urllib.parse.urlsplit(uri).netloc
+        with self.lock:
+            if host not in self.mirrors:
+                connections = int(ctx.config.values.general.mirror_connections)
+                self.mirrors[host] = threading.BoundedSemaphore(max(1, connections))
+            return self.mirrors[host]
+
+    def __update(self, url, size, total_size):
+        if self.cancelled.is_set():
+            raise Error(_("Download of %s cancelled.") % url.filename())
+        with self.lock:
+            self.sizes[url.filename()] = size
+
+    def __download(self, pkg_path, pkg_hash, pkg_size):
+        url = pisi.uri.URI(pkg_path)
+
+        # Bug 4113
+        cached_file = pisi.package.Package.is_cached(pkg_path, pkg_hash)
+        if cached_file:
+            self.__update(url, pkg_size, pkg_size)
+            return cached_file, True
+
+        if not url.is_remote_file():
+            raise Error(
+                _("Package file %s does not match the repository package.")
+                % pkg_path
+            )
+
+        cached_file = pisi.package.Package.is_cached(pkg_path)
+        if cached_file:
+            os.unlink(cached_file)
+
+        with self.__mirror(pkg_path):
+            fetcher = pisi.fetcher.Fetcher(
+                url, ctx.config.cached_packages_dir(), listener=self.__update
+            )
+            downloaded_file = fetcher.fetch()
+
+        # The fetcher hashed the file while downloading it
+        if fetcher.hash != pkg_hash:
+            raise pisi.Error(
+                _("Download Error: Package does not match the repository package.")
+            )
+
+        return downloaded_file, False
+
+    def __report(self, filename):
+        with self.lock:
+            size = sum(self.sizes.values())
+
+        total_size = max(self.total_size, size)
+        percent = size * 100.0 / total_size if total_size else 100
+        elapsed = time.time() - self.start_time
+        rate, symbol = util.human_readable_rate(size / elapsed if elapsed else 0)
+        eta = "--:--:--"
+        if size and percent < 100:
+            remaining = elapsed * (100 - percent) / percent
+            eta = "%02d:%02d:%02d" % time.gmtime(remaining)[3:6]
+
+        ctx.ui.display_progress(
+            operation="fetching",
+            percent=percent,
+            filename=filename,
+            total_size=total_size,
+            downloaded_size=size,
+            rate=rate,
+            eta=eta,
+            symbol=symbol,
+        )
+        self.progress_shown = percent < 100
+
+    def __wait(self, future, filename):
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                self.__report(filename)
+
+    def __iter__(self):
+        try:
+            for index, (name, future) in enumerate(zip(self.names, self.futures)):
+                filename = os.path.basename(self.sources[index][0])
+                path, cached = self.__wait(future, filename)
+                if self.progress_shown:
+                    self.__report(filename)
+                    if self.progress_shown:
+                        ctx.ui.info("")
+                        self.progress_shown = False
+                if cached:
+                    ctx.ui.info(_("%s [cached]") % filename)
+                ctx.ui.info(
+                    util.colorize(
+                        _("Downloaded %d / %d") % (index + 1, len(self.names)),
+                        "yellow",
+                    ),
+                    verbose=True,
+                )
+                yield name, path
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the downloads which are not finished yet"""
+        self.cancelled.set()
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=False)
@@ -84,7 +84,7 @@ def extract_automatic(A, total):
     for i in total:
         if i in A:
             continue
-        repoVariant = packagedb.get_package(i)
+        repoVariant = packagedb.get_package_record(i)
         # system.base candidate is never "automatic" ...
         if repoVariant.partOf == "system.base":
             continue
@@ -134,7 +134,7 @@ def calculate_download_sizes(order):
         if cached_packages_dir:
             path = util.join_path(cached_packages_dir, fn)
             # check the file and sha1sum to be sure it _is_ the cached package
-            if os.path.exists(path) and util.sha1_file(path) == pkg_hash:
+            if os.path.exists(path) and util.cached_sha1_file(path) == pkg_hash:
                 cached_size += pkg_size
             elif os.path.exists("%s.part" % path):
                 cached_size += os.stat("%s.part" % path).st_size
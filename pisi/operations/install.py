@@ -12,7 +12,10 @@ import pisi.context as ctx
 import pisi.util as util
 import pisi.atomicoperations as atomicoperations
 import pisi.operations as operations
+import pisi.operations.download
 import pisi.pgraph as pgraph
+import pisi.relation
+import pisi.resolver
 import pisi.ui as ui
 import pisi.db
 
@@ -93,28 +96,24 @@ def install_pkg_names(A, reinstall=False):
         conflicts = operations.helper.check_conflicts(order, packagedb)
 
     automatic = operations.helper.extract_automatic(A, order)
-    paths = []
-    for x in order:
-        ctx.ui.info(
-            util.colorize(
-                _("Downloading %d / %d") % (order.index(x) + 1, len(order)), "yellow"
-            )
-        )
-        install_op = atomicoperations.Install.from_name(x)
-        paths.append(install_op.package_fname)
+    ctx.ui.info(util.colorize(_("Downloading %d package(s)") % len(order), "yellow"))
+    downloads = operations.download.Downloader(order)
 
     # fetch to be installed packages but do not install them.
     if ctx.get_option("fetch_only"):
+        for x in downloads:
+            pass
         return
 
     if conflicts:
         operations.remove.remove_conflicting_packages(conflicts)
 
     try:
-        for path in paths:
+        # Packages are installed in order as soon as they are downloaded
+        for index, (name, path) in enumerate(downloads):
             ctx.ui.info(
                 util.colorize(
-                    _("Installing %d / %d") % (paths.index(path) + 1, len(paths)),
+                    _("Installing %d / %d") % (index + 1, len(order)),
                     "yellow",
                 )
             )
@@ -311,15 +310,21 @@ def plan_install_pkg_names(A):
     # try to construct a pisi graph of packages to
     # install / reinstall
 
+    check_revdeps = not ctx.get_option("ignore_revdeps_of_deps_check")
+    key = ("install", tuple(sorted(A)), check_revdeps)
+    order = pisi.resolver.cached_order(key)
+    if order is not None:
+        return None, order
+
     packagedb = pisi.db.packagedb.PackageDB()
     installdb = pisi.db.installdb.InstallDB()
+    installed = pisi.relation.installed_versions()
+    available = pisi.relation.repo_versions()
 
     # Check if updates are available to opt into the slow path
-    available_updates = list()
-    if len(pisi.api.list_upgradable()) != 0 and not ctx.get_option(
-        "ignore_revdeps_of_deps_check"
-    ):
-        available_updates = pisi.api.list_upgradable()
+    available_updates = set()
+    if check_revdeps:
+        available_updates = set(pisi.api.list_upgradable())
 
     G_f = pgraph.PGraph(packagedb)  # construct G_f
 
@@ -329,37 +334,37 @@ def plan_install_pkg_names(A):
         G_f.add_package(x)
     B = A
 
+    checked = set()
     while len(B) > 0:
         Bp = set()
-        checked = list()
         for x in B:
-            pkg = packagedb.get_package(x)
-            for dep in pkg.runtimeDependencies():
-                ctx.ui.debug("checking %s" % str(dep))
+            record = packagedb.get_package_record(x)
+            for dep in pisi.resolver.runtime_dependencies(record):
+                name = available.package_name(dep)
                 # we don't deal with already *satisfied* dependencies
-                if not dep.satisfied_by_installed():
-                    if not dep.satisfied_by_repo():
+                if not installed.satisfies(dep):
+                    if not available.satisfies(dep):
                         raise Exception(
                             _("%s dependency of package %s is not satisfied")
-                            % (dep, pkg.name)
+                            % (pisi.resolver.relation_str(dep), record.name)
                         )
-                    if not dep.package in G_f.vertices():
-                        Bp.add(str(dep.package))
-                    G_f.add_dep(x, dep)
+                    if not name in G_f.vertices():
+                        Bp.add(name)
+                    G_f.add_plain_dep(x, name)
                 # Check for updates in the revdeps of the deps of the pkg(s) we're installing to avoid breakage.
-                if dep.package in available_updates and not dep.package in checked:
-                    for name, revdep in packagedb.get_rev_deps(dep.package):
-                        if (
-                            installdb.has_package(name)
-                            and not revdep.satisfied_by_installed()
-                        ):
-                            checked.append(dep.package)
-                            if not name in G_f.vertices():
-                                Bp.add(name)
-                            G_f.add_dep(name, revdep)
+                if name in available_updates and not name in checked:
+                    checked.add(name)
+                    for revdep_name, revdep in packagedb.get_rev_deps(name):
+                        if installdb.has_package(
+                            revdep_name
+                        ) and not installed.satisfies(revdep):
+                            if not revdep_name in G_f.vertices():
+                                Bp.add(revdep_name)
+                            G_f.add_dep(revdep_name, revdep)
         B = Bp
     if ctx.config.get_option("debug"):
         G_f.write_graphviz(sys.stdout)
     order = G_f.topological_sort()
     order.reverse()
+    pisi.resolver.cache_order(key, order)
     return G_f, order
@@ -1,6 +1,7 @@
 # SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import collections
 import sys
 
 from pisi import translate as _
@@ -9,6 +10,7 @@ import pisi
 import pisi.context as ctx
 import pisi.atomicoperations as atomicoperations
 import pisi.pgraph as pgraph
+import pisi.relation
 import pisi.util as util
 import pisi.ui as ui
 import pisi.db
@@ -134,6 +136,7 @@ def plan_remove(A):
     # install / reinstall
 
     installdb = pisi.db.installdb.InstallDB()
+    installed = pisi.relation.installed_versions()
 
     G_f = pgraph.PGraph(installdb)  # construct G_f
 
@@ -152,8 +155,8 @@ def plan_remove(A):
                 # satisfied_by_any_installed_other_than is for AnyDependency
                 if (
                     installdb.has_package(rev_dep)
-                    and depinfo.satisfied_by_installed()
-                    and not depinfo.satisfied_by_any_installed_other_than(x)
+                    and installed.satisfies(depinfo)
+                    and not installed.satisfies_other_than(depinfo, x)
                 ):
                     if not rev_dep in G_f.vertices():
                         Bp.add(rev_dep)
@@ -165,24 +168,35 @@ def plan_remove(A):
     return G_f, order
 
 
-revdep_owner = None
+def find_orphans(removing=()):
+    """
+    Find the automatically installed packages which are no longer needed.
 
+    A package is needed when it can be reached over runtime dependencies from
+    a package which is neither automatically installed nor being removed.
+    Those are walked once, so shared dependencies are only visited once.
 
-def revdep_from_hell(idb, orphans, order, pkgname):
-    """
-    Evil in a box.
+    Returns a dict mapping every installed automatically installed package
+    to the package keeping it installed, or None for orphans.
     """
+    idb = pisi.db.installdb.InstallDB()
+    installed = set(idb.list_installed())
+    auto = installed.intersection(idb.list_auto_installed())
 
-    global revdep_owner
+    owners = {}
+    queue = collections.deque()
+    for name in sorted(installed - auto - set(removing)):
+        owners[name] = name
+        queue.append(name)
 
-    revdeps = idb.get_rev_deps(pkgname)
-    for name, rdep in revdeps:
-        if name not in orphans and name not in order:
-            revdep_owner = name
-            return False
-        if not revdep_from_hell(idb, orphans, order, name):
-            return False
-    return True
+    while queue:
+        name = queue.popleft()
+        for dep in idb.get_package_record(name).dependencies:
+            if dep in installed and dep not in owners:
+                owners[dep] = owners[name]
+                queue.append(dep)
+
+    return dict((name, owners.get(name)) for name in auto)
 
 
 def plan_autoremove(name):
@@ -194,46 +208,22 @@ def plan_autoremove(name):
     that are still in use by other packages not in this list.
     """
     idb = pisi.db.installdb.InstallDB()
-    orphans = idb.list_auto_installed()
     pg, pkgs = plan_remove(name)
-    order = pg.topological_sort()
-
-    murderficate = set()
-
-    # Build a first-leaf set of orphaned removals
-    for pkgID in pkgs:
-        pkg = idb.get_package(pkgID)
-        for runtimeDep in pkg.runtimeDependencies():
-            depName = runtimeDep.name()
-            if depName not in orphans:
-                continue
-            if not revdep_from_hell(idb, orphans, order, depName):
-                continue
-            murderficate.add(depName)
-
-    # Ensure our removal plan is consistent here
-    murderficate.update(set(order))
-    pg, pkgs = plan_remove(murderficate)
-
-    newSet = set(pkgs)
-
-    # Now for everyone we're removing, did that introduce through dependencies
-    # a now-orphaned package?
-    def depMangler(item):
-        pkg = idb.get_package(item)
-        for dep in pkg.runtimeDependencies():
-            nom = dep.name()
-            if nom in orphans and nom not in newSet:
-                if revdep_from_hell(idb, orphans, pkgs, nom):
-                    newSet.add(nom)
-                    depMangler(nom)
-
-    # Blast the whole pending list through the mangler
-    for item in pkgs:
-        depMangler(item)
+    orphans = find_orphans(pkgs)
+
+    # Follow the dependencies of the removed packages to the orphans they
+    # leave behind, anything else reached is still needed
+    removal = set(pkgs)
+    queue = collections.deque(removal)
+    while queue:
+        item = queue.popleft()
+        for dep in idb.get_package_record(item).dependencies:
+            if dep in orphans and orphans[dep] is None and dep not in removal:
+                removal.add(dep)
+                queue.append(dep)
 
     # Return the consistently ordered graph
-    return plan_remove(newSet)
+    return plan_remove(removal)
 
 
 def plan_autoremove_all():
@@ -244,37 +234,15 @@ def plan_autoremove_all():
     This will not remove any package with a dependency outside the orphan
     set.
     """
-    idb = pisi.db.installdb.InstallDB()
-    orphans = idb.list_auto_installed()
-
-    murderficate = set()
-    for pkgID in orphans:
-        if not idb.has_package(pkgID):
-            continue
-        if not revdep_from_hell(idb, orphans, murderficate, pkgID):
-            continue
-        murderficate.add(pkgID)
-
-    return plan_remove(murderficate)
+    orphans = find_orphans()
+    return plan_remove(set(x for x, owner in orphans.items() if owner is None))
 
 
 def list_orphans():
     """
     Helper function to return a list of potential orphans and parents
     """
-    idb = pisi.db.installdb.InstallDB()
-    orphans = idb.list_auto_installed()
-    global revdep_owner
-
-    ret = dict()
-    for pkgID in orphans:
-        if not idb.has_package(pkgID):
-            continue
-        if not revdep_from_hell(idb, orphans, list(ret.keys()), pkgID):
-            ret[pkgID] = revdep_owner
-            continue
-        ret[pkgID] = None
-    return ret
+    return find_orphans()
 
 
 def remove_conflicting_packages(conflicts):
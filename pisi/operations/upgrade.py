@@ -11,9 +11,12 @@ import pisi.context as ctx
 import pisi.pgraph as pgraph
 import pisi.atomicoperations as atomicoperations
 import pisi.operations as operations
+import pisi.operations.download
 import pisi.util as util
 import pisi.db
 import pisi.blacklist
+import pisi.relation
+import pisi.resolver
 
 
 def check_update_actions(packages):
@@ -189,18 +192,13 @@ def upgrade(A=[], repo=None):
         conflicts = operations.helper.check_conflicts(order, packagedb)
 
     automatic = operations.helper.extract_automatic(A, order)
-    paths = []
-    for x in order:
-        ctx.ui.info(
-            util.colorize(
-                _("Downloading %d / %d") % (order.index(x) + 1, len(order)), "yellow"
-            )
-        )
-        install_op = atomicoperations.Install.from_name(x)
-        paths.append(install_op.package_fname)
+    ctx.ui.info(util.colorize(_("Downloading %d package(s)") % len(order), "yellow"))
+    downloads = operations.download.Downloader(order)
 
     # fetch to be upgraded packages but do not install them.
     if ctx.get_option("fetch_only"):
+        for x in downloads:
+            pass
         return
 
     if conflicts:
@@ -209,10 +207,11 @@ def upgrade(A=[], repo=None):
     operations.remove.remove_obsoleted_packages()
 
     try:
-        for path in paths:
+        # Packages are installed in order as soon as they are downloaded
+        for index, (name, path) in enumerate(downloads):
             ctx.ui.info(
                 util.colorize(
-                    _("Installing %d / %d") % (paths.index(path) + 1, len(paths)),
+                    _("Installing %d / %d") % (index + 1, len(order)),
                     "yellow",
                 )
             )
@@ -231,6 +230,15 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
     # try to construct a pisi graph of packages to
     # install / reinstall
 
+    # Of replaces, only the replaced packages it adds to A change the plan
+    replaced = None
+    if replaces is not None:
+        replaced = tuple(sorted(set(pisi.util.flatten_list(list(replaces.values())))))
+    key = ("upgrade", tuple(sorted(A)), force_replaced, replaced)
+    order = pisi.resolver.cached_order(key)
+    if order is not None:
+        return None, order
+
     packagedb = pisi.db.packagedb.PackageDB()
 
     G_f = pgraph.PGraph(packagedb)  # construct G_f
@@ -254,24 +262,30 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
 
     installdb = pisi.db.installdb.InstallDB()
 
+    # Versions to check the dependencies against, built once for the plan
+    installed = pisi.relation.installed_versions()
+    available = pisi.relation.repo_versions()
+
     def add_runtime_deps(pkg, Bp):
-        for dep in pkg.runtimeDependencies():
+        for dep in pisi.resolver.runtime_dependencies(pkg):
             # add packages that can be upgraded
-            if installdb.has_package(dep.package) and dep.satisfied_by_installed():
+            if installed.satisfies(dep):
                 continue
 
-            if dep.satisfied_by_repo():
-                if not dep.package in G_f.vertices():
-                    Bp.add(str(dep.package))
+            if available.satisfies(dep):
+                name = available.package_name(dep)
+                if not name in G_f.vertices():
+                    Bp.add(name)
 
                 # Always add the dependency info although the dependant
                 # package is already a member of this graph. Upgrade order
                 # might change if the dependency info differs from the
                 # previous ones.
-                G_f.add_dep(pkg.name, dep)
+                G_f.add_plain_dep(pkg.name, name)
             else:
                 ctx.ui.error(
-                    _("Dependency %s of %s cannot be satisfied") % (dep, pkg.name)
+                    _("Dependency %s of %s cannot be satisfied")
+                    % (pisi.resolver.relation_str(dep), pkg.name)
                 )
                 raise Exception(_("Upgrade is not possible."))
 
@@ -282,30 +296,25 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
         does not conflict with the new version of A, add A to the upgrade list.
         """
         for conflict in pkg.conflicts:
-            if conflict.package in G_f.vertices():
+            name = conflict[0]
+            if name in G_f.vertices():
                 # Conflicting package is already in the upgrade list.
                 continue
 
-            if not pisi.conflict.installed_package_conflicts(conflict):
+            if not installed.satisfies(conflict):
                 # Conflicting package is not installed.
                 # No need to deal with it.
                 continue
 
-            if not packagedb.has_package(conflict.package):
-                # Conflicting package is not available in repo.
-                # Installed package will be removed.
-                continue
-
-            new_pkg = packagedb.get_package(conflict.package)
-            if conflict.satisfies_relation(new_pkg.version, new_pkg.release):
-                # Package still conflicts with the repo package.
-                # Installed package will be removed.
+            if available.satisfies(conflict) or not packagedb.has_package(name):
+                # Package still conflicts with the repo package, or it is
+                # not available in repo. Installed package will be removed.
                 continue
 
             # Upgrading the package will resolve conflict.
             # Add it to the upgrade list.
-            Bp.add(conflict.package)
-            G_f.add_package(conflict.package)
+            Bp.add(name)
+            G_f.add_package(name)
 
     def add_broken_revdeps(pkg, Bp):
         # Search reverse dependencies to see if anything
@@ -313,7 +322,7 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
         rev_deps = installdb.get_rev_deps(pkg.name)
         for rev_dep, depinfo in rev_deps:
             # add only installed but unsatisfied reverse dependencies
-            if rev_dep in G_f.vertices() or depinfo.satisfied_by_repo():
+            if rev_dep in G_f.vertices() or available.satisfies(depinfo):
                 continue
 
             if is_upgradable(rev_dep):
@@ -324,7 +333,8 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
         # Search for reverse dependency update needs of to be upgraded packages
         # check only the installed ones.
         version, release, build = installdb.get_version(pkg.name)
-        actions = pkg.get_update_actions(release)
+        # Update actions are only in the full package history
+        actions = packagedb.get_package(pkg.name).get_update_actions(release)
 
         packages = actions.get("reverseDependencyUpdate")
         if packages:
@@ -340,7 +350,7 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
         Bp = set()
 
         for x in A:
-            pkg = packagedb.get_package(x)
+            pkg = packagedb.get_package_record(x)
 
             add_runtime_deps(pkg, Bp)
             add_resolvable_conflicts(pkg, Bp)
@@ -356,6 +366,7 @@ def plan_upgrade(A, force_replaced=True, replaces=None):
 
     order = G_f.topological_sort()
     order.reverse()
+    pisi.resolver.cache_order(key, order)
     return G_f, order
 
 
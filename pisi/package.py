@@ -170,11 +170,13 @@ class Package:
             return
 
         archive_file = self.impl.open(archive_name)
+        stored = self.impl.stored_range(archive_name)
         tar = archive.ArchiveTar(
             fileobj=archive_file,
             arch_type=archive_format,
             no_same_permissions=False,
             no_same_owner=False,
+            stored_in=stored and (self.filepath,) + stored,
         )
 
         return tar
@@ -285,11 +287,19 @@ class Package:
         return os.path.join(self.pkg_dir(), ctx.const.comar_dir)
 
     @staticmethod
-    def is_cached(packagefn):
+    def is_cached(packagefn, sha1sum=None):
+        """Return the local path of a package if it is available.
+
+        With sha1sum given, the package is only returned if it matches the
+        hash. The hash stored by the fetcher is used if the file has not
+        changed since it was downloaded."""
         url = pisi.uri.URI(packagefn)
         filepath = packagefn
         if url.is_remote_file():
             filepath = os.path.join(ctx.config.cached_packages_dir(), url.filename())
-            return os.path.exists(filepath) and filepath
-        else:
-            return filepath
+            if not os.path.exists(filepath):
+                return False
+
+        if sha1sum and util.cached_sha1_file(filepath) != sha1sum:
+            return False
+        return filepath
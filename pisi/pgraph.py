@@ -3,44 +3,32 @@
 
 """eopkg package relation graph that represents the state of packagedb"""
 
-from . import graph
+from . import resolver
 
-# Cache the results from packagedb queries in a graph
 
-
-class PGraph(graph.Digraph):
+class PGraph(resolver.Graph):
     def __init__(self, packagedb):
         super(PGraph, self).__init__()
         self.packagedb = packagedb
 
+    def package_data(self, name):
+        # Only needed to label the graphviz output, use the pre-decoded
+        # records if the database has them
+        if hasattr(self.packagedb, "get_package_record"):
+            pkg = self.packagedb.get_package_record(name)
+        else:
+            pkg = self.packagedb.get_package(name)
+        return (pkg.version, pkg.release)
+
     def add_package(self, pkg):
-        pkg1 = self.packagedb.get_package(pkg)
-        self.add_vertex(str(pkg), (pkg1.version, pkg1.release))
+        return super(PGraph, self).add_package(str(pkg))
 
     def add_plain_dep(self, pkg1name, pkg2name):
-        pkg1data = None
-        if not pkg1name in self.vertices():
-            pkg1 = self.packagedb.get_package(pkg1name)
-            pkg1data = (pkg1.version, pkg1.release)
-        pkg2data = None
-        if not pkg2name in self.vertices():
-            pkg2 = self.packagedb.get_package(pkg2name)
-            pkg2data = (pkg2.version, pkg2.release)
-        self.add_edge(str(pkg1name), str(pkg2name), ("d", None), pkg1data, pkg2data)
+        self.add_dependency(str(pkg1name), str(pkg2name))
 
     def add_dep(self, pkg, depinfo):
-        pkg1data = None
-        if not pkg in self.vertices():
-            pkg1 = self.packagedb.get_package(pkg)
-            pkg1data = (pkg1.version, pkg1.release)
-        pkg2data = None
-        if not depinfo.package in self.vertices():
-            pkg2 = self.packagedb.get_package(depinfo.package)
-            pkg2data = (pkg2.version, pkg2.release)
-        self.add_edge(
-            str(pkg), str(depinfo.package), ("d", depinfo), pkg1data, pkg2data
-        )
+        self.add_dependency(str(pkg), str(depinfo.package))
 
     def write_graphviz_vlabel(self, f, u):
-        (v, r) = self.vertex_data(u)
+        (v, r) = self.package_data(u)
         f.write('[ label = "' + str(u) + "(" + str(v) + "," + str(r) + ')" ]')
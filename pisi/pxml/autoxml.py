@@ -15,8 +15,6 @@ import locale
 import types
 import sys
 import io
-import inspect
-import re
 
 from pisi import translate as _
 
@@ -286,19 +284,9 @@ class autoxml(oo.autosuper, oo.autoprop):
         errorss = []
         formatters = []
 
-        # FIXME: What is this? Remove this crap and try to fix autoxml, if can not be fixed then
-        # really throw whole autoxml to junk. But not this.
-
-        # read declaration order from source
-        # code contributed by bahadir kandemir
-        try:
-            fn = re.compile(r"\s*([tas]_[a-zA-Z]+).*").findall
-
-            inspect.linecache.clearcache()
-            lines = list(filter(fn, inspect.getsourcelines(cls)[0]))
-            decl_order = [x.split()[0] for x in lines]
-        except IOError:
-            decl_order = list(dict.keys())
+        # The class namespace keeps the declaration order of the members,
+        # there is no need to read it from the source
+        decl_order = list(dict.keys())
 
         # there should be at most one str member, and it should be
         # the first to process
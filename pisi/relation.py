@@ -3,10 +3,64 @@
 
 import pisi
 import pisi.version
-import pisi.db
 import pisi.pxml.autoxml as autoxml
 
 
+def satisfies(relation, version, release):
+    """Check a relation tuple against the given version and release.
+
+    Relation tuples are (package, version, versionFrom, versionTo, release,
+    releaseFrom, releaseTo), as stored in the PackageDB records, optionally
+    followed by the dependency type."""
+    (
+        package,
+        rel_version,
+        versionFrom,
+        versionTo,
+        rel_release,
+        releaseFrom,
+        releaseTo,
+    ) = relation[:7]
+
+    if rel_version and version != rel_version:
+        return False
+    elif versionFrom or versionTo:
+        v = pisi.version.make_version(version)
+
+        if versionFrom and v < pisi.version.make_version(versionFrom):
+            return False
+
+        if versionTo and v > pisi.version.make_version(versionTo):
+            return False
+
+    if rel_release and release != rel_release:
+        return False
+    elif releaseFrom or releaseTo:
+        r = int(release)
+
+        if releaseFrom and r < int(releaseFrom):
+            return False
+
+        if releaseTo and r > int(releaseTo):
+            return False
+
+    return True
+
+
+def relation_tuple(relation):
+    """Return the relation tuple of a Relation object"""
+    return (
+        relation.package,
+        relation.version,
+        relation.versionFrom,
+        relation.versionTo,
+        relation.release,
+        relation.releaseFrom,
+        relation.releaseTo,
+        getattr(relation, "type", None),
+    )
+
+
 class Relation(metaclass=autoxml.autoxml):
     s_Package = [autoxml.String, autoxml.MANDATORY]
     a_version = [autoxml.String, autoxml.OPTIONAL]
@@ -17,32 +71,125 @@ class Relation(metaclass=autoxml.autoxml):
     a_releaseTo = [autoxml.String, autoxml.OPTIONAL]
 
     def satisfies_relation(self, version, release):
-        if self.version and version != self.version:
-            return False
-        else:
-            v = pisi.version.make_version(version)
+        return satisfies(relation_tuple(self), version, release)
 
-            if self.versionFrom and v < pisi.version.make_version(self.versionFrom):
-                return False
 
-            if self.versionTo and v > pisi.version.make_version(self.versionTo):
-                return False
+class VersionMap(object):
+    """Versions of a set of packages, to check many relations at once.
 
-        if self.release and release != self.release:
+    versions maps package names to their (version, release) strings, and
+    providers maps ("pkgconfig" or "pkgconfig32", name) pairs to the names
+    of the packages providing them. With a load function, names missing
+    from versions are looked up with it and remembered. Version strings are
+    parsed through the version cache, so each one is parsed once however
+    many relations use it."""
+
+    def __init__(self, versions, providers=None, load=None):
+        self.versions = versions
+        self.providers = providers or {}
+        self.load = load
+
+    def lookup(self, name, type=None):
+        """Return the (version, release) satisfying a name of the given type"""
+        if type in ("pkgconfig", "pkgconfig32"):
+            name = self.providers.get((type, name))
+            if name is None:
+                return None
+
+        try:
+            return self.versions[name]
+        except KeyError:
+            if self.load is None:
+                return None
+            found = self.versions[name] = self.load(name)
+            return found
+
+    def satisfies(self, relation):
+        """Check a relation tuple, Relation or AnyDependency"""
+        if hasattr(relation, "dependencies"):
+            return any(self.satisfies(x) for x in relation.dependencies)
+
+        if not isinstance(relation, tuple):
+            relation = relation_tuple(relation)
+        elif isinstance(relation[0], tuple):
+            # The alternatives of an AnyDependency
+            return any(self.satisfies(x) for x in relation)
+
+        found = self.lookup(relation[0], relation[7] if len(relation) > 7 else None)
+        return found is not None and satisfies(relation, *found)
+
+    def package_name(self, relation):
+        """Return the name of the package satisfying a relation tuple.
+
+        That is the provider of pkgconfig dependencies, and the first
+        satisfied alternative of AnyDependency tuples."""
+        if isinstance(relation[0], tuple):
+            for alternative in relation:
+                if self.satisfies(alternative):
+                    return self.package_name(alternative)
+            relation = relation[0]
+
+        type = relation[7] if len(relation) > 7 else None
+        if type in ("pkgconfig", "pkgconfig32"):
+            return self.providers.get((type, relation[0]), relation[0])
+        return relation[0]
+
+    def satisfies_other_than(self, relation, package):
+        """Check if an AnyDependency is satisfied by another alternative"""
+        if not hasattr(relation, "dependencies"):
             return False
-        else:
-            r = int(release)
+        return any(
+            self.satisfies(x) for x in relation.dependencies if x.package != package
+        )
+
+    def unsatisfied(self, relations):
+        """Return the relations which are not satisfied"""
+        return [x for x in relations if not self.satisfies(x)]
+
+
+def installed_versions():
+    """Return the VersionMap of the installed packages"""
+    import pisi.db
+
+    installdb = pisi.db.installdb.InstallDB()
+    versions = {}
+    providers = {}
+    for name in installdb.list_installed():
+        record = installdb.get_package_record(name)
+        versions[name] = (record.version, record.release)
+        for pkgconfig in record.providesPkgConfig:
+            providers.setdefault(("pkgconfig", pkgconfig), name)
+        for pkgconfig in record.providesPkgConfig32:
+            providers.setdefault(("pkgconfig32", pkgconfig), name)
+    return VersionMap(versions, providers)
+
+
+def repo_versions():
+    """Return the VersionMap of the packages in the repositories.
 
-            if self.releaseFrom and r < int(self.releaseFrom):
-                return False
+    Repository packages are only looked up when a relation names them."""
+    import pisi.db
 
-            if self.releaseTo and r > int(self.releaseTo):
-                return False
+    packagedb = pisi.db.packagedb.PackageDB()
 
-        return True
+    def load(name):
+        if not packagedb.has_package(name):
+            return None
+        record = packagedb.get_package_record(name)
+        return record.version, record.release
+
+    providers = {}
+    pkgconfigs, pkgconfigs32 = packagedb.get_pkgconfig_providers()
+    for pkgconfig, name in pkgconfigs.items():
+        providers[("pkgconfig", pkgconfig)] = name
+    for pkgconfig, name in pkgconfigs32.items():
+        providers[("pkgconfig32", pkgconfig)] = name
+    return VersionMap({}, providers, load)
 
 
 def installed_package_satisfies(relation):
+    import pisi.db
+
     installdb = pisi.db.installdb.InstallDB()
     pkg_name = relation.package
     if hasattr(relation, "type") and relation.type == "pkgconfig":
@@ -60,5 +207,5 @@ def installed_package_satisfies(relation):
     if not installdb.has_package(pkg_name):
         return False
     else:
-        pkg = installdb.get_package(pkg_name)
+        pkg = installdb.get_package_record(pkg_name)
         return relation.satisfies_relation(pkg.version, pkg.release)
@@ -0,0 +1,259 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Dependency resolution over integer package ids.
+
+Packages get consecutive integer ids as they are added to a Graph, and their
+dependencies are kept in adjacency lists of ids. Orders come from the
+strongly connected components of the graph, found with an iterative form of
+Tarjan's algorithm, so deep dependency chains do not hit the recursion limit
+and dependency cycles are reported instead of stopping the resolution.
+
+The orders of the plans made on a system are cached by a hash of the
+repository and installed package state, planning the same operation again
+on an unchanged system reuses the previous result.
+"""
+
+import hashlib
+import os
+import pickle
+
+from pisi import translate as _
+
+import pisi
+import pisi.context as ctx
+import pisi.db
+import pisi.dependency
+import pisi.util as util
+
+
+class Graph(object):
+    """Dependency graph of packages.
+
+    An edge from a package to another one means the former depends on the
+    latter, which has to be installed first."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.adj = []
+        self.edges = set()
+
+    def add_package(self, name):
+        """Add a package if it is not in the graph yet and return its id"""
+        try:
+            return self.ids[name]
+        except KeyError:
+            pkg_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.adj.append([])
+            return pkg_id
+
+    def add_dependency(self, name, dependency):
+        u = self.add_package(name)
+        v = self.add_package(dependency)
+        if (u, v) not in self.edges:
+            self.edges.add((u, v))
+            self.adj[u].append(v)
+
+    def vertices(self):
+        return self.ids
+
+    def components(self):
+        """Return the strongly connected components as lists of ids.
+
+        A component comes after all of the components it depends on."""
+        adj = self.adj
+        index = [-1] * len(adj)
+        low = [0] * len(adj)
+        on_stack = [False] * len(adj)
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(len(adj)):
+            if index[root] != -1:
+                continue
+
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, 0)]
+
+            while work:
+                v, i = work[-1]
+                if i < len(adj[v]):
+                    work[-1] = (v, i + 1)
+                    w = adj[v][i]
+                    if index[w] == -1:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append((w, 0))
+                    elif on_stack[w] and index[w] < low[v]:
+                        low[v] = index[w]
+                    continue
+
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+
+        return components
+
+    def cycles(self):
+        """Return the lists of packages depending on each other"""
+        return [
+            sorted(self.names[x] for x in component)
+            for component in self.components()
+            if len(component) > 1
+        ]
+
+    def order(self):
+        """Return the packages, each one after its dependencies.
+
+        The packages of a dependency cycle can not be ordered, they are
+        reported and kept next to each other."""
+        order = []
+        for component in self.components():
+            if len(component) > 1:
+                ctx.ui.warning(
+                    _("Dependency cycle between packages: %s")
+                    % ", ".join(sorted(self.names[x] for x in component))
+                )
+            order.extend(self.names[x] for x in component)
+        return order
+
+    def topological_sort(self):
+        """Return the packages, each one before its dependencies"""
+        order = self.order()
+        order.reverse()
+        return order
+
+    def id_str(self, u):
+        # Graph format only accepts underscores as key values
+        return u.replace("-", "_").replace("+", "_")
+
+    def write_graphviz(self, f):
+        f.write("digraph G {\n")
+        for u in self.names:
+            f.write(self.id_str(u))
+            self.write_graphviz_vlabel(f, u)
+            f.write(";\n")
+        f.write("\n")
+        for u, deps in zip(self.names, self.adj):
+            for v in deps:
+                f.write(self.id_str(u) + " -> " + self.id_str(self.names[v]))
+                f.write(";\n")
+        f.write("\n")
+        f.write("}\n")
+
+    def write_graphviz_vlabel(self, f, u):
+        pass
+
+
+def relation_str(relation):
+    """Describe a relation tuple or AnyDependency tuple as str(Dependency)"""
+    if isinstance(relation[0], tuple):
+        return "{%s}" % _(" or ").join(relation_str(x) for x in relation)
+
+    dep = pisi.dependency.Dependency()
+    (
+        dep.package,
+        dep.version,
+        dep.versionFrom,
+        dep.versionTo,
+        dep.release,
+        dep.releaseFrom,
+        dep.releaseTo,
+    ) = relation[:7]
+    dep.type = relation[7] if len(relation) > 7 else None
+    return str(dep)
+
+
+def runtime_dependencies(record):
+    """Return the runtime dependencies of a PackageRecord as relation tuples.
+
+    AnyDependency entries are tuples of their alternatives, and component
+    dependencies are expanded to the packages of the component."""
+    deps = list(record.dependencies)
+    deps.extend(record.anyDependencies)
+
+    if record.componentDependencies:
+        componentdb = pisi.db.componentdb.ComponentDB()
+        for component in record.componentDependencies:
+            for name in componentdb.get_component(component).packages:
+                deps.append((name, None, None, None, None, None, None, None))
+
+    return deps
+
+
+def __plans_file():
+    return util.join_path(ctx.config.cache_root_dir(), "plans.cache")
+
+
+def state_hash():
+    """Return a hash of the repository and installed package state"""
+    try:
+        installed = os.stat(ctx.config.packages_dir()).st_mtime_ns
+    except OSError:
+        installed = None
+
+    state = (installed, pisi.db.packagedb.PackageDB().state())
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+def __load_plans():
+    try:
+        with open(__plans_file(), "rb") as f:
+            return pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+        return None, {}
+
+
+def cached_order(key):
+    """Return the order planned for key on the current state, or None"""
+    # Planning again writes out the dependency graph in debug mode
+    if ctx.config.get_option("debug"):
+        return None
+
+    state, plans = __load_plans()
+    if state != state_hash():
+        return None
+
+    order = plans.get(key)
+    if order is not None:
+        ctx.ui.debug("Reusing the cached plan of %s" % (key,))
+        return list(order)
+    return None
+
+
+def cache_order(key, order):
+    """Remember the order planned for key on the current state"""
+    if not os.access(ctx.config.cache_root_dir(), os.W_OK):
+        return
+
+    current = state_hash()
+    state, plans = __load_plans()
+    if state != current:
+        plans = {}
+    plans[key] = list(order)
+
+    plans_file = __plans_file()
+    tmp = plans_file + ctx.const.temporary_suffix
+    with open(tmp, "wb") as f:
+        pickle.dump((current, plans), f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, plans_file)
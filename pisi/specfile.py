@@ -23,7 +23,6 @@ import pisi.conflict
 import pisi.component as component
 import pisi.group as group
 import pisi.util as util
-import pisi.db
 
 
 class Error(pisi.Error):
@@ -278,6 +277,8 @@ class Package(metaclass=autoxml.autoxml):
     debug_package = False
 
     def runtimeDependencies(self):
+        import pisi.db
+
         componentdb = pisi.db.componentdb.ComponentDB()
         deps = self.packageDependencies + self.packageAnyDependencies
 
@@ -373,6 +374,8 @@ class Package(metaclass=autoxml.autoxml):
         """
 
         if old_release is None:
+            import pisi.db
+
             installdb = pisi.db.installdb.InstallDB()
             if not installdb.has_package(self.name):
                 return {}
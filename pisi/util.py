@@ -350,7 +350,7 @@ def check_file(_file, mode=os.F_OK):
 def ensure_dirs(path):
     """Make sure the given directory path exists."""
     if not os.path.exists(path):
-        os.makedirs(path)
+        os.makedirs(path, exist_ok=True)
 
 
 def clean_dir(path):
@@ -540,6 +540,43 @@ def sha1_file(filename):
             raise FileError(_("Cannot calculate SHA1 hash of %s") % filename)
 
 
+# The hash of a downloaded file is kept in an extended attribute of the file,
+# along with the size and mtime it was calculated for
+sha1_xattr = "user.eopkg.sha1"
+
+
+def store_sha1(filename, value):
+    """Remember the sha1 hash of a file, if the filesystem allows it."""
+    try:
+        st = os.stat(filename)
+        data = "%s %d %d" % (value, st.st_size, st.st_mtime_ns)
+        os.setxattr(filename, sha1_xattr, data.encode())
+    except OSError:
+        pass
+
+
+def stored_sha1(filename):
+    """Return the stored sha1 hash of a file, None if the file changed."""
+    try:
+        value, size, mtime = os.getxattr(filename, sha1_xattr).decode().split()
+        st = os.stat(filename)
+    except (OSError, ValueError):
+        return None
+
+    if int(size) != st.st_size or int(mtime) != st.st_mtime_ns:
+        return None
+    return value
+
+
+def cached_sha1_file(filename):
+    """Calculate sha1 hash of file, unless it is already stored."""
+    value = stored_sha1(filename)
+    if value is None:
+        value = sha1_file(filename)
+        store_sha1(filename, value)
+    return value
+
+
 def sha1_data(data: str) -> str:
     """Calculate sha1 hash of the given string and return its hex representation."""
     m = hashlib.sha1()
@@ -928,7 +965,11 @@ def config_changed(config_file):
 def rmdirs(dirpath):
     if os.path.isdir(dirpath) and not os.listdir(dirpath):
         ctx.ui.debug("Removing empty dir: %s" % dirpath)
-        os.rmdir(dirpath)
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            # Filled or removed by another thread meanwhile
+            return
         rmdirs(os.path.dirname(dirpath))
 
 
@@ -37,7 +37,20 @@ def __make_version_item(v):
         return int(v[:-1]), v[-1]
 
 
+# Parsed versions by version string. Parsed versions are immutable, so the
+# same tuple is shared by every user of a version string.
+__parsed_versions = {}
+
+
 def make_version(version):
+    try:
+        return __parsed_versions[version]
+    except KeyError:
+        parsed = __parsed_versions[version] = __parse_version(version)
+        return parsed
+
+
+def __parse_version(version):
     ver, sep, suffix = version.partition("_")
     try:
         if sep:
@@ -46,9 +59,9 @@ def make_version(version):
                 for keyword, value in __keywords:
                     if suffix.startswith(keyword):
                         return (
-                            list(map(__make_version_item, ver.split("."))),
+                            tuple(map(__make_version_item, ver.split("."))),
                             value,
-                            list(
+                            tuple(
                                 map(
                                     __make_version_item,
                                     suffix[len(keyword) :].split("."),
@@ -61,12 +74,12 @@ def make_version(version):
                     ver = ""
             else:
                 return (
-                    list(map(__make_version_item, ver.split("."))),
+                    tuple(map(__make_version_item, ver.split("."))),
                     0,
-                    list(map(__make_version_item, suffix.split("."))),
+                    tuple(map(__make_version_item, suffix.split("."))),
                 )
 
-        return list(map(__make_version_item, ver.split("."))), 0, [(0, None)]
+        return tuple(map(__make_version_item, ver.split("."))), 0, ((0, None),)
 
     except ValueError:
         raise InvalidVersionError(_("Invalid version string: '%s'") % version)
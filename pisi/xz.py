@@ -0,0 +1,224 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Block parallel xz compression.
+
+The writer splits the data into blocks of BLOCK_SIZE bytes and compresses
+each one into an xz stream of its own on a pool of threads. Concatenated
+streams are a valid xz file, which xz and the lzma module read as usual.
+
+The reader finds the streams of a file from the indexes at their ends and
+decompresses them on a pool of threads, so files written by the parallel
+writer are read in parallel too. Files holding a single stream are read
+with a plain LZMAFile."""
+
+import collections
+import concurrent.futures
+import lzma
+import os
+import struct
+
+BLOCK_SIZE = 8 * 1024 * 1024
+
+HEADER_MAGIC = b"\xfd7zXZ\x00"
+FOOTER_MAGIC = b"YZ"
+
+
+def threads(value):
+    """Return the number of threads for the given setting, 0 meaning all CPUs"""
+    value = int(value or 0)
+    if value <= 0:
+        return os.cpu_count() or 1
+    return value
+
+
+class Writer(object):
+    """Write-only file object compressing into the file at path"""
+
+    def __init__(self, path, preset=9, threads=1, block_size=BLOCK_SIZE):
+        self.file = open(path, "wb")
+        self.preset = preset
+        self.block_size = block_size
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.pending = collections.deque()
+        self.max_pending = 2 * threads
+        self.buf = []
+        self.buf_size = 0
+        self.pos = 0
+
+    def __compress(self, data):
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=self.preset)
+
+    def __submit(self):
+        data = b"".join(self.buf)
+        self.buf = []
+        self.buf_size = 0
+
+        while len(self.pending) >= self.max_pending:
+            self.file.write(self.pending.popleft().result())
+        self.pending.append(self.executor.submit(self.__compress, data))
+
+    def write(self, data):
+        self.pos += len(data)
+        while data:
+            chunk = data[: self.block_size - self.buf_size]
+            data = data[len(chunk) :]
+            self.buf.append(bytes(chunk))
+            self.buf_size += len(chunk)
+            if self.buf_size == self.block_size:
+                self.__submit()
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            if self.buf_size or not self.pending:
+                self.__submit()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.file.close()
+            self.file = None
+
+
+def _varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def streams(f, offset, size):
+    """Return the (offset, size) of the xz streams in a part of a file.
+
+    None is returned if the data does not end with valid stream indexes."""
+    found = []
+    start = offset
+    pos = offset + size
+
+    try:
+        while pos > start:
+            # Stream padding
+            while pos - 4 > start and os.pread(f.fileno(), 4, pos - 4) == b"\0" * 4:
+                pos -= 4
+
+            footer = os.pread(f.fileno(), 12, pos - 12)
+            if len(footer) != 12 or footer[10:] != FOOTER_MAGIC:
+                return None
+            index_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+            index_pos = pos - 12 - index_size
+
+            index = os.pread(f.fileno(), index_size, index_pos)
+            if len(index) != index_size or index[0] != 0:
+                return None
+
+            count, i = _varint(index, 1)
+            blocks = 0
+            for x in range(count):
+                unpadded, i = _varint(index, i)
+                uncompressed, i = _varint(index, i)
+                blocks += (unpadded + 3) & ~3
+
+            stream_pos = index_pos - blocks - 12
+            if stream_pos < start:
+                return None
+            if os.pread(f.fileno(), 6, stream_pos) != HEADER_MAGIC:
+                return None
+
+            found.append((stream_pos, pos - stream_pos))
+            pos = stream_pos
+    except (OSError, IndexError, ValueError):
+        return None
+
+    found.reverse()
+    return found
+
+
+class Reader(object):
+    """Read-only file object decompressing the streams of a file in parallel.
+
+    The reader owns the file f the streams are read from and closes it.
+    Forward seeks skip data, backward seeks start over from the beginning."""
+
+    def __init__(self, f, streams, threads=1):
+        self.f = f
+        self.streams = streams
+        self.threads = threads
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.__start()
+
+    def __start(self):
+        self.next_stream = 0
+        self.pending = collections.deque()
+        self.buf = b""
+        self.buf_pos = 0
+        self.pos = 0
+
+    def __decompress(self, offset, size):
+        data = os.pread(self.f.fileno(), size, offset)
+        return lzma.decompress(data, format=lzma.FORMAT_XZ)
+
+    def __fill(self):
+        while (
+            len(self.pending) < 2 * self.threads
+            and self.next_stream < len(self.streams)
+        ):
+            stream = self.streams[self.next_stream]
+            self.next_stream += 1
+            self.pending.append(self.executor.submit(self.__decompress, *stream))
+
+        if not self.pending:
+            return False
+
+        self.buf = self.pending.popleft().result()
+        self.buf_pos = 0
+        return True
+
+    def read(self, size=-1):
+        chunks = []
+        while size < 0 or size > 0:
+            if self.buf_pos == len(self.buf) and not self.__fill():
+                break
+            end = len(self.buf) if size < 0 else self.buf_pos + size
+            chunk = self.buf[self.buf_pos : end]
+            self.buf_pos += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+            chunks.append(chunk)
+
+        data = b"".join(chunks)
+        self.pos += len(data)
+        return data
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self.pos
+        elif whence != os.SEEK_SET:
+            raise ValueError("xz.Reader only seeks from the start or position")
+
+        if pos < self.pos:
+            for future in self.pending:
+                future.cancel()
+            self.__start()
+
+        while self.pos < pos:
+            if not self.read(min(pos - self.pos, BLOCK_SIZE)):
+                break
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown()
+        self.f.close()
@@ -0,0 +1,42 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Every command defined under pisi/cli has to be in the command registry,
+as command modules are only imported through it."""
+
+import ast
+import os
+
+import pisi.cli.command as command
+
+CLI_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "pisi", "cli")
+
+
+def defined_commands():
+    """Yield the (module, names) of the command classes under pisi/cli"""
+    for filename in sorted(os.listdir(CLI_DIR)):
+        if not filename.endswith(".py"):
+            continue
+        with open(os.path.join(CLI_DIR, filename)) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.ClassDef):
+                continue
+            for stmt in node.body:
+                if isinstance(stmt, ast.Assign) and any(
+                    isinstance(x, ast.Name) and x.id == "name" for x in stmt.targets
+                ):
+                    yield filename[:-3], tuple(ast.literal_eval(stmt.value))
+
+
+def test_registry_lists_every_command():
+    defined = list(defined_commands())
+    assert defined
+    for module, names in defined:
+        assert (names, module) in command.commands, (module, names)
+
+
+def test_registry_has_no_stale_entries():
+    defined = set(defined_commands())
+    for names, module in command.commands:
+        assert (module, names) in defined, (module, names)
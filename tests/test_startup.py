@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: 2005-2011 TUBITAK/UEKAE, 2013-2017 Ikey Doherty, Solus Project
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""Import-time regression checks for the eopkg command line.
+
+Each check starts a fresh interpreter, so only the modules the command line
+itself imports are loaded. Run with "python -X importtime" for the timings."""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Modules simple commands must not pull in
+HEAVY_MODULES = (
+    "pisi.api",
+    "pisi.operations.build",
+    "pisi.actionsapi",
+    "pisi.operations.delta",
+)
+
+
+def run(code):
+    """Run code in a new interpreter and return the JSON it prints last"""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def loaded_modules(args):
+    """Return the pisi modules loaded to parse the given command line"""
+    return run(
+        """
+import json
+import sys
+
+import pisi.cli.pisicli as pisicli
+
+try:
+    pisicli.PisiCLI(%r)
+except SystemExit:
+    pass
+print(json.dumps([x for x in sys.modules if x.startswith("pisi")]))
+"""
+        % (args,)
+    )
+
+
+def assert_light(modules):
+    for name in HEAVY_MODULES:
+        loaded = [x for x in modules if x == name or x.startswith(name + ".")]
+        assert not loaded, loaded
+
+
+def test_import_cli():
+    assert_light(
+        run("import json, sys, pisi.cli.pisicli; print(json.dumps(list(sys.modules)))")
+    )
+
+
+def test_version():
+    assert_light(loaded_modules(["--version"]))
+
+
+def test_list_installed():
+    modules = loaded_modules(["li"])
+    assert "pisi.cli.listinstalled" in modules
+    assert_light(modules)
+
+
+def test_commands_reachable():
+    failed = run(
+        """
+import json
+
+import pisi.cli.command as command
+
+failed = []
+for names, module in command.commands:
+    for name in names:
+        if name and command.Command.get_command(name, args=[name]) is None:
+            failed.append(name)
+print(json.dumps(failed))
+"""
+    )
+    assert failed == []